@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Benchmark de charge de l'audio-router : nombre de réunions simultanées tenues
+en temps réel en fonction du nombre de workers (ROUTER_WORKERS).
+
+Lance un faux backend ASR (renvoie une transcription par seconde d'audio reçue),
+puis, pour chaque nombre de workers, démarre le routeur et augmente le nombre de
+bots simulés (trames PCM de 20 ms au rythme réel) tant que le p95 du délai
+audio -> transcription reste sous le seuil.
+
+Usage :
+    python3 scripts/bench_audio_router.py --workers 1 2 4 --duration 20 --step 25
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import websockets
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+ROUTER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "audio-router")
+FRAME_MS = 20
+FRAME_BYTES = 16000 * 2 * FRAME_MS // 1000
+
+# --- Faux backend ASR --------------------------------------------------------
+
+backend_app = FastAPI()
+
+
+@backend_app.get("/health")
+async def backend_health():
+    return {"status": "ok"}
+
+
+@backend_app.post("/v2/live")
+async def backend_init():
+    session_id = str(uuid.uuid4())
+    return {"id": session_id, "url": f"ws://127.0.0.1/v2/live?id={session_id}"}
+
+
+@backend_app.websocket("/v2/live")
+async def backend_ws(websocket: WebSocket, id: str = None, meeting_id: str = "0"):
+    await websocket.accept()
+    await websocket.send_json({"type": "init", "request_id": id})
+    received = 0
+    next_transcript = 32000
+    try:
+        while True:
+            message = await websocket.receive()
+            if message.get("bytes"):
+                received += len(message["bytes"])
+                while received >= next_transcript:
+                    end = next_transcript / 32000
+                    await websocket.send_json({
+                        "type": "transcript",
+                        "data": {"is_final": False, "utterance": {"text": "bench", "start": end - 1, "end": end}},
+                    })
+                    next_transcript += 32000
+            elif message.get("text") or message["type"] == "websocket.disconnect":
+                break
+    except WebSocketDisconnect:
+        pass
+
+
+# --- Bots simulés ------------------------------------------------------------
+
+async def _bot(router_url: str, duration: float, lags: list, errors: list):
+    try:
+        async with httpx.AsyncClient() as client:
+            resp = await client.post(f"{router_url}/v2/live", json={"encoding": "wav/pcm"}, timeout=30)
+            session = resp.json()
+        ws_url = f"{router_url.replace('http', 'ws', 1)}/v2/live?id={session['id']}&meeting_id=1"
+        async with websockets.connect(ws_url, max_queue=None) as ws:
+            await asyncio.wait_for(ws.recv(), timeout=30)
+            start = time.monotonic()
+            sent_at = []
+
+            async def receive():
+                async for message in ws:
+                    data = json.loads(message)
+                    if data.get("type") != "transcript":
+                        continue
+                    index = int(round(data["data"]["utterance"]["end"] * 1000 / FRAME_MS)) - 1
+                    if 0 <= index < len(sent_at):
+                        lags.append(time.monotonic() - sent_at[index])
+
+            receiver = asyncio.create_task(receive())
+            frame = bytes(FRAME_BYTES)
+            frames = int(duration * 1000 / FRAME_MS)
+            for i in range(frames):
+                # Rythme temps réel : on rattrape si la boucle prend du retard
+                delay = start + i * FRAME_MS / 1000 - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                sent_at.append(time.monotonic())
+                await ws.send(frame)
+            await asyncio.sleep(2)
+            await ws.send(json.dumps({"type": "stop_recording"}))
+            receiver.cancel()
+    except Exception as e:
+        errors.append(str(e))
+
+
+def _client_process(router_url, bots, duration, result_queue):
+    lags, errors = [], []
+
+    async def run():
+        await asyncio.gather(*[_bot(router_url, duration, lags, errors) for _ in range(bots)])
+
+    asyncio.run(run())
+    result_queue.put((lags, errors))
+
+
+def run_load(router_url: str, meetings: int, duration: float, client_procs: int):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    per_proc = [meetings // client_procs + (1 if i < meetings % client_procs else 0) for i in range(client_procs)]
+    procs = [ctx.Process(target=_client_process, args=(router_url, n, duration, queue)) for n in per_proc if n]
+    for p in procs:
+        p.start()
+    lags, errors = [], []
+    for _ in procs:
+        proc_lags, proc_errors = queue.get()
+        lags.extend(proc_lags)
+        errors.extend(proc_errors)
+    for p in procs:
+        p.join()
+    lags.sort()
+    p95 = lags[int(len(lags) * 0.95)] if lags else float("inf")
+    return p95, len(errors)
+
+
+# --- Orchestration -----------------------------------------------------------
+
+def _wait_http(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} ne répond pas")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=20, help="secondes d'audio par bot")
+    parser.add_argument("--step", type=int, default=25, help="incrément du nombre de réunions")
+    parser.add_argument("--max-meetings", type=int, default=2000)
+    parser.add_argument("--lag-slo", type=float, default=1.0, help="p95 audio -> transcription (s)")
+    parser.add_argument("--client-procs", type=int, default=4)
+    parser.add_argument("--router-port", type=int, default=18084)
+    parser.add_argument("--backend-port", type=int, default=18085)
+    args = parser.parse_args()
+
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench_audio_router:backend_app", "--port", str(args.backend_port),
+         "--workers", str(os.cpu_count() or 1), "--log-level", "warning",
+         "--app-dir", os.path.dirname(os.path.abspath(__file__))]
+    )
+    results = []
+    try:
+        _wait_http(f"http://127.0.0.1:{args.backend_port}/health")
+        for workers in args.workers:
+            env = dict(
+                os.environ,
+                ROUTER_WORKERS=str(workers),
+                ROUTER_PORT=str(args.router_port),
+                ASR_BACKENDS="whisper",
+                WHISPER_BACKEND_URL=f"http://127.0.0.1:{args.backend_port}",
+            )
+            router = subprocess.Popen([sys.executable, "serve.py"], cwd=ROUTER_DIR, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            router_url = f"http://127.0.0.1:{args.router_port}"
+            try:
+                _wait_http(f"{router_url}/health")
+                sustained = 0
+                meetings = args.step
+                while meetings <= args.max_meetings:
+                    p95, errors = run_load(router_url, meetings, args.duration, args.client_procs)
+                    print(f"  workers={workers} meetings={meetings}: p95={p95:.3f}s errors={errors}")
+                    if errors or p95 > args.lag_slo:
+                        break
+                    sustained = meetings
+                    meetings += args.step
+                results.append((workers, sustained))
+            finally:
+                router.terminate()
+                router.wait()
+    finally:
+        backend.terminate()
+        backend.wait()
+
+    print("\nworkers | réunions tenues | réunions/worker")
+    for workers, sustained in results:
+        print(f"{workers:7d} | {sustained:15d} | {sustained / workers:15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import ctypes
+
+SAMPLE_RATE = 16000
+CHANNELS = 1
+# Longest Opus packet is 120 ms
+MAX_FRAME_SAMPLES = SAMPLE_RATE * 120 // 1000
+
+
+def load_opus():
+    """opuslib's decoder API, imported on first use so PCM-only hosts need no libopus.
+
+    Raises RuntimeError if opuslib or the libopus shared library is missing.
+    """
+    try:
+        from opuslib.api import decoder as opus_decoder
+    except Exception as e:
+        # opuslib raises a bare Exception when it cannot find libopus
+        raise RuntimeError(f"Opus ingest is unavailable: libopus could not be loaded ({e})") from e
+    return opus_decoder
+
+
+class OpusDecoder:
+    """Per-session Opus -> PCM 16-bit decoder.
+
+    Decodes into one preallocated ctypes buffer, so the only allocation per
+    packet is the PCM bytes object that is then shared by every backend.
+    """
+
+    def __init__(self):
+        self._api = load_opus()
+        self._state = self._api.create_state(SAMPLE_RATE, CHANNELS)
+        self._pcm = (ctypes.c_int16 * (MAX_FRAME_SAMPLES * CHANNELS))()
+        self._pcm_pointer = ctypes.cast(self._pcm, ctypes.POINTER(ctypes.c_int16))
+        self._pcm_view = memoryview(self._pcm).cast("B")
+
+    def decode(self, packet: bytes) -> bytes:
+        samples = self._api.libopus_decode(
+            self._state, packet, len(packet), self._pcm_pointer, MAX_FRAME_SAMPLES, 0
+        )
+        if samples < 0:
+            raise ValueError(f"Opus decode error {samples}")
+        return bytes(self._pcm_view[:samples * CHANNELS * 2])
+
+    def close(self):
+        if self._state is not None:
+            self._api.destroy(self._state)
+            self._state = None
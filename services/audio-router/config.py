@@ -13,7 +13,87 @@ VOXTRAL_BACKEND_URL = os.getenv(
     "http://voxtral-streaming-proxy:8086"
 )
 
+# Optional comma-separated replica lists; fall back to the single URL above
+WHISPER_BACKEND_URLS = os.getenv("WHISPER_BACKEND_URLS", WHISPER_BACKEND_URL).split(",")
+VOXTRAL_BACKEND_URLS = os.getenv("VOXTRAL_BACKEND_URLS", VOXTRAL_BACKEND_URL).split(",")
+
 BACKEND_URLS = {
-    "whisper": WHISPER_BACKEND_URL,
-    "voxtral": VOXTRAL_BACKEND_URL,
+    "whisper": [url.strip() for url in WHISPER_BACKEND_URLS if url.strip()],
+    "voxtral": [url.strip() for url in VOXTRAL_BACKEND_URLS if url.strip()],
 }
+
+# Replica health polling (GET /health on each replica)
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))  # seconds
+REPLICA_HEALTH_TIMEOUT = float(os.getenv("REPLICA_HEALTH_TIMEOUT", "2"))  # seconds
+REPLICA_FAILURE_THRESHOLD = int(os.getenv("REPLICA_FAILURE_THRESHOLD", "2"))  # consecutive failures before ejection
+
+# Failover: promote another backend when the primary dies or stops returning transcripts
+FAILOVER_LATENCY_THRESHOLD = float(os.getenv("FAILOVER_LATENCY_THRESHOLD", "15"))  # seconds
+FAILOVER_CHECK_INTERVAL = float(os.getenv("FAILOVER_CHECK_INTERVAL", "1"))  # seconds
+FAILOVER_RECONNECT = os.getenv("FAILOVER_RECONNECT", "true").lower() == "true"
+FAILOVER_RECONNECT_ATTEMPTS = int(os.getenv("FAILOVER_RECONNECT_ATTEMPTS", "5"))
+
+# Recent audio kept per session to replay into a reconnected backend
+AUDIO_REPLAY_BUFFER_SECONDS = float(os.getenv("AUDIO_REPLAY_BUFFER_SECONDS", "30"))
+AUDIO_BYTES_PER_SECOND = 16000 * 2  # PCM 16-bit mono @ 16kHz
+
+# Optional recording of each session's audio (segmented, compressed files)
+RECORDING_ENABLED = os.getenv("RECORDING_ENABLED", "false").lower() == "true"
+RECORDING_DIR = os.getenv("RECORDING_DIR", "/recordings")
+RECORDING_FORMAT = os.getenv("RECORDING_FORMAT", "flac").lower()  # flac | opus
+RECORDING_SEGMENT_SECONDS = int(os.getenv("RECORDING_SEGMENT_SECONDS", "300"))
+RECORDING_QUEUE_MAX_CHUNKS = int(os.getenv("RECORDING_QUEUE_MAX_CHUNKS", "20000"))  # shared by all sessions
+RECORDING_AUTO_SUBMIT = os.getenv("RECORDING_AUTO_SUBMIT", "false").lower() == "true"
+
+# whisper-backend batch queue, used to re-transcribe finished recordings
+WHISPER_BATCH_URL = os.getenv("WHISPER_BATCH_URL", "http://whisper-backend:5000")
+RECORDING_CALLBACK_URL = os.getenv(
+    "RECORDING_CALLBACK_URL",
+    "http://bot-manager:8080/bots/internal/transcript"
+)
+
+# Backends that accept Opus frames directly; others get the router's decoded PCM.
+# Reserved: no proxy in this repo accepts Opus yet (they take PCM only and reject
+# other encodings on /v2/mux), so leave it empty until one does.
+OPUS_NATIVE_BACKENDS = [
+    name.strip() for name in os.getenv("OPUS_NATIVE_BACKENDS", "").split(",") if name.strip()
+]
+
+# Forward backend transcript frames to the bot unchanged instead of parse + re-serialize
+ROUTER_RAW_PASSTHROUGH = os.getenv("ROUTER_RAW_PASSTHROUGH", "true").lower() == "true"
+
+# How much audio-arrival history each session keeps to compute transcript lag
+METRICS_TIMELINE_SECONDS = float(os.getenv("METRICS_TIMELINE_SECONDS", "300"))
+
+# Sampled shadow routing for non-primary backends. JSON object per backend, e.g.
+# {"voxtral": {"percent": 10, "meeting_ids": ["42"], "user_ids": ["7"], "windows": ["09:00-12:00"]}}
+# A session is shadowed if any criterion matches (windows are UTC). Backends without a rule are always used.
+SHADOW_RULES = os.getenv("SHADOW_RULES", "{}")  # parsed and validated by sampling.py
+SHADOW_LOG_PATH = os.getenv("SHADOW_LOG_PATH", "")  # JSONL of every shadow decision, empty = logs only
+
+# Re-frame bot audio into fixed-duration frames per backend (0 disables)
+REFRAME_MS = int(os.getenv("REFRAME_MS", "200"))
+# Flush a partial frame once its oldest audio has waited this long
+REFRAME_MAX_LATENCY_MS = int(os.getenv("REFRAME_MAX_LATENCY_MS", "300"))
+
+# Multiplexed protocol (WS /v2/mux): one persistent connection per backend replica
+# carries all sessions. Backends not listed here, or not supporting it, use /v2/live.
+MUX_BACKENDS = [name.strip() for name in os.getenv("MUX_BACKENDS", "").split(",") if name.strip()]
+MUX_OPEN_TIMEOUT = float(os.getenv("MUX_OPEN_TIMEOUT", "10"))  # seconds
+MUX_CREDIT_TIMEOUT = float(os.getenv("MUX_CREDIT_TIMEOUT", "10"))  # seconds a session may wait for flow-control credit
+
+# Listening socket and worker processes (serve.py). 0 workers = one per CPU core.
+ROUTER_HOST = os.getenv("ROUTER_HOST", "0.0.0.0")
+ROUTER_PORT = int(os.getenv("ROUTER_PORT", "8084"))
+ROUTER_WORKERS = int(os.getenv("ROUTER_WORKERS", "1"))
+
+# Silence suppression for backends that tolerate gaps in the audio stream: long
+# silent stretches are withheld and replaced by {"type": "audio_gap"} markers so
+# backend timestamps stay continuous. Empty list disables it.
+SILENCE_TOLERANT_BACKENDS = [
+    name.strip() for name in os.getenv("SILENCE_TOLERANT_BACKENDS", "voxtral").split(",") if name.strip()
+]
+SILENCE_RMS_THRESHOLD = int(os.getenv("SILENCE_RMS_THRESHOLD", "200"))  # int16 RMS below which a chunk is silent
+SILENCE_MIN_MS = int(os.getenv("SILENCE_MIN_MS", "1000"))  # silence still forwarded before suppressing
+SILENCE_PREROLL_MS = int(os.getenv("SILENCE_PREROLL_MS", "300"))  # withheld audio re-sent when speech resumes
+SILENCE_KEEPALIVE_MS = int(os.getenv("SILENCE_KEEPALIVE_MS", "5000"))  # gap marker interval during long silences
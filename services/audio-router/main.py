@@ -1,15 +1,21 @@
 import asyncio
 import json
 import logging
+import os
 import time
 import uuid
 
-import httpx
-import websockets
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
 
-from config import ASR_BACKENDS, BACKEND_URLS
+from codec import load_opus
+from config import ASR_BACKENDS
+from recorder import load_manifest, submit_recording
+from replicas import pools, run_health_checks
+from router_session import RouterSession
+from sampling import recent_decisions
+import workers
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,163 +24,151 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Audio Router")
+health_check_task = None
+
+
+@app.on_event("startup")
+async def startup():
+    global health_check_task
+    health_check_task = asyncio.create_task(run_health_checks())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if health_check_task:
+        health_check_task.cancel()
 
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "backends": ASR_BACKENDS}
+    return {
+        "status": "ok",
+        "backends": ASR_BACKENDS,
+        "replicas": {
+            name: [replica.to_dict() for replica in pool.replicas]
+            for name, pool in pools.items()
+        },
+        "workers": workers.status(),
+    }
+
+
+SUPPORTED_ENCODINGS = ("wav/pcm", "opus")
 
 
 @app.post("/v2/live")
-async def create_session():
-    """Gladia-compatible session init. Returns the router's own WS URL."""
+async def create_session(request: Request):
+    """Gladia-compatible session init. Returns the router's own WS URL.
+
+    The negotiated encoding is carried in the WS URL so that the session needs
+    no server-side state between init and connect.
+    """
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+    encoding = (body or {}).get("encoding", "wav/pcm")
+    if encoding not in SUPPORTED_ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"Unsupported encoding: {encoding}")
+    if encoding == "opus":
+        try:
+            load_opus()
+        except RuntimeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     session_id = str(uuid.uuid4())
-    return JSONResponse(content={
-        "id": session_id,
-        "url": f"ws://audio-router:8084/v2/live?id={session_id}"
-    })
+    url = f"ws://audio-router:8084/v2/live?id={session_id}"
+    if encoding == "opus":
+        url += "&encoding=opus"
+    return JSONResponse(content={"id": session_id, "url": url})
 
 
-async def _connect_backend(name: str, session_id: str, meeting_id: str):
-    """Initialize a session on a backend and return an open WebSocket connection."""
-    base_url = BACKEND_URLS.get(name)
-    if not base_url:
-        logger.error(f"Unknown backend: {name}")
-        return None, name
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-backend transcript lag, message rates and bytes in/out."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Multi-worker mode: aggregate every worker's samples, whichever worker serves this
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
-    # Step 1: POST /v2/live to init session on the backend
-    try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(f"{base_url}/v2/live", timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            backend_ws_url = data.get("url")
-            logger.info(f"Backend {name} session init: {data}")
-    except Exception as e:
-        logger.error(f"Failed to init session on {name}: {e}")
-        return None, name
 
-    # Step 2: Open WebSocket to backend, passing meeting_id
+@app.get("/shadow/sessions")
+async def shadow_sessions(limit: int = 100):
+    """Most recent shadow routing decisions (this worker only; see SHADOW_LOG_PATH for the full log)."""
+    return list(recent_decisions)[-limit:]
+
+
+@app.get("/recordings/{session_id}")
+async def get_recording(session_id: str):
+    """Manifest of a finished session recording."""
     try:
-        ws_url = f"{backend_ws_url}&meeting_id={meeting_id}"
-        ws = await websockets.connect(ws_url)
-        # Wait for init message from backend
-        init_msg = await asyncio.wait_for(ws.recv(), timeout=10)
-        logger.info(f"Backend {name} init response: {init_msg}")
-        return ws, name
-    except Exception as e:
-        logger.error(f"Failed to connect WS to {name}: {e}")
-        return None, name
+        return load_manifest(session_id)
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Recording not found")
 
 
-async def _forward_backend_messages(backend_ws, backend_name: str, bot_ws: WebSocket, is_primary: bool):
-    """Forward transcript messages from a backend to the bot (only if primary)."""
+@app.post("/recordings/{session_id}/submit")
+async def submit_recording_endpoint(session_id: str, callback_url: str = None):
+    """Queue a finished recording on whisper-backend for batch re-transcription."""
     try:
-        async for message in backend_ws:
-            if is_primary:
-                try:
-                    data = json.loads(message)
-                    await bot_ws.send_json(data)
-                except Exception as e:
-                    logger.warning(f"Failed to forward message from {backend_name}: {e}")
-    except websockets.exceptions.ConnectionClosed:
-        logger.info(f"Backend {backend_name} WS closed")
+        result = await submit_recording(session_id, callback_url)
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Recording not found")
     except Exception as e:
-        logger.warning(f"Backend {backend_name} forward error: {e}")
+        logger.error(f"Failed to submit recording {session_id}: {e}")
+        raise HTTPException(status_code=502, detail=f"whisper-backend submission failed: {e}")
+    return result
 
 
 @app.websocket("/v2/live")
 async def websocket_endpoint(
     websocket: WebSocket,
     id: str = None,
-    meeting_id: str = "0"
+    meeting_id: str = "0",
+    encoding: str = "wav/pcm",
+    user_id: str = None
 ):
     await websocket.accept()
 
     session_id = id or f"sess_{int(time.time() * 1000)}"
-    logger.info(f"Audio router: new connection session={session_id}, meeting={meeting_id}, backends={ASR_BACKENDS}")
-
-    # Connect to all active backends
-    backend_connections = {}
-    connect_tasks = [
-        _connect_backend(name.strip(), session_id, meeting_id)
-        for name in ASR_BACKENDS
-    ]
-    results = await asyncio.gather(*connect_tasks, return_exceptions=True)
-
-    for result in results:
-        if isinstance(result, Exception):
-            logger.error(f"Backend connection error: {result}")
-            continue
-        ws, name = result
-        if ws:
-            backend_connections[name] = ws
-
-    if not backend_connections:
-        logger.error("No backends available, closing connection")
-        await websocket.close(code=1011, reason="No backends available")
-        return
-
-    logger.info(f"Connected to backends: {list(backend_connections.keys())}")
+    logger.info(f"Audio router: new connection session={session_id}, meeting={meeting_id}, encoding={encoding}, backends={ASR_BACKENDS}")
 
-    # The primary backend is the first one in ASR_BACKENDS that connected
-    primary_backend = None
-    for name in ASR_BACKENDS:
-        name = name.strip()
-        if name in backend_connections:
-            primary_backend = name
-            break
-
-    # Send init to the bot
-    await websocket.send_json({"type": "init", "request_id": session_id})
+    try:
+        session = RouterSession(session_id, meeting_id, websocket, encoding, user_id)
+    except RuntimeError as e:
+        logger.error(f"Session {session_id}: {e}")
+        await websocket.close(code=1003, reason="Opus ingest unavailable on this router")
+        return
+    try:
+        if not await session.connect():
+            logger.error("No backends available, closing connection")
+            await websocket.close(code=1011, reason="No backends available")
+            return
 
-    # Start forwarding tasks for each backend
-    forward_tasks = []
-    for name, ws in backend_connections.items():
-        is_primary = (name == primary_backend)
-        task = asyncio.create_task(
-            _forward_backend_messages(ws, name, websocket, is_primary)
-        )
-        forward_tasks.append(task)
+        # Send init to the bot
+        await websocket.send_json({"type": "init", "request_id": session_id})
 
-    try:
         while True:
             message = await websocket.receive()
             if "bytes" in message:
                 # Fan-out audio to all backends
-                for name, ws in backend_connections.items():
-                    try:
-                        await ws.send(message["bytes"])
-                    except Exception as e:
-                        logger.warning(f"Failed to send audio to {name}: {e}")
+                await session.send_audio(message["bytes"])
             elif "text" in message:
                 data = json.loads(message["text"])
                 if data.get("type") == "stop_recording":
                     logger.info(f"Received stop_recording, propagating to all backends")
-                    # Propagate stop to all backends
-                    for name, ws in backend_connections.items():
-                        try:
-                            await ws.send(message["text"])
-                        except Exception as e:
-                            logger.warning(f"Failed to send stop to {name}: {e}")
+                    await session.send_stop(message["text"])
                     break
     except WebSocketDisconnect:
         logger.info(f"Bot disconnected: session={session_id}")
     except Exception as e:
         logger.error(f"Error in audio router: {e}")
     finally:
-        # Close all backend connections
-        for name, ws in backend_connections.items():
-            try:
-                await ws.close()
-            except Exception:
-                pass
-        # Cancel forward tasks
-        for task in forward_tasks:
-            task.cancel()
+        await session.close()
         logger.info(f"Audio router session {session_id} cleaned up")
 
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8084)
+    import serve
+    serve.main()
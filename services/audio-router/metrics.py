@@ -0,0 +1,177 @@
+import bisect
+import collections
+import logging
+import re
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from config import AUDIO_BYTES_PER_SECOND, METRICS_TIMELINE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60)
+
+ACTIVE_SESSIONS = Gauge(
+    "audio_router_active_sessions", "Bot sessions currently connected to the router",
+    multiprocess_mode="livesum"
+)
+AUDIO_BYTES_IN = Counter(
+    "audio_router_audio_bytes_received_total", "Audio bytes received from bots"
+)
+BACKEND_BYTES_OUT = Counter(
+    "audio_router_backend_bytes_sent_total", "Audio bytes sent to a backend", ["backend"]
+)
+BACKEND_AUDIO_SECONDS = Counter(
+    "audio_router_backend_audio_seconds_total", "Seconds of audio streamed to a backend (billing proxy)", ["backend"]
+)
+BACKEND_SUPPRESSED_SECONDS = Counter(
+    "audio_router_backend_suppressed_seconds_total", "Seconds of silence withheld from a backend", ["backend"]
+)
+BACKEND_BYTES_IN = Counter(
+    "audio_router_backend_bytes_received_total", "Transcript bytes received from a backend", ["backend"]
+)
+BACKEND_MESSAGES = Counter(
+    "audio_router_backend_messages_total", "Messages received from a backend", ["backend"]
+)
+TRANSCRIPT_LAG = Histogram(
+    "audio_router_transcript_lag_seconds",
+    "Wall time between the router receiving audio and receiving its transcript",
+    ["backend"], buckets=LAG_BUCKETS
+)
+
+# Transcript frames are forwarded raw; pull the two fields we need without a JSON parse.
+# Quotes inside JSON strings are escaped, so these keys cannot match inside transcript text.
+_TYPE_RE = re.compile(r'"type"\s*:\s*"([a-z_]+)"')
+_END_RE = re.compile(r'"end"\s*:\s*(-?[0-9.]+(?:[eE][-+]?[0-9]+)?)')
+
+
+def peek_transcript_end(message) -> float:
+    """Return utterance.end (seconds) of a transcript frame, or None for other frames."""
+    if isinstance(message, bytes):
+        message = message.decode("utf-8", errors="ignore")
+    match = _TYPE_RE.search(message, 0, 64)
+    if not match or match.group(1) != "transcript":
+        return None
+    match = _END_RE.search(message)
+    return float(match.group(1)) if match else None
+
+
+class _LagSummary:
+    """Running lag aggregates in constant memory; percentiles are resolved to LAG_BUCKETS bounds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # One count per LAG_BUCKETS upper bound, plus one for lags above the last
+        self.buckets = [0] * (len(LAG_BUCKETS) + 1)
+
+    def add(self, lag: float):
+        self.count += 1
+        self.total += lag
+        self.max = max(self.max, lag)
+        self.buckets[bisect.bisect_left(LAG_BUCKETS, lag)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of lags (the max past the last bucket)."""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(LAG_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class _BackendStats:
+    def __init__(self):
+        self.messages = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.audio_seconds_out = 0.0
+        self.suppressed_seconds = 0.0
+        self.lag = _LagSummary()
+
+
+class SessionStats:
+    """Per-session timing: maps audio position to the wall time it reached the router."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.started_at = time.monotonic()
+        self.audio_seconds = 0.0
+        # Parallel lists: cumulative audio seconds at the end of each frame, and its arrival time.
+        # Entries before _timeline_start are expired; they are compacted away in bulk.
+        self._timeline_audio = []
+        self._timeline_arrival = []
+        self._timeline_start = 0
+        self.backends = collections.defaultdict(_BackendStats)
+
+    def on_audio(self, pcm_len: int):
+        now = time.monotonic()
+        AUDIO_BYTES_IN.inc(pcm_len)
+        self.audio_seconds += pcm_len / AUDIO_BYTES_PER_SECOND
+        self._timeline_audio.append(self.audio_seconds)
+        self._timeline_arrival.append(now)
+        cutoff = self.audio_seconds - METRICS_TIMELINE_SECONDS
+        while self._timeline_audio[self._timeline_start] < cutoff:
+            self._timeline_start += 1
+        if self._timeline_start > len(self._timeline_audio) // 2:
+            del self._timeline_audio[:self._timeline_start]
+            del self._timeline_arrival[:self._timeline_start]
+            self._timeline_start = 0
+
+    def on_backend_send(self, backend: str, nbytes: int, pcm_len: int):
+        stats = self.backends[backend]
+        stats.bytes_out += nbytes
+        stats.audio_seconds_out += pcm_len / AUDIO_BYTES_PER_SECOND
+        BACKEND_BYTES_OUT.labels(backend).inc(nbytes)
+        BACKEND_AUDIO_SECONDS.labels(backend).inc(pcm_len / AUDIO_BYTES_PER_SECOND)
+
+    def on_backend_suppressed(self, backend: str, seconds: float):
+        self.backends[backend].suppressed_seconds += seconds
+        BACKEND_SUPPRESSED_SECONDS.labels(backend).inc(seconds)
+
+    def on_backend_message(self, backend: str, message, audio_offset: float = 0.0, sample_lag: bool = True):
+        """Count a backend message; with `sample_lag` (the primary only), also measure transcript lag."""
+        stats = self.backends[backend]
+        stats.messages += 1
+        stats.bytes_in += len(message)
+        BACKEND_MESSAGES.labels(backend).inc()
+        BACKEND_BYTES_IN.labels(backend).inc(len(message))
+        if not sample_lag:
+            return
+
+        end = peek_transcript_end(message)
+        if end is None:
+            return
+        lag = self._lag_for(end + audio_offset)
+        if lag is not None:
+            stats.lag.add(lag)
+            TRANSCRIPT_LAG.labels(backend).observe(lag)
+
+    def _lag_for(self, audio_position: float):
+        index = bisect.bisect_left(self._timeline_audio, audio_position, lo=self._timeline_start)
+        if index >= len(self._timeline_audio):
+            # Backend timestamps ran ahead of the audio we sent (estimated timings)
+            return 0.0 if len(self._timeline_audio) > self._timeline_start else None
+        return time.monotonic() - self._timeline_arrival[index]
+
+    def log_summary(self):
+        duration = max(time.monotonic() - self.started_at, 1e-6)
+        for name, stats in self.backends.items():
+            lag = stats.lag
+            if lag.count:
+                lag_msg = (
+                    f"lag avg={lag.total / lag.count:.2f}s p50<={lag.percentile(0.5):.2f}s "
+                    f"p95<={lag.percentile(0.95):.2f}s max={lag.max:.2f}s"
+                )
+            else:
+                lag_msg = "no transcripts"
+            logger.info(
+                f"Session {self.session_id} [{name}]: {stats.messages} msgs ({stats.messages / duration:.2f}/s), "
+                f"bytes out={stats.bytes_out} in={stats.bytes_in}, "
+                f"audio forwarded={stats.audio_seconds_out:.1f}s suppressed={stats.suppressed_seconds:.1f}s, {lag_msg}"
+            )
+        logger.info(f"Session {self.session_id}: {self.audio_seconds:.1f}s audio over {duration:.1f}s wall time")
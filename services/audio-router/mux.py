@@ -0,0 +1,203 @@
+"""Multiplexed router <-> backend protocol (WS /v2/mux).
+
+One persistent WebSocket per backend replica carries many sessions:
+
+- router -> backend, binary: [1 byte sid length][sid][audio payload]
+- router -> backend, text:   {"op": "open" | "text" | "stop", "sid": ..., ...}
+- backend -> router, text:   "<sid>\\n<message>" for session messages (forwarded raw),
+                             or a JSON control frame {"op": "opened" | "credit" | "closed" | "error", "sid": ...}
+
+Flow control is per session: the backend grants credits (audio frames it is
+ready to take) and the router never sends more audio than it was granted.
+"""
+import asyncio
+import json
+import logging
+
+import websockets
+
+from config import MUX_OPEN_TIMEOUT, MUX_CREDIT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Audio frames carry the sid length in one byte
+MAX_SID_BYTES = 255
+
+
+class MuxUnsupported(Exception):
+    """The backend does not expose /v2/mux; use the per-session protocol."""
+
+
+class MuxChannel:
+    """One session on a shared connection. Quacks like a websockets client connection
+    (send / close / async iteration) so RouterSession can use either transparently."""
+
+    def __init__(self, connection: "MuxConnection", sid: str):
+        self.connection = connection
+        self.sid = sid
+        encoded_sid = sid.encode()
+        if not encoded_sid or len(encoded_sid) > MAX_SID_BYTES:
+            raise ValueError(f"mux sid must be 1-{MAX_SID_BYTES} bytes, got {len(encoded_sid)}")
+        self._header = bytes([len(encoded_sid)]) + encoded_sid
+        self._messages = asyncio.Queue()
+        self._credits = 0
+        self._credit_available = asyncio.Event()
+        self._opened = asyncio.get_running_loop().create_future()
+        self.closed = False
+
+    async def send(self, data):
+        if self.closed:
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+        if isinstance(data, str):
+            await self.connection.send_control({"op": "text", "sid": self.sid, "data": data})
+            return
+        while self._credits <= 0:
+            self._credit_available.clear()
+            try:
+                await asyncio.wait_for(self._credit_available.wait(), timeout=MUX_CREDIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"mux session {self.sid}: no credit from backend for {MUX_CREDIT_TIMEOUT}s")
+            if self.closed:
+                raise websockets.exceptions.ConnectionClosedError(None, None)
+        self._credits -= 1
+        await self.connection.send_binary(self._header + data)
+
+    async def close(self):
+        if self.closed:
+            return
+        try:
+            await self.connection.send_control({"op": "stop", "sid": self.sid})
+        except Exception:
+            pass
+        self._end()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._messages.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    def _grant(self, credits: int):
+        self._credits += credits
+        self._credit_available.set()
+
+    def _end(self):
+        if not self.closed:
+            self.closed = True
+            self._messages.put_nowait(None)
+            self._credit_available.set()
+            self.connection.channels.pop(self.sid, None)
+        if not self._opened.done():
+            self._opened.set_exception(ConnectionError(f"mux session {self.sid} closed before open"))
+            # Mark retrieved: nobody may be waiting for the open any more
+            self._opened.exception()
+
+
+class MuxConnection:
+    """Persistent connection to one backend replica, shared by all sessions on this worker."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.ws = None
+        self.channels = {}
+        self._reader_task = None
+
+    @property
+    def alive(self) -> bool:
+        return self.ws is not None and self._reader_task is not None and not self._reader_task.done()
+
+    async def connect(self):
+        ws_url = f"{self.base_url.replace('http', 'ws', 1)}/v2/mux"
+        try:
+            self.ws = await websockets.connect(ws_url, max_queue=None)
+        except websockets.exceptions.InvalidStatusCode as e:
+            if e.status_code in (403, 404):
+                raise MuxUnsupported(ws_url)
+            raise
+        self._reader_task = asyncio.create_task(self._read_loop())
+        logger.info(f"Mux connection open to {ws_url}")
+
+    async def open_channel(self, sid: str, meeting_id: str, encoding: str) -> MuxChannel:
+        channel = MuxChannel(self, sid)
+        self.channels[sid] = channel
+        await self.send_control({"op": "open", "sid": sid, "meeting_id": meeting_id, "encoding": encoding})
+        try:
+            await asyncio.wait_for(asyncio.shield(channel._opened), timeout=MUX_OPEN_TIMEOUT)
+        except Exception:
+            channel._end()
+            raise
+        return channel
+
+    async def send_control(self, message: dict):
+        await self.ws.send(json.dumps(message))
+
+    async def send_binary(self, frame: bytes):
+        await self.ws.send(frame)
+
+    async def _read_loop(self):
+        try:
+            async for frame in self.ws:
+                if isinstance(frame, bytes):
+                    continue
+                if frame.startswith("{"):
+                    self._handle_control(json.loads(frame))
+                    continue
+                sid, _, message = frame.partition("\n")
+                channel = self.channels.get(sid)
+                if channel:
+                    channel._messages.put_nowait(message)
+        except websockets.exceptions.ConnectionClosed:
+            logger.warning(f"Mux connection to {self.base_url} closed")
+        except Exception as e:
+            logger.error(f"Mux connection to {self.base_url} failed: {e}")
+        finally:
+            for channel in list(self.channels.values()):
+                channel._end()
+
+    def _handle_control(self, message: dict):
+        channel = self.channels.get(message.get("sid"))
+        if channel is None:
+            return
+        op = message.get("op")
+        if op == "opened":
+            channel._grant(int(message.get("credit", 0)))
+            if not channel._opened.done():
+                channel._opened.set_result(True)
+        elif op == "credit":
+            channel._grant(int(message.get("credit", 0)))
+        elif op == "error":
+            logger.error(f"Mux session {channel.sid} error from {self.base_url}: {message.get('reason')}")
+            channel._end()
+        elif op == "closed":
+            channel._end()
+
+
+_connections = {}
+_connect_locks = {}
+_unsupported = set()
+
+
+async def open_mux_channel(base_url: str, sid: str, meeting_id: str, encoding: str):
+    """Open a session over the shared connection to `base_url`.
+
+    Returns None if the backend does not support multiplexing, so the caller
+    falls back to a dedicated /v2/live connection.
+    """
+    if base_url in _unsupported:
+        return None
+    lock = _connect_locks.setdefault(base_url, asyncio.Lock())
+    async with lock:
+        connection = _connections.get(base_url)
+        if connection is None or not connection.alive:
+            connection = MuxConnection(base_url)
+            try:
+                await connection.connect()
+            except MuxUnsupported:
+                logger.warning(f"{base_url} does not support /v2/mux, using per-session connections")
+                _unsupported.add(base_url)
+                return None
+            _connections[base_url] = connection
+    return await connection.open_channel(sid, meeting_id, encoding)
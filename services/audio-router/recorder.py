@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+import httpx
+import soundfile as sf
+
+from config import (
+    RECORDING_DIR,
+    RECORDING_FORMAT,
+    RECORDING_SEGMENT_SECONDS,
+    RECORDING_QUEUE_MAX_CHUNKS,
+    WHISPER_BATCH_URL,
+    RECORDING_CALLBACK_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# RECORDING_FORMAT -> (soundfile format, subtype, extension)
+FORMATS = {
+    "flac": ("FLAC", "PCM_16", "flac"),
+    "opus": ("OGG", "OPUS", "ogg"),
+}
+
+_SAFE_SESSION_ID = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def recording_dir(session_id: str) -> str:
+    if not _SAFE_SESSION_ID.match(session_id) or session_id in (".", ".."):
+        raise ValueError(f"Invalid session id: {session_id!r}")
+    return os.path.join(RECORDING_DIR, session_id)
+
+
+class _SegmentedFile:
+    """Writer-thread state for one session: the open segment and what has been written."""
+
+    def __init__(self, session_id: str, meeting_id: str):
+        self.session_id = session_id
+        self.meeting_id = meeting_id
+        self.directory = recording_dir(session_id)
+        self.format, self.subtype, self.extension = FORMATS[RECORDING_FORMAT]
+        self.segments = []
+        self.current = None
+        self.current_frames = 0
+        self.total_frames = 0
+        self.started_at = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def write(self, audio_bytes: bytes):
+        if self.current is None or self.current_frames >= RECORDING_SEGMENT_SECONDS * SAMPLE_RATE:
+            self._rotate()
+        self.current.buffer_write(audio_bytes, dtype="int16")
+        frames = len(audio_bytes) // 2
+        self.current_frames += frames
+        self.total_frames += frames
+
+    def _rotate(self):
+        if self.current is not None:
+            self.current.close()
+        filename = f"segment_{len(self.segments):04d}.{self.extension}"
+        self.current = sf.SoundFile(
+            os.path.join(self.directory, filename), mode="w",
+            samplerate=SAMPLE_RATE, channels=1, format=self.format, subtype=self.subtype
+        )
+        self.segments.append(filename)
+        self.current_frames = 0
+
+    def close(self, dropped_chunks: int):
+        if self.current is not None:
+            self.current.close()
+        manifest = {
+            "session_id": self.session_id,
+            "meeting_id": self.meeting_id,
+            "format": RECORDING_FORMAT,
+            "sample_rate": SAMPLE_RATE,
+            "segments": self.segments,
+            "duration": self.total_frames / SAMPLE_RATE,
+            "dropped_chunks": dropped_chunks,
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+        }
+        with open(os.path.join(self.directory, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        logger.info(f"Recording for session {self.session_id} finished: {len(self.segments)} segments, {manifest['duration']:.1f}s")
+
+
+class RecordingWriter:
+    """Single background thread encoding the audio of every recorded session.
+
+    The fan-out path only enqueues chunks; the queue is bounded so a slow disk
+    drops audio from the recording instead of growing memory or delaying backends.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=RECORDING_QUEUE_MAX_CHUNKS)
+        self._files = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="recording-writer", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, item) -> bool:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    async def enqueue_blocking(self, item):
+        """Enqueue a control item that must not be dropped."""
+        self._ensure_started()
+        await asyncio.to_thread(self._queue.put, item)
+
+    def _run(self):
+        while True:
+            op, session_id, payload = self._queue.get()
+            try:
+                if op == "open":
+                    self._files[session_id] = _SegmentedFile(session_id, payload)
+                elif op == "audio":
+                    segmented = self._files.get(session_id)
+                    if segmented is not None:
+                        segmented.write(payload)
+                elif op == "close":
+                    segmented = self._files.pop(session_id, None)
+                    if segmented is not None:
+                        segmented.close(payload["dropped_chunks"])
+                    payload["done"].set()
+            except Exception as e:
+                logger.error(f"Recording writer error for session {session_id}: {e}")
+                if op == "close":
+                    payload["done"].set()
+
+
+writer = RecordingWriter()
+
+
+class SessionRecorder:
+    """Tees a router session's PCM audio into segmented, compressed files."""
+
+    def __init__(self, session_id: str, meeting_id: str):
+        self.session_id = session_id
+        self.meeting_id = meeting_id
+        self.dropped_chunks = 0
+        self._opened = False
+
+    async def open(self):
+        await writer.enqueue_blocking(("open", self.session_id, self.meeting_id))
+        self._opened = True
+
+    def write(self, audio_bytes: bytes):
+        """Non-blocking: drops the chunk from the recording if the writer is behind."""
+        if self._opened and not writer.enqueue(("audio", self.session_id, audio_bytes)):
+            self.dropped_chunks += 1
+
+    async def close(self):
+        if not self._opened:
+            return
+        self._opened = False
+        done = threading.Event()
+        await writer.enqueue_blocking(("close", self.session_id, {"dropped_chunks": self.dropped_chunks, "done": done}))
+        await asyncio.to_thread(done.wait, 30)
+        if self.dropped_chunks:
+            logger.warning(f"Recording for session {self.session_id} dropped {self.dropped_chunks} chunks (writer queue full)")
+
+
+def load_manifest(session_id: str) -> dict:
+    with open(os.path.join(recording_dir(session_id), "manifest.json")) as f:
+        return json.load(f)
+
+
+def _concatenate_segments(session_id: str, manifest: dict) -> str:
+    """Join a recording's segments into a single FLAC file for batch transcription."""
+    directory = recording_dir(session_id)
+    output_path = os.path.join(directory, "full.flac")
+    with sf.SoundFile(output_path, mode="w", samplerate=SAMPLE_RATE, channels=1, format="FLAC", subtype="PCM_16") as out:
+        for filename in manifest["segments"]:
+            with sf.SoundFile(os.path.join(directory, filename)) as segment:
+                for block in segment.blocks(blocksize=SAMPLE_RATE * 10, dtype="int16"):
+                    out.write(block)
+    return output_path
+
+
+async def submit_recording(session_id: str, callback_url: str = None) -> dict:
+    """Submit a finished recording to whisper-backend's batch queue (POST /transcribe)."""
+    manifest = load_manifest(session_id)
+    audio_path = await asyncio.to_thread(_concatenate_segments, session_id, manifest)
+
+    async with httpx.AsyncClient() as client:
+        with open(audio_path, "rb") as audio_file:
+            resp = await client.post(
+                f"{WHISPER_BATCH_URL}/transcribe",
+                files={"audio": (f"{session_id}.flac", audio_file, "audio/flac")},
+                data={
+                    "callback_url": callback_url or RECORDING_CALLBACK_URL,
+                    "meeting_id": manifest["meeting_id"],
+                },
+                timeout=60
+            )
+    resp.raise_for_status()
+    result = resp.json()
+    logger.info(f"Submitted recording {session_id} to whisper-backend: {result}")
+    return result
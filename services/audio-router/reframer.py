@@ -0,0 +1,43 @@
+import time
+
+
+class Reframer:
+    """Accumulates PCM into fixed-size frames for one backend.
+
+    Bot frames are whatever the browser worklet produces (often 20-40 ms); each
+    becomes a WebSocket message and a model call downstream. Re-framing to a
+    larger fixed size cuts that per-message overhead proportionally.
+    """
+
+    def __init__(self, frame_bytes: int):
+        # Keep frames aligned on 16-bit samples
+        self.frame_bytes = frame_bytes - frame_bytes % 2
+        self._buffer = bytearray()
+        # Arrival time of the oldest byte still waiting in the buffer
+        self.pending_since = None
+
+    def push(self, pcm: bytes) -> list:
+        """Add PCM and return every complete frame now available."""
+        if not self._buffer:
+            self.pending_since = time.monotonic()
+        self._buffer += pcm
+        if len(self._buffer) < self.frame_bytes:
+            return []
+
+        frames = []
+        offset = 0
+        while len(self._buffer) - offset >= self.frame_bytes:
+            frames.append(bytes(self._buffer[offset:offset + self.frame_bytes]))
+            offset += self.frame_bytes
+        del self._buffer[:offset]
+        self.pending_since = time.monotonic() if self._buffer else None
+        return frames
+
+    def flush(self):
+        """Return the partial frame, if any, and empty the buffer."""
+        if not self._buffer:
+            return None
+        frame = bytes(self._buffer)
+        self._buffer.clear()
+        self.pending_since = None
+        return frame
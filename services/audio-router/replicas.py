@@ -0,0 +1,125 @@
+import asyncio
+import logging
+
+import httpx
+
+from config import (
+    BACKEND_URLS,
+    REPLICA_HEALTH_INTERVAL,
+    REPLICA_HEALTH_TIMEOUT,
+    REPLICA_FAILURE_THRESHOLD,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    """One instance of an ASR backend, with its health and load."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.consecutive_failures = 0
+        # Sessions this router has pinned to the replica
+        self.local_sessions = 0
+        # Load reported by the replica's /health (may include other routers' sessions)
+        self.reported_sessions = None
+        self.capacity = None
+
+    @property
+    def active_sessions(self) -> int:
+        if self.reported_sessions is None:
+            return self.local_sessions
+        return max(self.local_sessions, self.reported_sessions)
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.capacity is None or self.active_sessions < self.capacity
+
+    def load(self) -> float:
+        """Sort key: utilisation when capacity is known, otherwise raw session count."""
+        if self.capacity:
+            return self.active_sessions / self.capacity
+        return float(self.active_sessions)
+
+    def mark_failed(self):
+        self.consecutive_failures += 1
+        if self.healthy and self.consecutive_failures >= REPLICA_FAILURE_THRESHOLD:
+            self.healthy = False
+            logger.warning(f"Ejecting unhealthy replica {self.url}")
+
+    def mark_ok(self):
+        if not self.healthy:
+            logger.info(f"Replica {self.url} healthy again")
+        self.healthy = True
+        self.consecutive_failures = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "active_sessions": self.active_sessions,
+            "capacity": self.capacity,
+        }
+
+
+class ReplicaPool:
+    """Replicas of one backend. Picks the least-loaded healthy replica per session."""
+
+    def __init__(self, name: str, urls: list):
+        self.name = name
+        self.replicas = [Replica(url) for url in urls]
+
+    def acquire(self, preferred: Replica = None, exclude=()):
+        """Pin a session to a replica. `preferred` keeps an existing session sticky;
+        replicas whose url is in `exclude` (already tried for this session) are skipped."""
+        if preferred is not None and preferred.healthy and preferred.url not in exclude:
+            replica = preferred
+        else:
+            healthy = [r for r in self.replicas if r.healthy and r.url not in exclude]
+            if not healthy:
+                if exclude:
+                    logger.error(f"No other healthy replica for backend {self.name}")
+                else:
+                    logger.error(f"No healthy replica for backend {self.name}")
+                return None
+            # Prefer replicas with spare capacity, then the least loaded
+            replica = min(healthy, key=lambda r: (not r.has_capacity, r.load()))
+        replica.local_sessions += 1
+        return replica
+
+    def release(self, replica: Replica):
+        replica.local_sessions = max(0, replica.local_sessions - 1)
+
+    async def poll_health(self, client: httpx.AsyncClient):
+        await asyncio.gather(*[self._poll_replica(client, r) for r in self.replicas])
+
+    async def _poll_replica(self, client: httpx.AsyncClient, replica: Replica):
+        try:
+            resp = await client.get(f"{replica.url}/health", timeout=REPLICA_HEALTH_TIMEOUT)
+            resp.raise_for_status()
+            data = resp.json()
+            if data.get("status") != "ok":
+                raise ValueError(f"status={data.get('status')}")
+            replica.reported_sessions = data.get("active_sessions")
+            replica.capacity = data.get("max_sessions")
+            replica.mark_ok()
+        except Exception as e:
+            logger.debug(f"Health check failed for {self.name} replica {replica.url}: {e}")
+            replica.mark_failed()
+
+
+pools = {name: ReplicaPool(name, urls) for name, urls in BACKEND_URLS.items()}
+
+
+async def run_health_checks():
+    """Background task polling every replica's /health."""
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await asyncio.gather(*[pool.poll_health(client) for pool in pools.values()])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Replica health check error: {e}")
+            await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
@@ -0,0 +1,569 @@
+import asyncio
+import collections
+import json
+import logging
+import time
+import uuid
+
+import httpx
+import websockets
+from fastapi import WebSocket
+
+from config import (
+    ASR_BACKENDS,
+    FAILOVER_LATENCY_THRESHOLD,
+    FAILOVER_CHECK_INTERVAL,
+    FAILOVER_RECONNECT,
+    FAILOVER_RECONNECT_ATTEMPTS,
+    AUDIO_REPLAY_BUFFER_SECONDS,
+    AUDIO_BYTES_PER_SECOND,
+    RECORDING_ENABLED,
+    RECORDING_AUTO_SUBMIT,
+    OPUS_NATIVE_BACKENDS,
+    ROUTER_RAW_PASSTHROUGH,
+    REFRAME_MS,
+    REFRAME_MAX_LATENCY_MS,
+    MUX_BACKENDS,
+    SILENCE_TOLERANT_BACKENDS,
+)
+from codec import OpusDecoder
+from mux import open_mux_channel
+from metrics import ACTIVE_SESSIONS, SessionStats
+from sampling import record_decision, shadow_reason, shadow_rules
+import workers
+from recorder import SessionRecorder, submit_recording
+from reframer import Reframer
+from silence import SilenceSuppressor
+from replicas import Replica, pools
+
+logger = logging.getLogger(__name__)
+
+
+async def _open_backend_session(name: str, base_url: str, meeting_id: str, encoding: str):
+    """Initialize a session on one backend replica and return an open WebSocket connection."""
+    # Step 1: POST /v2/live to init session on the backend
+    try:
+        async with httpx.AsyncClient() as client:
+            resp = await client.post(f"{base_url}/v2/live", timeout=10)
+            resp.raise_for_status()
+            data = resp.json()
+            # Build the WS URL from the replica address: backends advertise their
+            # service hostname, which is shared by all replicas.
+            backend_ws_url = f"{base_url.replace('http', 'ws', 1)}/v2/live?id={data['id']}"
+            logger.info(f"Backend {name} ({base_url}) session init: {data}")
+    except Exception as e:
+        logger.error(f"Failed to init session on {name} ({base_url}): {e}")
+        return None
+
+    # Step 2: Open WebSocket to backend, passing meeting_id
+    try:
+        ws_url = f"{backend_ws_url}&meeting_id={meeting_id}"
+        if encoding == "opus":
+            ws_url += "&encoding=opus"
+        ws = await websockets.connect(ws_url)
+        # Wait for init message from backend
+        init_msg = await asyncio.wait_for(ws.recv(), timeout=10)
+        logger.info(f"Backend {name} init response: {init_msg}")
+        return ws
+    except Exception as e:
+        logger.error(f"Failed to connect WS to {name} ({base_url}): {e}")
+        return None
+
+
+async def connect_backend(name: str, session_id: str, meeting_id: str, encoding: str = "wav/pcm",
+                          preferred: Replica = None):
+    """Pick a replica of a backend and open a session on it.
+
+    Returns (ws, name, replica); ws is None if no replica accepted the session.
+    """
+    pool = pools.get(name)
+    if not pool:
+        logger.error(f"Unknown backend: {name}")
+        return None, name, None
+
+    tried = set()
+    for _ in range(len(pool.replicas)):
+        replica = pool.acquire(preferred, exclude=tried)
+        preferred = None
+        if replica is None:
+            break
+        tried.add(replica.url)
+
+        if name in MUX_BACKENDS:
+            # Truncated by bytes: the mux framing allows 255 bytes of sid
+            sid = f"{session_id.encode()[:200].decode('utf-8', 'ignore')}.{uuid.uuid4().hex[:8]}"
+            try:
+                channel = await open_mux_channel(replica.url, sid, meeting_id, encoding)
+            except Exception as e:
+                logger.warning(f"Mux open for {name} ({replica.url}) failed, falling back to /v2/live: {e}")
+                channel = None
+            if channel:
+                logger.info(f"Session {session_id}: {name} multiplexed on replica {replica.url} as {sid}")
+                return channel, name, replica
+
+        ws = await _open_backend_session(name, replica.url, meeting_id, encoding)
+        if ws:
+            logger.info(f"Session {session_id}: {name} pinned to replica {replica.url}")
+            return ws, name, replica
+        pool.release(replica)
+        replica.mark_failed()
+    return None, name, None
+
+
+def _shift_transcript(message, offset: float) -> str:
+    """Move a transcript frame's utterance and word times by `offset` seconds.
+
+    A backend that reconnected mid-session counts from the first replayed chunk,
+    not from the start of the session. Other frames are returned unchanged.
+    """
+    if isinstance(message, bytes):
+        message = message.decode("utf-8")
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return message
+    if not isinstance(data, dict) or data.get("type") != "transcript":
+        return message
+    utterance = (data.get("data") or {}).get("utterance")
+    if not isinstance(utterance, dict):
+        return message
+    for item in [utterance, *(utterance.get("words") or [])]:
+        for key in ("start", "end"):
+            if isinstance(item, dict) and isinstance(item.get(key), (int, float)):
+                item[key] = round(item[key] + offset, 3)
+    return json.dumps(data)
+
+
+class BackendLink:
+    """State of one backend connection within a router session."""
+
+    def __init__(self, name: str, ws, replica: Replica, accepts_opus: bool = False):
+        self.name = name
+        self.ws = ws
+        # Receives the bot's Opus packets as-is instead of decoded PCM
+        self.accepts_opus = accepts_opus
+        # Replica the session is pinned to for the whole meeting
+        self.replica = replica
+        self.sticky_replica = replica
+        self.connected = ws is not None
+        # Held while audio is taken from the reframer and sent, so the flush timer
+        # cannot slip a partial frame in between frames that precede it
+        self.send_lock = asyncio.Lock()
+        self.forward_task = None
+        self.reconnect_task = None
+        self.last_message_at = None
+        # Sequence number of the next buffered audio chunk this backend has not received
+        self.next_seq = 0
+        # Session audio time at which this connection's audio (and timestamps) start
+        self.audio_offset = 0.0
+        self.reframer = None
+        self.reset_reframer()
+        self.silence = None
+        self.reset_silence()
+
+    def reset_reframer(self):
+        """Fresh frame accumulator for a (re)connected socket. Opus packets are never re-framed."""
+        if REFRAME_MS > 0 and not self.accepts_opus:
+            self.reframer = Reframer(REFRAME_MS * AUDIO_BYTES_PER_SECOND // 1000)
+        else:
+            self.reframer = None
+
+    def reset_silence(self):
+        """Fresh silence gate for a (re)connected socket, for gap-tolerant PCM backends only."""
+        if self.name in SILENCE_TOLERANT_BACKENDS and not self.accepts_opus:
+            self.silence = SilenceSuppressor()
+        else:
+            self.silence = None
+
+
+class RouterSession:
+    """Fans bot audio out to all backends and forwards the primary's transcripts.
+
+    The primary is re-elected mid-session when its connection dies or when it
+    stops returning transcripts while another backend still does.
+    """
+
+    def __init__(self, session_id: str, meeting_id: str, bot_ws: WebSocket, encoding: str = "wav/pcm",
+                 user_id: str = None):
+        self.session_id = session_id
+        self.meeting_id = meeting_id
+        self.user_id = user_id
+        self.bot_ws = bot_ws
+        self.encoding = encoding
+        # Opus ingest is decoded once here and the PCM shared by all backends
+        self.decoder = OpusDecoder() if encoding == "opus" else None
+
+        self.links = {}
+        self.primary = None
+        self._closed = False
+        self._monitor_task = None
+        self._flush_task = None
+
+        # Recent audio as (seq, pcm, opus_or_None), bounded by AUDIO_REPLAY_BUFFER_SECONDS of PCM
+        self._audio_buffer = collections.deque()
+        self._audio_buffer_bytes = 0
+        self._audio_buffer_max_bytes = int(AUDIO_REPLAY_BUFFER_SECONDS * AUDIO_BYTES_PER_SECOND)
+        self._next_seq = 0
+
+        self.recorder = SessionRecorder(session_id, meeting_id) if RECORDING_ENABLED else None
+        self.stats = SessionStats(session_id)
+
+    async def connect(self) -> bool:
+        """Connect to all active backends. Returns False if none is reachable."""
+        names = [name.strip() for name in ASR_BACKENDS]
+        selected = await self._select_backends(names)
+        results = await asyncio.gather(
+            *[connect_backend(name, self.session_id, self.meeting_id, self._backend_encoding(name))
+              for name in selected],
+            return_exceptions=True
+        )
+
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Backend connection error: {result}")
+                continue
+            ws, name, replica = result
+            if ws:
+                self.links[name] = BackendLink(
+                    name, ws, replica, accepts_opus=self._backend_encoding(name) == "opus"
+                )
+
+        if not self.links:
+            return False
+
+        if self.recorder:
+            try:
+                await self.recorder.open()
+            except Exception as e:
+                logger.error(f"Session {self.session_id}: recording disabled, failed to open recorder: {e}")
+                self.recorder = None
+
+        logger.info(f"Connected to backends: {list(self.links.keys())}")
+        ACTIVE_SESSIONS.inc()
+        workers.session_started()
+
+        # The primary backend is the first one in ASR_BACKENDS that connected
+        for name in names:
+            if name in self.links:
+                self.primary = name
+                break
+
+        for link in self.links.values():
+            link.forward_task = asyncio.create_task(self._forward_backend_messages(link, link.ws))
+        self._monitor_task = asyncio.create_task(self._monitor_primary())
+        if REFRAME_MS > 0:
+            self._flush_task = asyncio.create_task(self._flush_partial_frames())
+        return True
+
+    async def _select_backends(self, names: list) -> list:
+        """Drop shadow backends this session is not sampled for, so they are never opened."""
+        selected = names[:1]
+        for name in names[1:]:
+            if name not in shadow_rules:
+                selected.append(name)
+                continue
+            reason = shadow_reason(name, self.meeting_id, self.user_id)
+            await record_decision(self.session_id, self.meeting_id, name, reason)
+            if reason:
+                selected.append(name)
+        return selected
+
+    def _backend_encoding(self, name: str) -> str:
+        if self.decoder and name in OPUS_NATIVE_BACKENDS:
+            return "opus"
+        return "wav/pcm"
+
+    async def send_audio(self, audio_bytes: bytes):
+        """Fan-out an audio chunk (PCM, or one Opus packet if negotiated) to all connected backends."""
+        if self.decoder:
+            opus = audio_bytes
+            try:
+                pcm = self.decoder.decode(opus)
+            except Exception as e:
+                logger.warning(f"Session {self.session_id}: dropping undecodable Opus packet: {e}")
+                return
+        else:
+            pcm, opus = audio_bytes, None
+
+        self._buffer_audio(pcm, opus)
+        self.stats.on_audio(len(pcm))
+        if self.recorder:
+            self.recorder.write(pcm)
+        for link in list(self.links.values()):
+            if not link.connected:
+                continue
+            async with link.send_lock:
+                try:
+                    if link.silence:
+                        await self._send_gated(link, link.silence.process(pcm))
+                    elif link.reframer:
+                        for frame in link.reframer.push(pcm):
+                            await self._send_frame(link, frame, len(frame))
+                    else:
+                        await self._send_frame(link, opus if link.accepts_opus else pcm, len(pcm))
+                    # Audio waiting in the reframer counts as delivered: at most one frame
+                    # is lost if this backend fails before the next flush.
+                    link.next_seq = self._next_seq
+                except Exception as e:
+                    logger.warning(f"Failed to send audio to {link.name}: {e}")
+                    await self._handle_backend_lost(link, link.ws)
+
+    async def _send_frame(self, link: BackendLink, payload: bytes, pcm_len: int):
+        await link.ws.send(payload)
+        self.stats.on_backend_send(link.name, len(payload), pcm_len)
+
+    async def _send_gated(self, link: BackendLink, items: list):
+        """Send the audio and gap markers the link's silence gate let through."""
+        for kind, value in items:
+            if kind == "gap":
+                # Audio held in the reframer precedes the gap
+                if link.reframer:
+                    frame = link.reframer.flush()
+                    if frame:
+                        await self._send_frame(link, frame, len(frame))
+                await link.ws.send(json.dumps({"type": "audio_gap", "duration": round(value, 3)}))
+                self.stats.on_backend_suppressed(link.name, value)
+            elif link.reframer:
+                for frame in link.reframer.push(value):
+                    await self._send_frame(link, frame, len(frame))
+            else:
+                await self._send_frame(link, value, len(value))
+
+    async def send_stop(self, text: str):
+        """Propagate stop_recording to all connected backends."""
+        for link in self.links.values():
+            if not link.connected:
+                continue
+            async with link.send_lock:
+                try:
+                    if link.reframer:
+                        frame = link.reframer.flush()
+                        if frame:
+                            await self._send_frame(link, frame, len(frame))
+                    await link.ws.send(text)
+                except Exception as e:
+                    logger.warning(f"Failed to send stop to {link.name}: {e}")
+
+    async def close(self):
+        """Close all backend connections and cancel background tasks."""
+        if self._closed:
+            return
+        self._closed = True
+        for task in (self._monitor_task, self._flush_task):
+            if task:
+                task.cancel()
+        for link in self.links.values():
+            if link.ws:
+                try:
+                    await link.ws.close()
+                except Exception:
+                    pass
+            for task in (link.forward_task, link.reconnect_task):
+                if task:
+                    task.cancel()
+            self._release_replica(link)
+
+        if self.decoder:
+            self.decoder.close()
+
+        if self.links:
+            ACTIVE_SESSIONS.dec()
+            workers.session_ended()
+        self.stats.log_summary()
+
+        if self.recorder:
+            await self.recorder.close()
+            if RECORDING_AUTO_SUBMIT:
+                asyncio.create_task(self._submit_recording())
+
+    async def _submit_recording(self):
+        try:
+            await submit_recording(self.session_id)
+        except Exception as e:
+            logger.error(f"Session {self.session_id}: failed to submit recording: {e}")
+
+    def _release_replica(self, link: BackendLink):
+        if link.replica is not None:
+            pools[link.name].release(link.replica)
+            link.replica = None
+
+    def _buffer_audio(self, pcm: bytes, opus: bytes = None):
+        self._audio_buffer.append((self._next_seq, pcm, opus))
+        self._audio_buffer_bytes += len(pcm)
+        self._next_seq += 1
+        while self._audio_buffer and self._audio_buffer_bytes > self._audio_buffer_max_bytes:
+            _, dropped, _ = self._audio_buffer.popleft()
+            self._audio_buffer_bytes -= len(dropped)
+
+    async def _forward_backend_messages(self, link: BackendLink, ws):
+        """Forward transcript messages from a backend to the bot (only if primary)."""
+        try:
+            async for message in ws:
+                link.last_message_at = time.monotonic()
+                # Lag is sampled on the primary only, so secondaries stay undecoded
+                self.stats.on_backend_message(link.name, message, link.audio_offset,
+                                              sample_lag=link.name == self.primary)
+                if link.name != self.primary:
+                    # Secondaries are drained to keep their socket flowing, never decoded
+                    continue
+                try:
+                    if link.audio_offset:
+                        message = _shift_transcript(message, link.audio_offset)
+                    if ROUTER_RAW_PASSTHROUGH:
+                        if isinstance(message, bytes):
+                            message = message.decode("utf-8")
+                        await self.bot_ws.send_text(message)
+                    else:
+                        await self.bot_ws.send_json(json.loads(message))
+                except Exception as e:
+                    logger.warning(f"Failed to forward message from {link.name}: {e}")
+        except websockets.exceptions.ConnectionClosed:
+            logger.info(f"Backend {link.name} WS closed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Backend {link.name} forward error: {e}")
+        await self._handle_backend_lost(link, ws)
+
+    async def _handle_backend_lost(self, link: BackendLink, ws):
+        # Ignore late notifications about a connection that was already replaced
+        if self._closed or not link.connected or ws is not link.ws:
+            return
+        link.connected = False
+        logger.warning(f"Session {self.session_id}: lost backend {link.name}")
+        # link.sticky_replica stays as the reconnect preference
+        self._release_replica(link)
+
+        if link.name == self.primary:
+            self._promote(f"{link.name} connection lost")
+
+        if FAILOVER_RECONNECT and not link.reconnect_task:
+            link.reconnect_task = asyncio.create_task(self._reconnect(link))
+
+    def _promote(self, reason: str):
+        """Promote the healthiest remaining backend to primary."""
+        candidates = [
+            link for link in self.links.values()
+            if link.connected and link.name != self.primary
+        ]
+        if not candidates:
+            logger.error(f"Session {self.session_id}: no backend left to replace primary {self.primary} ({reason})")
+            return
+
+        # Healthiest = most recent transcript; never-heard-from backends come last
+        best = max(candidates, key=lambda link: link.last_message_at or 0.0)
+        logger.warning(f"Session {self.session_id}: failover {self.primary} -> {best.name} ({reason})")
+        self.primary = best.name
+
+    async def _monitor_primary(self):
+        """Demote a primary that stalls while another backend keeps transcribing."""
+        while not self._closed:
+            await asyncio.sleep(FAILOVER_CHECK_INTERVAL)
+            primary = self.links.get(self.primary)
+            if not primary or not primary.connected:
+                continue
+
+            now = time.monotonic()
+            primary_last = primary.last_message_at or 0.0
+            if primary.last_message_at is not None and now - primary_last <= FAILOVER_LATENCY_THRESHOLD:
+                continue
+
+            # Only fail over if someone else is demonstrably producing transcripts,
+            # otherwise the silence is most likely in the meeting itself.
+            fresher = any(
+                link.connected and link.last_message_at is not None
+                and link.last_message_at > primary_last
+                and now - link.last_message_at <= FAILOVER_LATENCY_THRESHOLD
+                for link in self.links.values() if link.name != self.primary
+            )
+            if fresher:
+                self._promote(f"{self.primary} exceeded {FAILOVER_LATENCY_THRESHOLD}s transcript latency")
+
+    async def _flush_partial_frames(self):
+        """Max-latency timer: send partial frames so quiet or slow input is not held back."""
+        max_latency = REFRAME_MAX_LATENCY_MS / 1000
+        while not self._closed:
+            await asyncio.sleep(max_latency / 2)
+            for link in list(self.links.values()):
+                await self._flush_link(link, max_latency)
+
+    async def _flush_link(self, link: BackendLink, max_latency: float):
+        """Send the link's partial frame if its oldest audio has waited `max_latency` seconds."""
+        async with link.send_lock:
+            reframer = link.reframer
+            if not link.connected or not reframer or reframer.pending_since is None:
+                return
+            if time.monotonic() - reframer.pending_since < max_latency:
+                return
+            frame = reframer.flush()
+            try:
+                await self._send_frame(link, frame, len(frame))
+            except Exception as e:
+                logger.warning(f"Failed to flush audio to {link.name}: {e}")
+                await self._handle_backend_lost(link, link.ws)
+
+    async def _reconnect(self, link: BackendLink):
+        """Reconnect a failed backend in the background and replay buffered audio."""
+        try:
+            for attempt in range(1, FAILOVER_RECONNECT_ATTEMPTS + 1):
+                await asyncio.sleep(min(2 ** attempt, 30))
+                if self._closed:
+                    return
+                ws, _, replica = await connect_backend(
+                    link.name, self.session_id, self.meeting_id, self._backend_encoding(link.name),
+                    preferred=link.sticky_replica
+                )
+                if not ws:
+                    logger.warning(f"Session {self.session_id}: reconnect {link.name} attempt {attempt} failed")
+                    continue
+                if self._closed:
+                    await ws.close()
+                    pools[link.name].release(replica)
+                    return
+
+                if link.forward_task:
+                    link.forward_task.cancel()
+                try:
+                    await link.ws.close()
+                except Exception:
+                    pass
+                link.ws = ws
+                link.reset_reframer()
+                link.reset_silence()
+                link.replica = replica
+                link.sticky_replica = replica
+                link.last_message_at = None
+                await self._replay_audio(link)
+                link.connected = True
+                link.forward_task = asyncio.create_task(self._forward_backend_messages(link, ws))
+                logger.info(f"Session {self.session_id}: reconnected {link.name} as secondary")
+                return
+            logger.error(f"Session {self.session_id}: giving up on {link.name} after {FAILOVER_RECONNECT_ATTEMPTS} attempts")
+        except Exception as e:
+            logger.error(f"Session {self.session_id}: reconnect {link.name} error: {e}")
+        finally:
+            link.reconnect_task = None
+
+    async def _replay_audio(self, link: BackendLink):
+        """Send buffered audio the backend missed, until it has caught up with live audio."""
+        replayed = 0
+        # The new backend session's clock starts at the first replayed chunk
+        first_seq = self._audio_buffer[0][0] if self._audio_buffer else self._next_seq
+        pending = sum(len(pcm) for seq, pcm, _ in self._audio_buffer if seq >= max(link.next_seq, first_seq))
+        link.audio_offset = self.stats.audio_seconds - pending / AUDIO_BYTES_PER_SECOND
+        while link.next_seq < self._next_seq:
+            if not self._audio_buffer:
+                link.next_seq = self._next_seq
+                break
+            # Chunks older than the buffer window are lost for good
+            first_seq = self._audio_buffer[0][0]
+            link.next_seq = max(link.next_seq, first_seq)
+            _, pcm, opus = self._audio_buffer[link.next_seq - first_seq]
+            if link.reframer:
+                for frame in link.reframer.push(pcm):
+                    await self._send_frame(link, frame, len(frame))
+            else:
+                await self._send_frame(link, opus if link.accepts_opus else pcm, len(pcm))
+            link.next_seq += 1
+            replayed += len(pcm)
+        logger.info(f"Session {self.session_id}: replayed {replayed / AUDIO_BYTES_PER_SECOND:.1f}s of audio to {link.name}")
@@ -0,0 +1,134 @@
+import asyncio
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import time
+
+from prometheus_client import Counter
+
+from config import SHADOW_RULES, SHADOW_LOG_PATH
+
+logger = logging.getLogger(__name__)
+
+SHADOW_DECISIONS = Counter(
+    "audio_router_shadow_sessions_total", "Shadow routing decisions per backend", ["backend", "shadowed"]
+)
+
+# Most recent decisions, for GET /shadow/sessions
+recent_decisions = collections.deque(maxlen=1000)
+
+
+def _parse_window(window: str):
+    start, end = window.split("-")
+    return datetime.time.fromisoformat(start.strip()), datetime.time.fromisoformat(end.strip())
+
+
+def _load_rules(raw_rules: dict) -> dict:
+    """Validate SHADOW_RULES once, normalizing ids to strings and windows to (start, end) times.
+
+    Malformed rules and criteria are logged and skipped instead of failing sessions later.
+    """
+    if not isinstance(raw_rules, dict):
+        logger.error(f"Ignoring SHADOW_RULES: expected a JSON object, got {raw_rules!r}")
+        return {}
+    rules = {}
+    for backend, raw in raw_rules.items():
+        if not isinstance(raw, dict):
+            logger.error(f"Ignoring shadow rule for {backend}: expected a JSON object, got {raw!r}")
+            continue
+        rule = {"meeting_ids": set(), "user_ids": set(), "windows": [], "percent": 0.0}
+        for key in ("meeting_ids", "user_ids"):
+            ids = raw.get(key, [])
+            if isinstance(ids, list):
+                rule[key] = {str(value) for value in ids}
+            else:
+                logger.error(f"Ignoring shadow rule {backend}.{key}: expected a list, got {ids!r}")
+        windows = raw.get("windows", [])
+        if not isinstance(windows, list):
+            logger.error(f"Ignoring shadow rule {backend}.windows: expected a list, got {windows!r}")
+            windows = []
+        for window in windows:
+            try:
+                rule["windows"].append(_parse_window(window))
+            except (ValueError, TypeError, AttributeError):
+                logger.error(f"Ignoring shadow rule {backend} window {window!r}: expected HH:MM-HH:MM")
+        try:
+            rule["percent"] = float(raw.get("percent", 0))
+        except (ValueError, TypeError):
+            logger.error(f"Ignoring shadow rule {backend}.percent: not a number: {raw.get('percent')!r}")
+        rules[backend] = rule
+    return rules
+
+
+# Parsed at startup (import) so a malformed rule never fails a session
+def _parse_rules(raw_json: str) -> dict:
+    """Parse the SHADOW_RULES JSON; malformed JSON is logged and means no rules."""
+    try:
+        return json.loads(raw_json)
+    except json.JSONDecodeError as e:
+        logger.error(f"Ignoring SHADOW_RULES: invalid JSON ({e})")
+        return {}
+
+
+shadow_rules = _load_rules(_parse_rules(SHADOW_RULES))
+
+
+def _in_window(window: tuple, now: datetime.time) -> bool:
+    start, end = window
+    if start <= end:
+        return start <= now < end
+    # Window wrapping midnight, e.g. 22:00-06:00
+    return now >= start or now < end
+
+
+def _percent_bucket(backend: str, meeting_id: str) -> float:
+    """Stable 0-100 bucket per (backend, meeting) so every session of a meeting gets the same decision."""
+    digest = hashlib.sha1(f"{backend}:{meeting_id}".encode()).digest()
+    return int.from_bytes(digest[:4], "big") / 2 ** 32 * 100
+
+
+def shadow_reason(backend: str, meeting_id: str, user_id: str = None):
+    """Return why a session should be shadowed on `backend`, or None if it should not.
+
+    Backends without a (valid) rule in SHADOW_RULES are always connected.
+    """
+    rule = shadow_rules.get(backend)
+    if rule is None:
+        return "no_rule"
+    if meeting_id in rule["meeting_ids"]:
+        return "meeting_id"
+    if user_id is not None and user_id in rule["user_ids"]:
+        return "user_id"
+    now = datetime.datetime.utcnow().time()
+    if any(_in_window(window, now) for window in rule["windows"]):
+        return "time_window"
+    if _percent_bucket(backend, meeting_id) < rule["percent"]:
+        return "percent"
+    return None
+
+
+def _append_log(record: dict):
+    with open(SHADOW_LOG_PATH, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+async def record_decision(session_id: str, meeting_id: str, backend: str, reason):
+    """Record a shadow decision (including negative ones) so compare reports know the sample."""
+    record = {
+        "ts": time.time(),
+        "session_id": session_id,
+        "meeting_id": meeting_id,
+        "backend": backend,
+        "shadowed": reason is not None,
+        "reason": reason,
+    }
+    recent_decisions.append(record)
+    SHADOW_DECISIONS.labels(backend, str(reason is not None).lower()).inc()
+    logger.info(f"Session {session_id}: shadow {backend} = {reason is not None} ({reason or 'not sampled'})")
+    if SHADOW_LOG_PATH:
+        try:
+            await asyncio.to_thread(_append_log, record)
+        except Exception as e:
+            logger.warning(f"Failed to write shadow decision log: {e}")
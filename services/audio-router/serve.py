@@ -0,0 +1,94 @@
+"""Audio router entrypoint.
+
+With ROUTER_WORKERS > 1, starts one process per worker, each binding the same
+port with SO_REUSEPORT so the kernel spreads new connections across them. A
+session lives entirely in the worker that accepted its WebSocket (the init POST
+is stateless), so no state is shared between workers except metrics and the
+per-worker session counts.
+"""
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+
+from config import ROUTER_HOST, ROUTER_PORT, ROUTER_WORKERS
+
+
+def _bind_reuseport() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((ROUTER_HOST, ROUTER_PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(index: int, counts):
+    import uvicorn
+
+    import workers
+    workers.init(index, counts)
+
+    from main import app
+    sock = _bind_reuseport()
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[sock])
+
+
+def _handle_sigterm(signum, frame):
+    # Unwind main() so its finally stops the workers, which would otherwise keep the port
+    raise SystemExit(0)
+
+
+def main():
+    worker_count = ROUTER_WORKERS or os.cpu_count() or 1
+    if worker_count == 1:
+        import uvicorn
+        uvicorn.run("main:app", host=ROUTER_HOST, port=ROUTER_PORT)
+        return
+
+    # prometheus_client aggregates counters across processes through this directory;
+    # it must be set before any worker imports prometheus_client. A directory supplied
+    # through PROMETHEUS_MULTIPROC_DIR is the operator's to clean; only our own is removed.
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    own_metrics_dir = not metrics_dir
+    if own_metrics_dir:
+        metrics_dir = tempfile.mkdtemp(prefix="audio-router-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    else:
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    ctx = multiprocessing.get_context("spawn")
+    counts = ctx.Array("i", worker_count)
+    processes = [
+        ctx.Process(target=_run_worker, args=(index, counts), name=f"audio-router-{index}", daemon=True)
+        for index in range(worker_count)
+    ]
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    for process in processes:
+        process.start()
+    print(f"Audio router started {worker_count} workers on {ROUTER_HOST}:{ROUTER_PORT} (SO_REUSEPORT)")
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        if own_metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
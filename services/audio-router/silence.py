@@ -0,0 +1,73 @@
+import audioop
+import collections
+
+from config import (
+    AUDIO_BYTES_PER_SECOND,
+    SILENCE_RMS_THRESHOLD,
+    SILENCE_MIN_MS,
+    SILENCE_PREROLL_MS,
+    SILENCE_KEEPALIVE_MS,
+)
+
+
+def _ms_to_bytes(ms: int) -> int:
+    return ms * AUDIO_BYTES_PER_SECOND // 1000
+
+
+class SilenceSuppressor:
+    """RMS gate deciding what a gap-tolerant backend receives for each PCM chunk.
+
+    The first SILENCE_MIN_MS of a silent stretch is forwarded as-is so the
+    backend still sees the end of speech; beyond that, audio is withheld and
+    reported as gap metadata instead, so downstream timestamps stay continuous.
+    The last SILENCE_PREROLL_MS of withheld audio is sent back when speech
+    resumes, to keep soft onsets.
+
+    process() returns a list of ("audio", pcm) and ("gap", seconds) items.
+    """
+
+    def __init__(self):
+        self._min_bytes = _ms_to_bytes(SILENCE_MIN_MS)
+        self._preroll_max = _ms_to_bytes(SILENCE_PREROLL_MS)
+        self._keepalive_bytes = _ms_to_bytes(SILENCE_KEEPALIVE_MS)
+        self._silent_run = 0
+        # Withheld audio not yet reported as a gap
+        self._pending_gap = 0
+        self._preroll = collections.deque()
+        self._preroll_bytes = 0
+
+    def process(self, pcm: bytes) -> list:
+        if audioop.rms(pcm, 2) >= SILENCE_RMS_THRESHOLD:
+            return self._resume(pcm)
+
+        self._silent_run += len(pcm)
+        if self._silent_run <= self._min_bytes:
+            return [("audio", pcm)]
+
+        self._preroll.append(pcm)
+        self._preroll_bytes += len(pcm)
+        while self._preroll_bytes > self._preroll_max:
+            dropped = self._preroll.popleft()
+            self._preroll_bytes -= len(dropped)
+            self._pending_gap += len(dropped)
+
+        # Periodic marker doubles as keep-alive during long silences
+        if self._pending_gap >= self._keepalive_bytes:
+            return [self._take_gap()]
+        return []
+
+    def _resume(self, pcm: bytes) -> list:
+        self._silent_run = 0
+        items = []
+        if self._pending_gap:
+            items.append(self._take_gap())
+        items.extend(("audio", chunk) for chunk in self._preroll)
+        self._preroll.clear()
+        self._preroll_bytes = 0
+        items.append(("audio", pcm))
+        return items
+
+    def _take_gap(self):
+        gap = ("gap", self._pending_gap / AUDIO_BYTES_PER_SECOND)
+        self._pending_gap = 0
+        return gap
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Service modules are imported top-level (as in the Docker image, where the service is /app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
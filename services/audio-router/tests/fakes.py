@@ -0,0 +1,34 @@
+"""In-memory stand-ins for the bot and backend WebSockets."""
+import json
+
+
+class FakeBotSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def send_json(self, data):
+        self.sent.append(json.dumps(data))
+
+
+class FakeBackendSocket:
+    """Backend connection replaying canned messages, recording what the router sends."""
+
+    def __init__(self, messages=()):
+        self.messages = list(messages)
+        self.sent = []
+
+    async def send(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield message
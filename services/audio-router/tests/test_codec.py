@@ -0,0 +1,58 @@
+"""Opus ingest: optional libopus, single decode per packet."""
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import codec
+import main
+
+
+def _opus_available() -> bool:
+    try:
+        codec.load_opus()
+    except RuntimeError:
+        return False
+    return True
+
+
+def test_missing_libopus_raises_clear_error(monkeypatch):
+    monkeypatch.setitem(sys.modules, "opuslib", None)
+    monkeypatch.setitem(sys.modules, "opuslib.api", None)
+    with pytest.raises(RuntimeError, match="libopus"):
+        codec.OpusDecoder()
+
+
+def test_opus_init_rejected_without_libopus(monkeypatch):
+    monkeypatch.setitem(sys.modules, "opuslib", None)
+    monkeypatch.setitem(sys.modules, "opuslib.api", None)
+    client = TestClient(main.app)
+    response = client.post("/v2/live", json={"encoding": "opus"})
+    assert response.status_code == 400 and "libopus" in response.json()["detail"]
+    assert client.post("/v2/live", json={"encoding": "wav/pcm"}).status_code == 200
+
+
+@pytest.mark.skipif(not _opus_available(), reason="libopus not installed")
+def test_decode_20ms_packet():
+    import opuslib
+    frame_samples = codec.SAMPLE_RATE // 50
+    encoder = opuslib.Encoder(codec.SAMPLE_RATE, codec.CHANNELS, opuslib.APPLICATION_VOIP)
+    packet = encoder.encode(bytes(frame_samples * 2), frame_samples)
+
+    decoder = codec.OpusDecoder()
+    try:
+        assert len(decoder.decode(packet)) == frame_samples * 2
+        with pytest.raises(ValueError):
+            decoder.decode(b"\xff" * 3)
+    finally:
+        decoder.close()
+
+
+def test_opus_socket_closed_without_libopus(monkeypatch):
+    monkeypatch.setitem(sys.modules, "opuslib", None)
+    monkeypatch.setitem(sys.modules, "opuslib.api", None)
+    with TestClient(main.app).websocket_connect("/v2/live?id=s1&encoding=opus") as ws:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_text()
+    assert closed.value.code == 1003
@@ -0,0 +1,40 @@
+"""Session lag metrics."""
+import json
+
+import metrics
+from metrics import SessionStats, _LagSummary
+
+
+def _transcript(end):
+    return json.dumps({"type": "transcript", "data": {"utterance": {"text": "x", "start": 0, "end": end}}})
+
+
+def test_lag_summary_percentiles_use_bucket_bounds():
+    summary = _LagSummary()
+    for lag in [0.1] * 90 + [4.0] * 9 + [100.0]:
+        summary.add(lag)
+    assert summary.count == 100
+    assert summary.percentile(0.5) == 0.25
+    assert summary.percentile(0.95) == 5
+    assert summary.percentile(1.0) == summary.max == 100.0
+
+
+def test_only_sampled_messages_measure_lag():
+    stats = SessionStats("s1")
+    stats.on_audio(metrics.AUDIO_BYTES_PER_SECOND)
+    stats.on_backend_message("whisper", _transcript(0.5))
+    stats.on_backend_message("voxtral", _transcript(0.5), sample_lag=False)
+    assert stats.backends["whisper"].lag.count == 1
+    assert stats.backends["voxtral"].lag.count == 0
+    assert stats.backends["voxtral"].messages == 1
+
+
+def test_timeline_is_trimmed_to_window(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TIMELINE_SECONDS", 10)
+    stats = SessionStats("s1")
+    for _ in range(1000):
+        stats.on_audio(metrics.AUDIO_BYTES_PER_SECOND // 10)
+    live = stats._timeline_audio[stats._timeline_start:]
+    assert len(live) <= 101
+    assert len(stats._timeline_audio) <= 2 * len(live) + 1
+    assert stats._lag_for(stats.audio_seconds - 5) is not None
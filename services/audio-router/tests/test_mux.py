@@ -0,0 +1,163 @@
+"""Mux channel framing, and the router's mux client against the proxies' shared MuxServer."""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+import websockets
+
+import mux
+from mux import MuxChannel, open_mux_channel
+
+# services/, so the proxies' shared package imports as in their images
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from shared.mux_server import MuxServer
+
+
+def test_sid_must_fit_length_byte():
+    async def run():
+        assert MuxChannel(None, "é" * 127)._header[0] == 254
+        with pytest.raises(ValueError):
+            MuxChannel(None, "é" * 128)
+
+    asyncio.run(run())
+
+
+class _ServerSocket:
+    """Adapts a websockets server connection to the Starlette WebSocket calls MuxServer makes."""
+
+    def __init__(self, ws):
+        self.ws = ws
+
+    async def receive(self):
+        try:
+            frame = await self.ws.recv()
+        except websockets.exceptions.ConnectionClosed:
+            return {"type": "websocket.disconnect"}
+        return {"type": "websocket.receive", "bytes" if isinstance(frame, bytes) else "text": frame}
+
+    async def send_text(self, text):
+        await self.ws.send(text)
+
+
+class _Session:
+    """Proxy session that consumes one audio chunk per release()."""
+
+    def __init__(self, socket):
+        self.socket = socket
+        self.chunks = []
+        self.gaps = []
+        self.finalized = False
+        self._released = asyncio.Semaphore(0)
+
+    def release(self, chunks: int = 1):
+        for _ in range(chunks):
+            self._released.release()
+
+    async def process_audio_chunk(self, chunk):
+        await self._released.acquire()
+        self.chunks.append(chunk)
+        await self.socket.send_json({"type": "transcript", "chunks": len(self.chunks)})
+
+    def add_gap(self, seconds):
+        self.gaps.append(seconds)
+
+    async def finalize(self):
+        self.finalized = True
+
+
+async def _serve(sessions: dict, credit_window: int):
+    """Runs MuxServer on a local port; returns (server, base_url)."""
+    async def create_session(sid, meeting_id, socket):
+        return _Session(socket)
+
+    async def handler(ws):
+        await MuxServer(_ServerSocket(ws), create_session, sessions, credit_window).run()
+
+    server = await websockets.serve(handler, "127.0.0.1", 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0.01)
+
+
+def test_audio_waits_for_credit_from_backend():
+    async def run():
+        sessions = {}
+        server, url = await _serve(sessions, credit_window=4)
+        channel = await open_mux_channel(url, "s1", "m1", "wav/pcm")
+        session = sessions["s1"]
+        for i in range(4):
+            await channel.send(bytes([i]))
+        blocked = asyncio.create_task(channel.send(b"\x04"))
+        await _settle()
+        assert not blocked.done()
+
+        session.release()
+        await asyncio.wait_for(blocked, timeout=2)
+        session.release(4)
+        messages = [json.loads(await channel.__anext__()) for _ in range(5)]
+        assert [m["chunks"] for m in messages] == [1, 2, 3, 4, 5]
+        assert session.chunks == [bytes([i]) for i in range(5)]
+
+        await channel.close()
+        await _settle()
+        assert session.finalized and "s1" not in sessions
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def test_send_times_out_without_credit(monkeypatch):
+    monkeypatch.setattr(mux, "MUX_CREDIT_TIMEOUT", 0.2)
+
+    async def run():
+        sessions = {}
+        server, url = await _serve(sessions, credit_window=1)
+        channel = await open_mux_channel(url, "s1", "m1", "wav/pcm")
+        await channel.send(b"\x00")
+        with pytest.raises(TimeoutError):
+            await channel.send(b"\x01")
+        sessions["s1"].release()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def test_gap_markers_reach_session_without_consuming_credit():
+    async def run():
+        sessions = {}
+        server, url = await _serve(sessions, credit_window=1)
+        channel = await open_mux_channel(url, "s1", "m1", "wav/pcm")
+        await channel.send(json.dumps({"type": "audio_gap", "duration": 1.5}))
+        await channel.send(b"\x00")
+        await _settle()
+        session = sessions["s1"]
+        assert session.gaps == [1.5]
+        assert channel._credits == 0
+        session.release()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def test_unsupported_encoding_is_refused():
+    async def run():
+        sessions = {}
+        server, url = await _serve(sessions, credit_window=4)
+        with pytest.raises(ConnectionError):
+            await open_mux_channel(url, "s1", "m1", "opus")
+        assert sessions == {}
+        # The connection stays usable for other sessions
+        channel = await open_mux_channel(url, "s2", "m1", "wav/pcm")
+        assert "s2" in sessions and not channel.closed
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
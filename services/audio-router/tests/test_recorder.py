@@ -0,0 +1,106 @@
+"""Recording tee: bounded writer queue, segmented files and manifest."""
+import asyncio
+import json
+import os
+import threading
+
+import httpx
+import soundfile as sf
+
+import recorder
+from recorder import RecordingWriter, SessionRecorder
+
+
+def _pcm(seconds: float) -> bytes:
+    return bytes(int(seconds * recorder.SAMPLE_RATE) * 2)
+
+
+def test_recording_is_segmented_with_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(recorder, "RECORDING_DIR", str(tmp_path))
+    monkeypatch.setattr(recorder, "RECORDING_SEGMENT_SECONDS", 1)
+    monkeypatch.setattr(recorder, "writer", RecordingWriter())
+
+    async def run():
+        session = SessionRecorder("s1", "42")
+        await session.open()
+        for _ in range(5):
+            session.write(_pcm(0.5))
+        await session.close()
+
+    asyncio.run(run())
+    manifest = recorder.load_manifest("s1")
+    assert manifest["meeting_id"] == "42"
+    assert manifest["segments"] == ["segment_0000.flac", "segment_0001.flac", "segment_0002.flac"]
+    assert manifest["duration"] == 2.5
+    assert manifest["dropped_chunks"] == 0
+    frames = [sf.info(os.path.join(tmp_path, "s1", name)).frames for name in manifest["segments"]]
+    assert frames == [16000, 16000, 8000]
+
+
+def test_full_writer_queue_drops_audio_not_control(tmp_path, monkeypatch):
+    monkeypatch.setattr(recorder, "RECORDING_DIR", str(tmp_path))
+    monkeypatch.setattr(recorder, "RECORDING_QUEUE_MAX_CHUNKS", 2)
+    writer = RecordingWriter()
+    monkeypatch.setattr(recorder, "writer", writer)
+    # A slow disk: the writer thread stalls on the first chunk
+    disk = threading.Event()
+    write = recorder._SegmentedFile.write
+
+    def slow_write(self, audio_bytes):
+        disk.wait(5)
+        write(self, audio_bytes)
+
+    monkeypatch.setattr(recorder._SegmentedFile, "write", slow_write)
+
+    async def run():
+        session = SessionRecorder("s1", "42")
+        await session.open()
+        session.write(_pcm(0.1))
+        while not writer._queue.empty():
+            await asyncio.sleep(0.01)
+        for _ in range(5):
+            session.write(_pcm(0.1))
+        disk.set()
+        await session.close()
+        return session.dropped_chunks
+
+    assert asyncio.run(run()) == 3
+    manifest = recorder.load_manifest("s1")
+    assert manifest["dropped_chunks"] == 3
+    assert round(manifest["duration"], 3) == 0.3
+
+
+def test_recording_dir_rejects_unsafe_session_ids():
+    for session_id in ("../etc", "..", "a/b", ""):
+        try:
+            recorder.recording_dir(session_id)
+        except ValueError:
+            continue
+        raise AssertionError(session_id)
+
+
+def test_submit_joins_segments_for_batch_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(recorder, "RECORDING_DIR", str(tmp_path))
+    monkeypatch.setattr(recorder, "RECORDING_SEGMENT_SECONDS", 1)
+    monkeypatch.setattr(recorder, "writer", RecordingWriter())
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"job_id": "j1"})
+
+    client = httpx.AsyncClient
+    monkeypatch.setattr(recorder.httpx, "AsyncClient", lambda: client(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        session = SessionRecorder("s1", "42")
+        await session.open()
+        session.write(_pcm(1.5))
+        await session.close()
+        return await recorder.submit_recording("s1", "http://callback")
+
+    assert asyncio.run(run()) == {"job_id": "j1"}
+    assert requests[0].url.path == "/transcribe"
+    body = requests[0].read()
+    assert b'name="meeting_id"\r\n\r\n42' in body and b"http://callback" in body
+    assert sf.info(os.path.join(tmp_path, "s1", "full.flac")).frames == 24000
@@ -0,0 +1,70 @@
+"""Fixed-size re-framing of bot audio."""
+import asyncio
+
+import router_session
+from reframer import Reframer
+from router_session import BackendLink, RouterSession
+from fakes import FakeBackendSocket, FakeBotSocket
+
+
+def test_push_emits_complete_frames_and_keeps_remainder():
+    reframer = Reframer(100)
+    assert reframer.push(bytes(60)) == []
+    assert reframer.pending_since is not None
+    frames = reframer.push(bytes(range(90)))
+    assert frames == [bytes(60) + bytes(range(40))]
+    assert reframer.flush() == bytes(range(40, 90))
+    assert reframer.flush() is None and reframer.pending_since is None
+
+
+def test_frames_stay_sample_aligned():
+    reframer = Reframer(101)
+    assert reframer.frame_bytes == 100
+    assert [len(frame) for frame in reframer.push(bytes(250))] == [100, 100]
+
+
+def test_exact_fill_leaves_nothing_pending():
+    reframer = Reframer(100)
+    assert len(reframer.push(bytes(200))) == 2
+    assert reframer.pending_since is None
+
+
+def _session_with_link(name="whisper"):
+    session = RouterSession("s1", "1", FakeBotSocket())
+    backend = FakeBackendSocket()
+    link = BackendLink(name, backend, None)
+    session.links = {name: link}
+    session.primary = name
+    return session, link, backend
+
+
+def test_stop_sends_partial_frame_before_stop(monkeypatch):
+    monkeypatch.setattr(router_session, "SILENCE_TOLERANT_BACKENDS", [])
+    frame = router_session.REFRAME_MS * router_session.AUDIO_BYTES_PER_SECOND // 1000
+
+    async def run():
+        session, _, backend = _session_with_link()
+        for _ in range(3):
+            await session.send_audio(bytes(frame // 2 + 10))
+        await session.send_stop('{"type": "stop_recording"}')
+        return backend.sent
+
+    sent = asyncio.run(run())
+    assert [len(item) for item in sent[:-1]] == [frame, frame // 2 + 30]
+    assert sent[-1] == '{"type": "stop_recording"}'
+
+
+def test_flush_timer_sends_only_stale_partial_frames(monkeypatch):
+    monkeypatch.setattr(router_session, "SILENCE_TOLERANT_BACKENDS", [])
+
+    async def run():
+        session, link, backend = _session_with_link()
+        await session.send_audio(bytes(320))
+        await session._flush_link(link, 60)
+        held = list(backend.sent)
+        await session._flush_link(link, 0)
+        return held, backend.sent
+
+    held, sent = asyncio.run(run())
+    assert held == []
+    assert sent == [bytes(320)]
@@ -0,0 +1,38 @@
+"""Replica selection and per-session failover across replicas."""
+import asyncio
+
+import router_session
+from replicas import ReplicaPool
+from fakes import FakeBackendSocket
+
+
+def test_acquire_skips_excluded_replicas():
+    pool = ReplicaPool("whisper", ["http://a", "http://b"])
+    first, second = pool.replicas
+    assert pool.acquire(exclude={"http://a"}) is second
+    assert pool.acquire(preferred=first, exclude={"http://a"}) is second
+    assert pool.acquire(exclude={"http://a", "http://b"}) is None
+
+
+def test_connect_fails_over_to_next_replica(monkeypatch):
+    # Nothing listens on port 1: the first replica refuses the connection
+    refusing, healthy = "http://127.0.0.1:1", "http://healthy-replica"
+    pool = ReplicaPool("whisper", [refusing, healthy])
+    monkeypatch.setitem(router_session.pools, "whisper", pool)
+    monkeypatch.setattr(router_session, "MUX_BACKENDS", [])
+    real_open = router_session._open_backend_session
+    attempts = []
+
+    async def open_backend_session(name, base_url, meeting_id, encoding):
+        attempts.append(base_url)
+        if base_url == healthy:
+            return FakeBackendSocket()
+        return await real_open(name, base_url, meeting_id, encoding)
+
+    monkeypatch.setattr(router_session, "_open_backend_session", open_backend_session)
+    ws, name, replica = asyncio.run(router_session.connect_backend("whisper", "s1", "1"))
+
+    assert attempts == [refusing, healthy]
+    assert isinstance(ws, FakeBackendSocket) and replica.url == healthy
+    assert [r.local_sessions for r in pool.replicas] == [0, 1]
+    assert pool.replicas[0].consecutive_failures == 1
@@ -0,0 +1,189 @@
+"""RouterSession behaviour with in-memory bot and backend sockets."""
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+import router_session
+from replicas import ReplicaPool
+from router_session import BackendLink, RouterSession
+from fakes import FakeBackendSocket, FakeBotSocket
+
+
+def _transcript(start, end):
+    return json.dumps({
+        "type": "transcript",
+        "data": {"is_final": False, "utterance": {"text": "hi", "start": start, "end": end,
+                                                  "words": [{"word": "hi", "start": start, "end": end}]}},
+    })
+
+
+def test_failed_connect_closes_session(monkeypatch):
+    closed = []
+
+    async def connect(self):
+        return False
+
+    async def close(self):
+        closed.append(self.session_id)
+
+    monkeypatch.setattr(RouterSession, "connect", connect)
+    monkeypatch.setattr(RouterSession, "close", close)
+    with TestClient(main.app).websocket_connect("/v2/live?id=s1") as ws:
+        with pytest.raises(WebSocketDisconnect):
+            ws.receive_text()
+    assert closed == ["s1"]
+
+
+def test_reconnected_primary_forwards_session_times(monkeypatch):
+    monkeypatch.setattr(router_session, "FAILOVER_RECONNECT", False)
+    bot = FakeBotSocket()
+    backend = FakeBackendSocket([_transcript(1.0, 2.5), json.dumps({"type": "info"})])
+
+    async def run():
+        session = RouterSession("s1", "1", bot)
+        link = BackendLink("voxtral", backend, None)
+        link.audio_offset = 30.0
+        session.links = {"voxtral": link}
+        session.primary = "voxtral"
+        await session._forward_backend_messages(link, backend)
+
+    asyncio.run(run())
+    utterance = json.loads(bot.sent[0])["data"]["utterance"]
+    assert (utterance["start"], utterance["end"]) == (31.0, 32.5)
+    assert (utterance["words"][0]["start"], utterance["words"][0]["end"]) == (31.0, 32.5)
+    assert json.loads(bot.sent[1]) == {"type": "info"}
+
+
+def test_reconnect_replays_buffer_from_its_session_time(monkeypatch):
+    monkeypatch.setattr(router_session, "FAILOVER_RECONNECT", False)
+    monkeypatch.setattr(router_session, "REFRAME_MS", 0)
+    chunk_bytes = router_session.AUDIO_BYTES_PER_SECOND // 10
+    chunks = [bytes([i]) * chunk_bytes for i in range(6)]
+    old, new = FakeBackendSocket(), FakeBackendSocket()
+    pool = ReplicaPool("whisper", ["http://a", "http://b"])
+    monkeypatch.setitem(router_session.pools, "whisper", pool)
+    replica_a, replica_b = pool.replicas
+    connects = []
+
+    async def connect_backend(name, session_id, meeting_id, encoding="wav/pcm", preferred=None):
+        connects.append(preferred)
+        return new, name, pool.acquire(replica_b)
+
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(router_session, "connect_backend", connect_backend)
+    monkeypatch.setattr(router_session.asyncio, "sleep", no_sleep)
+
+    async def run():
+        session = RouterSession("s1", "1", FakeBotSocket())
+        # Room for the last three chunks only: the backend, lost after the first, misses two for good
+        session._audio_buffer_max_bytes = 3 * chunk_bytes
+        link = BackendLink("whisper", old, replica_a)
+        link.connected = False
+        link.next_seq = 1
+        session.links = {"whisper": link}
+        for chunk in chunks:
+            session._buffer_audio(chunk)
+            session.stats.on_audio(len(chunk))
+        await session._reconnect(link)
+        link.forward_task.cancel()
+        return link
+
+    link = asyncio.run(run())
+    assert connects == [replica_a]
+    assert link.connected and link.ws is new and link.replica is replica_b
+    assert new.sent == chunks[3:]
+    assert link.next_seq == len(chunks)
+    # Backend time 0 is the first replayed chunk, 0.3s into the session
+    assert link.audio_offset == pytest.approx(0.3)
+
+
+def test_shift_leaves_other_frames_untouched():
+    assert router_session._shift_transcript('{"type": "init"}', 5.0) == '{"type": "init"}'
+    assert router_session._shift_transcript(b"not json", 5.0) == "not json"
+
+
+class GatedBackendSocket(FakeBackendSocket):
+    """Holds the first audio send until `gate` is set, like a mux channel waiting for credit."""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = asyncio.Event()
+
+    async def send(self, data):
+        if not self.sent and not self.gate.is_set():
+            await self.gate.wait()
+        await super().send(data)
+
+
+def test_flush_timer_waits_for_frames_in_flight():
+    link_frame = router_session.REFRAME_MS * router_session.AUDIO_BYTES_PER_SECOND // 1000
+    pcm = bytes(i % 251 for i in range(2 * link_frame + 1000))
+
+    async def run():
+        session = RouterSession("s1", "1", FakeBotSocket())
+        backend = GatedBackendSocket()
+        link = BackendLink("whisper", backend, None)
+        session.links = {"whisper": link}
+        session.primary = "whisper"
+        audio = asyncio.create_task(session.send_audio(pcm))
+        await asyncio.sleep(0)
+        flush = asyncio.create_task(session._flush_link(link, 0))
+        await asyncio.sleep(0.01)
+        backend.gate.set()
+        await asyncio.gather(audio, flush)
+        return backend.sent
+
+    sent = asyncio.run(run())
+    assert [len(frame) for frame in sent] == [link_frame, link_frame, 1000]
+    assert b"".join(sent) == pcm
+
+
+def _fail_parse(*args, **kwargs):
+    raise AssertionError("transcript frame was parsed")
+
+
+def test_raw_passthrough_forwards_primary_frames_unparsed(monkeypatch):
+    monkeypatch.setattr(router_session, "ROUTER_RAW_PASSTHROUGH", True)
+    monkeypatch.setattr(router_session, "FAILOVER_RECONNECT", False)
+    frames = ['{"type":  "transcript", "data": {"utterance": {"end": 1.5}}}', b'{"type": "info"}']
+    bot = FakeBotSocket()
+
+    async def run():
+        session = RouterSession("s1", "1", bot)
+        primary = BackendLink("whisper", FakeBackendSocket(frames), None)
+        secondary = BackendLink("voxtral", FakeBackendSocket(["not json at all", b"\x00\xff"]), None)
+        session.links = {"whisper": primary, "voxtral": secondary}
+        session.primary = "whisper"
+        monkeypatch.setattr(router_session.json, "loads", _fail_parse)
+        # Secondary first: a finished primary socket counts as lost and triggers failover
+        for link in (secondary, primary):
+            await session._forward_backend_messages(link, link.ws)
+        return session
+
+    session = asyncio.run(run())
+    # Byte-for-byte, whitespace included; bytes frames are sent as text
+    assert bot.sent == [frames[0], frames[1].decode()]
+    assert session.stats.backends["voxtral"].messages == 2
+
+
+def test_parse_mode_reserializes(monkeypatch):
+    monkeypatch.setattr(router_session, "ROUTER_RAW_PASSTHROUGH", False)
+    monkeypatch.setattr(router_session, "FAILOVER_RECONNECT", False)
+    bot = FakeBotSocket()
+    backend = FakeBackendSocket(['{"type":  "info"}'])
+
+    async def run():
+        session = RouterSession("s1", "1", bot)
+        link = BackendLink("whisper", backend, None)
+        session.links = {"whisper": link}
+        session.primary = "whisper"
+        await session._forward_backend_messages(link, backend)
+
+    asyncio.run(run())
+    assert bot.sent == ['{"type": "info"}']
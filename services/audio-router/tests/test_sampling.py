@@ -0,0 +1,46 @@
+"""Shadow routing rules."""
+import datetime
+import os
+import subprocess
+import sys
+
+import sampling
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_bad_rules_are_skipped_at_load(caplog):
+    rules = sampling._load_rules({
+        "voxtral": {"percent": "ten", "meeting_ids": [42], "windows": ["09:00-12:00", "9am-noon", 5]},
+        "whisper": "always",
+        "other": {"windows": "09:00-12:00"},
+    })
+    assert set(rules) == {"voxtral", "other"}
+    assert rules["voxtral"]["meeting_ids"] == {"42"}
+    assert rules["voxtral"]["windows"] == [(datetime.time(9), datetime.time(12))]
+    assert rules["voxtral"]["percent"] == 0.0
+    assert rules["other"]["windows"] == []
+    assert len([r for r in caplog.records if r.levelname == "ERROR"]) == 5
+
+
+def test_shadow_reason_uses_loaded_rules(monkeypatch):
+    monkeypatch.setattr(sampling, "shadow_rules", sampling._load_rules({
+        "voxtral": {"meeting_ids": ["42"], "user_ids": [7], "windows": ["bad"], "percent": 0},
+    }))
+    assert sampling.shadow_reason("whisper", "1") == "no_rule"
+    assert sampling.shadow_reason("voxtral", "42") == "meeting_id"
+    assert sampling.shadow_reason("voxtral", "1", "7") == "user_id"
+    assert sampling.shadow_reason("voxtral", "1") is None
+
+
+def test_invalid_json_means_no_rules(caplog):
+    assert sampling._load_rules(sampling._parse_rules('{"voxtral": {"percent": 10')) == {}
+    assert "invalid JSON" in caplog.text
+    assert sampling._parse_rules('{"voxtral": {"percent": 10}}') == {"voxtral": {"percent": 10}}
+
+
+def test_router_imports_with_invalid_json():
+    env = {**os.environ, "SHADOW_RULES": "{not json"}
+    code = "import sampling; assert sampling.shadow_rules == {}"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
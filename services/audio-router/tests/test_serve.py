@@ -0,0 +1,68 @@
+"""Multi-worker entrypoint (serve.py) lifecycle."""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def _wait(condition, timeout: float = 30) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_sigterm_stops_workers_and_removes_metrics_dir(tmp_path):
+    port = _free_port()
+    env = {**os.environ, "ROUTER_WORKERS": "2", "ROUTER_HOST": "127.0.0.1", "ROUTER_PORT": str(port),
+           "TMPDIR": str(tmp_path)}
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    process = subprocess.Popen([sys.executable, "serve.py"], cwd=SERVICE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    worker_pids = set()
+
+    def both_workers_answer():
+        try:
+            worker_pids.add(httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).json()["workers"]["pid"])
+        except httpx.HTTPError:
+            pass
+        return len(worker_pids) == 2
+
+    try:
+        assert _wait(both_workers_answer), "workers did not come up"
+        metrics_dirs = list(tmp_path.glob("audio-router-metrics-*"))
+        assert len(metrics_dirs) == 1
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    assert _wait(lambda: not any(_pid_alive(pid) for pid in worker_pids), timeout=10)
+    assert not metrics_dirs[0].exists()
+    with socket.socket() as sock:
+        assert sock.connect_ex(("127.0.0.1", port)) != 0
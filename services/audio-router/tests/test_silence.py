@@ -0,0 +1,67 @@
+"""Silence suppression for gap-tolerant backends."""
+import random
+import struct
+
+from config import AUDIO_BYTES_PER_SECOND, SILENCE_MIN_MS, SILENCE_PREROLL_MS, SILENCE_KEEPALIVE_MS
+from silence import SilenceSuppressor
+
+CHUNK_MS = 100
+CHUNK_BYTES = CHUNK_MS * AUDIO_BYTES_PER_SECOND // 1000
+SILENT = bytes(CHUNK_BYTES)
+FORWARDED_CHUNKS = SILENCE_MIN_MS // CHUNK_MS
+PREROLL_CHUNKS = SILENCE_PREROLL_MS // CHUNK_MS
+
+
+def _speech(tag: int = 0) -> bytes:
+    return struct.pack("<h", 3000 + tag) * (CHUNK_BYTES // 4) + struct.pack("<h", -3000) * (CHUNK_BYTES // 4)
+
+
+def _silent(tag: int) -> bytes:
+    # Distinguishable but still well below the RMS threshold
+    return struct.pack("<h", tag % 8) * (CHUNK_BYTES // 2)
+
+
+def _seconds(items) -> float:
+    return sum(len(value) / AUDIO_BYTES_PER_SECOND if kind == "audio" else value for kind, value in items)
+
+
+def test_start_of_silence_is_forwarded():
+    suppressor = SilenceSuppressor()
+    for _ in range(FORWARDED_CHUNKS):
+        assert suppressor.process(SILENT) == [("audio", SILENT)]
+    assert suppressor.process(SILENT) == []
+
+
+def test_resume_sends_gap_then_preroll():
+    suppressor = SilenceSuppressor()
+    for _ in range(FORWARDED_CHUNKS):
+        suppressor.process(SILENT)
+    withheld = [_silent(i) for i in range(PREROLL_CHUNKS + 2)]
+    for chunk in withheld:
+        assert suppressor.process(chunk) == []
+
+    speech = _speech()
+    items = suppressor.process(speech)
+    assert items[0] == ("gap", 2 * CHUNK_MS / 1000)
+    assert items[1:] == [("audio", chunk) for chunk in withheld[-PREROLL_CHUNKS:]] + [("audio", speech)]
+    # Speech resets the silent run: the next silence is forwarded again
+    assert suppressor.process(SILENT) == [("audio", SILENT)]
+
+
+def test_long_silence_emits_keepalive_markers():
+    suppressor = SilenceSuppressor()
+    keepalive_chunks = SILENCE_KEEPALIVE_MS // CHUNK_MS
+    outputs = [suppressor.process(SILENT) for _ in range(FORWARDED_CHUNKS + PREROLL_CHUNKS + 2 * keepalive_chunks)]
+    markers = [(index, items) for index, items in enumerate(outputs) if items and items[0][0] == "gap"]
+    first = FORWARDED_CHUNKS + PREROLL_CHUNKS + keepalive_chunks - 1
+    assert markers == [(first, [("gap", SILENCE_KEEPALIVE_MS / 1000)]),
+                       (first + keepalive_chunks, [("gap", SILENCE_KEEPALIVE_MS / 1000)])]
+
+
+def test_output_covers_input_duration():
+    rng = random.Random(7)
+    suppressor = SilenceSuppressor()
+    chunks = [_speech(i) if rng.random() < 0.2 else SILENT for i in range(2000)]
+    items = [item for chunk in chunks for item in suppressor.process(chunk)]
+    items += suppressor.process(_speech())
+    assert abs(_seconds(items) - (len(chunks) + 1) * CHUNK_MS / 1000) < 1e-6
@@ -0,0 +1,35 @@
+"""Per-worker bookkeeping for multi-worker mode (see serve.py).
+
+serve.py fills in the worker index and a shared array of session counts
+before the app starts; in single-process mode both stay unset.
+"""
+import os
+
+worker_index = 0
+session_counts = None  # multiprocessing.Array('i', workers), shared by all workers
+
+
+def init(index: int, counts):
+    global worker_index, session_counts
+    worker_index = index
+    session_counts = counts
+
+
+def session_started():
+    if session_counts is not None:
+        with session_counts.get_lock():
+            session_counts[worker_index] += 1
+
+
+def session_ended():
+    if session_counts is not None:
+        with session_counts.get_lock():
+            session_counts[worker_index] -= 1
+
+
+def status() -> dict:
+    return {
+        "worker": worker_index,
+        "pid": os.getpid(),
+        "sessions_per_worker": list(session_counts) if session_counts is not None else None,
+    }
@@ -1 +1 @@
-# Shared modules for admin services
+# Modules shared by several services (copied into their images as /app/shared)
@@ -0,0 +1,175 @@
+"""Server side of the audio router's multiplexed protocol (WS /v2/mux), shared by the
+streaming proxies.
+
+One WebSocket from the router carries many sessions. Binary frames are
+[1 byte sid length][sid][audio]; text frames from the router are JSON control
+messages ({"op": "open" | "text" | "stop", "sid": ...}). Session messages go back
+as "<sid>\\n<json>", control replies as JSON ({"op": "opened" | "credit" | "closed" | "error"}).
+
+Each session gets its own queue and task so a slow session never stalls the
+others on the connection: the session itself is created in that task, with its
+frames queueing meanwhile, and credits are granted back as audio is consumed.
+Sessions asking for an encoding the proxy cannot decode are refused with an error
+frame rather than having their audio taken for PCM.
+"""
+import asyncio
+import json
+import logging
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# The binary framing carries the sid length in one byte
+MAX_SID_BYTES = 255
+
+
+class MuxSessionSocket:
+    """Stands in for a per-session WebSocket: sessions only call send_json."""
+
+    def __init__(self, server: "MuxServer", sid: str):
+        self.server = server
+        self.sid = sid
+
+    async def send_json(self, data):
+        await self.server.send_text(f"{self.sid}\n{json.dumps(data)}")
+
+
+class _Channel:
+    def __init__(self, sid: str):
+        self.sid = sid
+        # Set once create_session() completes
+        self.session = None
+        # Bounded by the credit window the router must respect
+        self.queue = asyncio.Queue()
+        self.task = None
+
+
+class MuxServer:
+    def __init__(self, websocket: WebSocket, create_session, sessions: dict, credit_window: int,
+                 encodings=("wav/pcm",)):
+        """`create_session(sid, meeting_id, socket)` is an async factory returning a
+        session with process_audio_chunk(), finalize() and optionally add_gap(); `sessions` is the
+        proxy's registry of live sessions. Each session may have `credit_window` audio frames
+        in flight, and must use one of `encodings`."""
+        self.websocket = websocket
+        self.create_session = create_session
+        self.sessions = sessions
+        self.credit_window = credit_window
+        self.encodings = encodings
+        self.channels = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send_text(self, text: str):
+        async with self._send_lock:
+            await self.websocket.send_text(text)
+
+    async def send_control(self, message: dict):
+        await self.send_text(json.dumps(message))
+
+    async def run(self):
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    self._on_audio(message["bytes"])
+                elif message.get("text") is not None:
+                    await self._on_control(json.loads(message["text"]))
+        finally:
+            # Connection gone: finalize every session it carried
+            for channel in list(self.channels.values()):
+                channel.queue.put_nowait(None)
+            tasks = [channel.task for channel in self.channels.values() if channel.task]
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _on_audio(self, frame: bytes):
+        sid_len = frame[0]
+        sid = frame[1:1 + sid_len].decode()
+        channel = self.channels.get(sid)
+        if channel is None:
+            logger.warning(f"Mux audio for unknown session {sid}")
+            return
+        channel.queue.put_nowait(frame[1 + sid_len:])
+
+    async def _on_control(self, message: dict):
+        op = message.get("op")
+        sid = message.get("sid")
+        if op == "open":
+            await self._open(sid, message.get("meeting_id", "0"), message.get("encoding", "wav/pcm"))
+        elif op == "stop":
+            channel = self.channels.get(sid)
+            if channel:
+                channel.queue.put_nowait(None)
+        elif op == "text":
+            channel = self.channels.get(sid)
+            try:
+                data = json.loads(message.get("data") or "{}")
+            except json.JSONDecodeError:
+                data = {}
+            if channel and data.get("type") == "stop_recording":
+                logger.info(f"Received stop_recording for mux session {sid}")
+                channel.queue.put_nowait(None)
+            elif channel and data.get("type") == "audio_gap":
+                # Queued with the audio so the gap lands at the right point of the stream
+                channel.queue.put_nowait(float(data.get("duration", 0)))
+
+    async def _open(self, sid: str, meeting_id: str, encoding: str):
+        if not sid or sid in self.channels or len(sid.encode()) > MAX_SID_BYTES:
+            await self.send_control({"op": "error", "sid": sid, "reason": "invalid or duplicate sid"})
+            return
+        if encoding not in self.encodings:
+            await self.send_control({"op": "error", "sid": sid, "reason": f"unsupported encoding {encoding!r}"})
+            return
+        # Registered before the session exists so its audio and control messages queue up
+        channel = _Channel(sid)
+        self.channels[sid] = channel
+        channel.task = asyncio.create_task(self._run_channel(channel, meeting_id))
+
+    async def _run_channel(self, channel: _Channel, meeting_id: str):
+        # Created off the receive loop: a slow create_session (e.g. model loading) must not
+        # hold up audio and credits of the other sessions on the connection
+        try:
+            channel.session = await self.create_session(channel.sid, meeting_id, MuxSessionSocket(self, channel.sid))
+        except Exception as e:
+            logger.error(f"Failed to create mux session {channel.sid}: {e}")
+            self.channels.pop(channel.sid, None)
+            try:
+                await self.send_control({"op": "error", "sid": channel.sid, "reason": str(e)})
+            except Exception:
+                pass
+            return
+
+        logger.info(f"New mux session: session={channel.sid}, meeting={meeting_id}")
+        self.sessions[channel.sid] = channel.session
+        consumed = 0
+        try:
+            await self.send_control({"op": "opened", "sid": channel.sid, "credit": self.credit_window})
+            while True:
+                chunk = await channel.queue.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, float):
+                    # Gap markers carry no audio and consume no credit
+                    if hasattr(channel.session, "add_gap"):
+                        channel.session.add_gap(chunk)
+                    continue
+                await channel.session.process_audio_chunk(chunk)
+                consumed += 1
+                # Return credit in batches to keep control traffic low
+                if consumed >= max(1, self.credit_window // 4):
+                    await self.send_control({"op": "credit", "sid": channel.sid, "credit": consumed})
+                    consumed = 0
+        except Exception as e:
+            logger.error(f"Error in mux session {channel.sid}: {e}")
+        finally:
+            await channel.session.finalize()
+            self.channels.pop(channel.sid, None)
+            self.sessions.pop(channel.sid, None)
+            try:
+                await self.send_control({"op": "closed", "sid": channel.sid})
+            except Exception:
+                pass
+            logger.info(f"Mux session {channel.sid} cleaned up")
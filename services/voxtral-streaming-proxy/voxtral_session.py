@@ -35,7 +35,9 @@ class VoxtralSession:
         self.segments = []
         self.full_text = ""
         self._current_start = 0.0
-        self._chunk_count = 0
+        self._audio_bytes = 0
+        # Silence the audio router withheld (audio_gap markers), still part of the meeting clock
+        self._gap_seconds = 0.0
         self._transcribe_task = None
 
     async def start(self):
@@ -79,8 +81,9 @@ class VoxtralSession:
         if not text:
             return
 
-        # Estimate timing based on chunk count (16kHz, typical chunk ~480ms)
-        elapsed = self._chunk_count * 0.48
+        # Estimate timing from the amount of audio received (PCM 16-bit mono @ 16kHz);
+        # chunk sizes vary with the sender (the audio router re-frames them)
+        elapsed = self._audio_bytes / 32000 + self._gap_seconds
         start = max(0, elapsed - 2.0)
         end = elapsed
 
@@ -106,9 +109,13 @@ class VoxtralSession:
 
     async def process_audio_chunk(self, audio_bytes: bytes):
         """Queue an audio chunk for processing."""
-        self._chunk_count += 1
+        self._audio_bytes += len(audio_bytes)
         await self._audio_queue.put(audio_bytes)
 
+    def add_gap(self, seconds: float):
+        """Account for silence the audio router did not forward, keeping timestamps continuous."""
+        self._gap_seconds += max(0.0, seconds)
+
     async def finalize(self):
         """Finalize session and send callback to bot-manager."""
         logger.info(f"Finalizing Voxtral session {self.session_id}")
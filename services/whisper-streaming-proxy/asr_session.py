@@ -1,6 +1,7 @@
 import numpy as np
 import httpx
 import asyncio
+import bisect
 import logging
 from whisper_streaming.whisper_online import FasterWhisperASR, OnlineASRProcessor
 from config import WHISPER_MODEL, LANGUAGE, TRANSCRIPT_SOURCE
@@ -24,8 +25,37 @@ class ASRSession:
         self.segments = []
         self.full_text = ""
 
+        # Whisper timestamps count only the audio it was given; silence the audio router
+        # withheld (audio_gap markers) is still part of the meeting clock. Parallel lists:
+        # audio seconds received when each gap arrived, and total gap seconds from then on.
+        self._audio_bytes = 0
+        self._gap_positions = []
+        self._gap_totals = []
+
+    def add_gap(self, seconds: float):
+        """Account for silence the audio router did not forward, keeping timestamps continuous."""
+        if seconds <= 0:
+            return
+        position = self._audio_bytes / 32000
+        total = (self._gap_totals[-1] if self._gap_totals else 0.0) + seconds
+        if self._gap_positions and self._gap_positions[-1] == position:
+            self._gap_totals[-1] = total
+        else:
+            self._gap_positions.append(position)
+            self._gap_totals.append(total)
+
+    def _meeting_time(self, audio_seconds: float) -> float:
+        """Map a position in the audio Whisper received to the meeting clock."""
+        index = bisect.bisect_right(self._gap_positions, audio_seconds)
+        return audio_seconds + (self._gap_totals[index - 1] if index else 0.0)
+
+    def _with_gaps(self, result):
+        beg, end, text = result
+        return self._meeting_time(beg), self._meeting_time(end), text
+
     async def process_audio_chunk(self, audio_bytes: bytes):
         """Process a PCM 16-bit audio chunk."""
+        self._audio_bytes += len(audio_bytes)
         # Convert PCM int16 to float32
         audio_np = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
 
@@ -36,6 +66,7 @@ class ASRSession:
         result = await asyncio.to_thread(self.online.process_iter)
 
         if result[2]:  # If there's confirmed text
+            result = self._with_gaps(result)
             await self._send_partial_transcript(result)
             self._accumulate_segment(result)
 
@@ -72,7 +103,7 @@ class ASRSession:
         try:
             final = await asyncio.to_thread(self.online.finish)
             if final[2]:
-                self._accumulate_segment(final)
+                self._accumulate_segment(self._with_gaps(final))
         except Exception as e:
             logger.warning(f"Error getting final transcript: {e}")
 
@@ -10,3 +10,9 @@ BOT_MANAGER_URL = os.getenv(
     "http://bot-manager:8080/bots/internal/transcript"
 )
 TRANSCRIPT_SOURCE = os.getenv("TRANSCRIPT_SOURCE", "whisper")
+
+# Advertised on /health so the audio router can balance sessions across replicas
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "0")) or None  # 0 = unbounded
+
+# Audio frames a multiplexed session may have in flight before the router waits for credit
+MUX_CREDIT_WINDOW = int(os.getenv("MUX_CREDIT_WINDOW", "50"))
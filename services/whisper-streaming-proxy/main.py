@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import time
@@ -6,7 +7,8 @@ import uuid
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from asr_session import ASRSession
-from config import BOT_MANAGER_URL
+from shared.mux_server import MuxServer
+from config import BOT_MANAGER_URL, MAX_SESSIONS, MUX_CREDIT_WINDOW
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,7 +23,7 @@ sessions = {}
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "ok"}
+    return {"status": "ok", "active_sessions": len(sessions), "max_sessions": MAX_SESSIONS}
 
 
 @app.post("/v2/live")
@@ -38,9 +40,14 @@ async def create_session():
 async def websocket_endpoint(
     websocket: WebSocket,
     id: str = None,
-    meeting_id: str = "0"
+    meeting_id: str = "0",
+    encoding: str = "wav/pcm"
 ):
     await websocket.accept()
+    if encoding != "wav/pcm":
+        # Audio is decoded as 16 kHz PCM; never misread another encoding as such
+        await websocket.close(code=1003, reason=f"Unsupported encoding: {encoding}")
+        return
 
     session_id = id or f"sess_{int(time.time() * 1000)}"
     callback_url = BOT_MANAGER_URL
@@ -63,6 +70,8 @@ async def websocket_endpoint(
                 if data.get("type") == "stop_recording":
                     logger.info(f"Received stop_recording for session {session_id}")
                     break
+                elif data.get("type") == "audio_gap":
+                    session.add_gap(float(data.get("duration", 0)))
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected: session={session_id}")
     except Exception as e:
@@ -73,6 +82,25 @@ async def websocket_endpoint(
         logger.info(f"Session {session_id} cleaned up")
 
 
+async def _create_mux_session(session_id, meeting_id, socket):
+    # Model loading blocks; keep it off the loop shared by every multiplexed session
+    return await asyncio.to_thread(ASRSession, session_id, meeting_id, socket, BOT_MANAGER_URL)
+
+
+@app.websocket("/v2/mux")
+async def mux_endpoint(websocket: WebSocket):
+    """Multiplexed sessions from the audio router over one persistent connection."""
+    await websocket.accept()
+    logger.info("New mux connection from audio router")
+    try:
+        await MuxServer(websocket, _create_mux_session, sessions, MUX_CREDIT_WINDOW).run()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error in mux connection: {e}")
+    logger.info("Mux connection closed")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8085)
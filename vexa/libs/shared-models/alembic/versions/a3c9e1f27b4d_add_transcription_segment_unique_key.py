@@ -0,0 +1,40 @@
+"""Add unique key on transcription segments
+
+Revision ID: a3c9e1f27b4d
+Revises: 5befe308fa8b
+Create Date: 2026-10-19 10:12:41.305127
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c9e1f27b4d'
+down_revision = '5befe308fa8b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Drop duplicates left by re-flushed segments, keeping the most recent row of each
+    op.execute(
+        """
+        DELETE FROM transcriptions t
+        USING transcriptions newer
+        WHERE t.meeting_id = newer.meeting_id
+          AND t.session_uid IS NOT DISTINCT FROM newer.session_uid
+          AND t.start_time = newer.start_time
+          AND t.id < newer.id
+        """
+    )
+    # NULLS NOT DISTINCT (PostgreSQL 15+) so segments without a session_uid are deduplicated too
+    op.create_unique_constraint(
+        'uq_transcription_meeting_session_start',
+        'transcriptions',
+        ['meeting_id', 'session_uid', 'start_time'],
+        postgresql_nulls_not_distinct=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_transcription_meeting_session_start', 'transcriptions', type_='unique')
@@ -98,8 +98,12 @@ class Transcription(Base):
     
     session_uid = Column(String, nullable=True, index=True) # Link to the specific bot session
 
-    # Index for efficient querying by meeting_id and start_time
-    __table_args__ = (Index('ix_transcription_meeting_start', 'meeting_id', 'start_time'),)
+    # Index for efficient querying by meeting_id and start_time; the unique key makes segment writes idempotent (upserts)
+    __table_args__ = (
+        Index('ix_transcription_meeting_start', 'meeting_id', 'start_time'),
+        UniqueConstraint('meeting_id', 'session_uid', 'start_time', name='uq_transcription_meeting_session_start',
+                         postgresql_nulls_not_distinct=True),
+    )
 
 # New table to store session start times
 class MeetingSession(Base):
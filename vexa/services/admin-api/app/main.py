@@ -11,6 +11,8 @@ from typing import List # Import List for response model
 from datetime import datetime # Import datetime
 from sqlalchemy import func
 from pydantic import BaseModel, HttpUrl
+import json
+import redis.asyncio as aioredis
 
 # Import shared models and schemas
 from shared_models.models import User, APIToken, Base, Meeting # Import Base for init_db and Meeting
@@ -29,6 +31,11 @@ logger = logging.getLogger("admin_api")
 # App initialization
 app = FastAPI(title="Vexa Admin API")
 
+# Redis is only used to tell the transcription-collector about revoked tokens
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+LOOKUP_CACHE_INVALIDATION_CHANNEL = os.environ.get("LOOKUP_CACHE_INVALIDATION_CHANNEL", "collector:lookup_cache_invalidation")
+redis_client = None
+
 # --- Pydantic Schemas for new endpoint ---
 class WebhookUpdate(BaseModel):
     webhook_url: HttpUrl
@@ -295,9 +302,17 @@ async def delete_token(token_id: int, db: AsyncSession = Depends(get_db)):
         )
         
     # Delete the token
+    token_value = db_token.token
     await db.delete(db_token)
     await db.commit()
     logger.info(f"Admin deleted token ID: {token_id}")
+
+    # The collector caches token -> user lookups; drop the revoked token right away
+    if redis_client:
+        try:
+            await redis_client.publish(LOOKUP_CACHE_INVALIDATION_CHANNEL, json.dumps({"type": "token", "token": token_value}))
+        except Exception as e:
+            logger.warning(f"Failed to publish cache invalidation for token ID {token_id}: {e}")
     # No body needed for 204 response
     return 
 
@@ -345,7 +360,18 @@ async def startup_event():
     logger.info("Admin API starting up. Skipping automatic DB initialization.")
     # The 'migrate-or-init' Makefile target is now responsible for all DB setup.
     # await init_db()
-    pass
+    global redis_client
+    try:
+        redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+        await redis_client.ping()
+    except Exception as e:
+        logger.error(f"Failed to connect to Redis at {REDIS_URL}, token revocations will not reach the collector cache: {e}")
+        redis_client = None
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if redis_client:
+        await redis_client.close()
 
 # Include the admin router
 app.include_router(admin_router)
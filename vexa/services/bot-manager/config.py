@@ -4,6 +4,9 @@ REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
 BOT_IMAGE_NAME = os.environ.get("BOT_IMAGE_NAME", "vexa-bot:dev")
 DOCKER_NETWORK = os.environ.get("DOCKER_NETWORK", "vexa_default")
 
+# Channel the transcription-collector listens on to drop cached meeting lookups
+LOOKUP_CACHE_INVALIDATION_CHANNEL = os.environ.get("LOOKUP_CACHE_INVALIDATION_CHANNEL", "collector:lookup_cache_invalidation")
+
 # Lock settings
 LOCK_TIMEOUT_SECONDS = 300 # 5 minutes
 LOCK_PREFIX = "bot_lock:"
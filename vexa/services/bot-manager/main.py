@@ -16,7 +16,7 @@ import httpx
 # from app.database.service import TranscriptionService # Not used here
 # from app.tasks.monitoring import celery_app # Not used here
 
-from config import BOT_IMAGE_NAME, REDIS_URL
+from config import BOT_IMAGE_NAME, REDIS_URL, LOOKUP_CACHE_INVALIDATION_CHANNEL
 from docker_utils import get_socket_session, close_docker_client, start_bot_container, stop_bot_container, _record_session_start, get_running_bots_status, verify_container_running
 from shared_models.database import init_db, get_db, async_session_local
 from shared_models.models import User, Meeting, MeetingSession, Transcription # <--- ADD MeetingSession and Transcription import
@@ -257,6 +257,17 @@ async def request_bot(
             await db.refresh(new_meeting)
             meeting_id_for_bot = new_meeting.id
             logger.info(f"Created new meeting record with ID: {meeting_id_for_bot}")
+            # The collector caches the latest meeting per (user, platform, native ID); point it at the new one
+            if redis_client:
+                try:
+                    await redis_client.publish(LOOKUP_CACHE_INVALIDATION_CHANNEL, json.dumps({
+                        "type": "meeting",
+                        "user_id": current_user.id,
+                        "platform": req.platform.value,
+                        "native_meeting_id": native_meeting_id
+                    }))
+                except Exception as e:
+                    logger.warning(f"Failed to publish meeting cache invalidation for meeting {meeting_id_for_bot}: {e}")
     else: # This case should ideally not be reached if the 409 was raised correctly above.
           # This implies existing_meeting was found and its container was running.
         logger.error(f"Logic error: Should have raised 409 for existing meeting {existing_meeting.id}, but proceeding.")
@@ -23,6 +23,8 @@ from shared_models.schemas import (
 from config import IMMUTABILITY_THRESHOLD
 from filters import TranscriptionFilter
 from api.auth import get_current_user
+from streaming.consumer import get_consumer_stats
+from background.db_writer import flush_stats
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -150,6 +152,23 @@ async def health_check(request: Request, db: AsyncSession = Depends(get_db)):
         timestamp=datetime.now().isoformat()
     )
 
+@router.get("/internal/consumers",
+            summary="[Internal] Stream consumer lag and pending counts",
+            include_in_schema=False)
+async def get_consumers_internal(request: Request):
+    """Group lag and pending entries per stream, with pending count and idle time per consumer (replica)."""
+    redis_c = getattr(request.app.state, 'redis_client', None)
+    if not redis_c:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Redis client not initialized")
+    return await get_consumer_stats(redis_c)
+
+@router.get("/internal/flush",
+            summary="[Internal] Redis-to-PostgreSQL flush cycle stats of this replica",
+            include_in_schema=False)
+async def get_flush_internal():
+    """Duration of the last flush cycle, meetings leased by this replica and their segment backlog in Redis."""
+    return flush_stats
+
 @router.get("/meetings", 
             response_model=MeetingListResponse,
             summary="Get list of all meetings for the current user",
@@ -381,8 +400,8 @@ async def delete_meeting(
     if redis_c:
         try:
             hash_key = f"meeting:{internal_meeting_id}:segments"
-            await redis_c.delete(hash_key)
-            logger.debug(f"[API] Deleted Redis hash {hash_key}")
+            await redis_c.delete(hash_key, f"meeting:{internal_meeting_id}:segment_updates", f"meeting:{internal_meeting_id}:segment_hashes")
+            logger.debug(f"[API] Deleted Redis hash {hash_key} and its index keys")
         except Exception as e:
             logger.error(f"[API] Failed to delete Redis data for meeting {internal_meeting_id}: {e}")
     
@@ -1,20 +1,39 @@
 import logging
 import json
 import asyncio
+import time
+import zlib
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Set
+from typing import Any, Optional, Dict, List, Set, Tuple
 
 import redis # For redis.exceptions
 import redis.asyncio as aioredis
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from shared_models.database import async_session_local
 from shared_models.models import Transcription
-# No schemas needed directly by these functions as they create Transcription objects
-from config import BACKGROUND_TASK_INTERVAL, IMMUTABILITY_THRESHOLD, REDIS_SPEAKER_EVENT_KEY_PREFIX
+from config import (
+    BACKGROUND_TASK_INTERVAL,
+    IMMUTABILITY_THRESHOLD,
+    REDIS_SEGMENT_TTL,
+    REDIS_SPEAKER_EVENT_KEY_PREFIX,
+    DB_INSERT_CHUNK_SIZE,
+    CONSUMER_NAME,
+    FLUSH_CONCURRENCY,
+    FLUSH_LEASE_TTL,
+    FLUSH_REPLICAS_KEY,
+    FLUSH_MAX_IDLE_INTERVAL,
+    FLUSH_MIN_INTERVAL,
+    FLUSH_WAKEUP_CHANNEL,
+    FLUSH_SCHEDULE_KEY
+)
 from filters import TranscriptionFilter
+from streaming.segment_store import delete_segments
 # Speaker re-mapping before persistence
+from mapping.speaker_timeline import fetch_speaker_timeline_versions
 from mapping.speaker_mapper import (
-    get_speaker_mapping_for_segment,
+    get_speaker_mappings_for_segments,
     STATUS_MAPPED,
     STATUS_UNKNOWN,
     STATUS_NO_SPEAKER_EVENTS,
@@ -24,178 +43,516 @@ from mapping.speaker_mapper import (
 
 logger = logging.getLogger(__name__)
 
+# Last flush cycle of this replica, served by GET /internal/flush. backlog: meeting id -> segments still in Redis
+flush_stats: Dict[str, Any] = {"backlog": {}}
+
+# Meetings are flushed by the replica holding their lease (flush_lease:{meeting_id} = owner, with a TTL).
+# The owner renews it every cycle, so ownership is sticky (keeping the filter's per-meeting cache useful)
+# and moves to another replica only once a dead owner's lease expires. Upserts keep an overlap harmless.
+# A replica holds at most `cap` leases, its fair share, so a replica that starts first (or has just
+# outlived the others) does not keep every meeting once the rest are up.
+# KEYS: lease keys, in the caller's order of preference. ARGV: owner, ttl ms, cap.
+# Renews the caller's leases, releasing those past the cap, then takes free ones up to the cap.
+# Returns 1 or 0 per key: whether the caller holds that lease.
+ACQUIRE_FLUSH_LEASES_LUA = """
+local cap, count, held = tonumber(ARGV[3]), 0, {}
+for i, key in ipairs(KEYS) do
+    held[i] = 0
+    if redis.call('GET', key) == ARGV[1] then
+        if count < cap then
+            redis.call('PEXPIRE', key, ARGV[2])
+            held[i] = 1
+            count = count + 1
+        else
+            redis.call('DEL', key)
+        end
+    end
+end
+for i, key in ipairs(KEYS) do
+    if count >= cap then
+        break
+    end
+    if held[i] == 0 and redis.call('SET', key, ARGV[1], 'NX', 'PX', ARGV[2]) then
+        held[i] = 1
+        count = count + 1
+    end
+end
+return held
+"""
+# KEYS: lease key. ARGV: owner. Deletes the lease only if the caller holds it.
+RELEASE_FLUSH_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_owned_leases: Set[str] = set()
+
+# Set by listen_for_flush_wakeups when a consumer stores final segments, to flush them without waiting
+flush_wakeup = asyncio.Event()
+
+def _flush_lease_key(meeting_id_str: str) -> str:
+    return f"flush_lease:{meeting_id_str}"
+
+async def _heartbeat(redis_c: aioredis.Redis) -> int:
+    """Records this replica in FLUSH_REPLICAS_KEY and returns the number of live replicas, itself included."""
+    now = time.time()
+    async with redis_c.pipeline(transaction=False) as pipe:
+        pipe.zadd(FLUSH_REPLICAS_KEY, {CONSUMER_NAME: now})
+        pipe.zremrangebyscore(FLUSH_REPLICAS_KEY, "-inf", f"({now - FLUSH_LEASE_TTL}")
+        pipe.zcard(FLUSH_REPLICAS_KEY)
+        _, _, live_replicas = await pipe.execute()
+    return max(1, live_replicas)
+
+async def _acquire_flush_leases(redis_c: aioredis.Redis, meeting_ids: List[str], cap: int) -> List[str]:
+    """Acquires or renews the flush leases of up to `cap` of the given meetings, in one script call;
+    returns those held. Each replica prefers meetings in its own pseudo-random order (rendezvous
+    hashing on owner and meeting), so replicas picking up free meetings rarely contend for the same ones."""
+    if not meeting_ids:
+        _owned_leases.clear()
+        return []
+    preferred = sorted(meeting_ids, key=lambda meeting_id_str: zlib.crc32(f"{CONSUMER_NAME}:{meeting_id_str}".encode()))
+    held = await redis_c.register_script(ACQUIRE_FLUSH_LEASES_LUA)(
+        keys=[_flush_lease_key(meeting_id_str) for meeting_id_str in preferred],
+        args=[CONSUMER_NAME, FLUSH_LEASE_TTL * 1000, cap],
+    )
+    owned = [meeting_id_str for meeting_id_str, ok in zip(preferred, held) if ok]
+    _owned_leases.clear()
+    _owned_leases.update(owned)
+    return owned
+
+async def _release_flush_lease(redis_c: aioredis.Redis, meeting_id_str: str):
+    await redis_c.register_script(RELEASE_FLUSH_LEASE_LUA)(keys=[_flush_lease_key(meeting_id_str)], args=[CONSUMER_NAME])
+    _owned_leases.discard(meeting_id_str)
+
+async def _release_all_flush_leases(redis_c: aioredis.Redis):
+    """Hands this replica's meetings over on shutdown instead of leaving them until the leases expire."""
+    try:
+        await redis_c.zrem(FLUSH_REPLICAS_KEY, CONSUMER_NAME)
+        for meeting_id_str in list(_owned_leases):
+            await _release_flush_lease(redis_c, meeting_id_str)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Could not release flush leases on shutdown: {e}")
+
 # This helper is used by process_redis_to_postgres
-def create_transcription_object(meeting_id: int, start: float, end: float, text: str, language: Optional[str], session_uid: Optional[str], mapped_speaker_name: Optional[str]) -> Transcription:
-    """Creates a Transcription ORM object without adding/committing."""
-    return Transcription(
+def create_transcription_row(meeting_id: int, start: float, end: float, text: str, language: Optional[str], session_uid: Optional[str], mapped_speaker_name: Optional[str]) -> Dict[str, Any]:
+    """Creates the column values of one `transcriptions` row, for a Core bulk INSERT."""
+    return dict(
         meeting_id=meeting_id,
         start_time=start,
         end_time=end,
         text=text,
         speaker=mapped_speaker_name,
         language=language,
-        session_uid=session_uid, 
+        session_uid=session_uid,
         created_at=datetime.utcnow()
     )
 
+async def _postpone_segments(redis_c: aioredis.Redis, segments_by_meeting: Dict[int, Set[str]], due_at: float):
+    """Moves the due time of segments left in Redis to `due_at`, unless a newer update already set a later one."""
+    for meeting_id, start_times in segments_by_meeting.items():
+        if start_times:
+            await redis_c.zadd(f"meeting:{meeting_id}:segment_updates", dict.fromkeys(start_times, due_at), xx=True, gt=True)
+
+async def store_transcription_rows(db: AsyncSession, redis_c: aioredis.Redis, rows_to_store: List[Tuple[int, str, Dict[str, Any]]]) -> int:
+    """Persists (meeting_id, segment key, row) items with multi-row Core upserts of
+    DB_INSERT_CHUNK_SIZE rows, one transaction per chunk, and removes each chunk's segments
+    from Redis once it is committed. A failed chunk is rolled back and stays in Redis, its due
+    times pushed back by BACKGROUND_TASK_INTERVAL so the retry does not hammer the database. Upserting on (meeting_id, session_uid, start_time) makes re-flushing a segment
+    (e.g. after a crash between commit and HDEL) update its row instead of duplicating it.
+    Returns the number of rows stored."""
+    stored = 0
+    commit_latencies_ms = []
+    started = time.monotonic()
+    for chunk_start in range(0, len(rows_to_store), DB_INSERT_CHUNK_SIZE):
+        chunk = rows_to_store[chunk_start:chunk_start + DB_INSERT_CHUNK_SIZE]
+        try:
+            # Rows of a chunk never share a key: segment keys are unique per meeting hash
+            stmt = insert(Transcription).values([row for _, _, row in chunk])
+            stmt = stmt.on_conflict_do_update(
+                constraint='uq_transcription_meeting_session_start',
+                set_={column: stmt.excluded[column] for column in ('end_time', 'text', 'speaker', 'language')}
+            )
+            await db.execute(stmt)
+            commit_started = time.monotonic()
+            await db.commit()
+            commit_latencies_ms.append((time.monotonic() - commit_started) * 1000)
+        except Exception as e:
+            logger.error(f"Error inserting chunk of {len(chunk)} segments to PostgreSQL: {e}", exc_info=True)
+            await db.rollback()
+            failed_segments: Dict[int, Set[str]] = {}
+            for meeting_id, start_time_str, _ in chunk:
+                failed_segments.setdefault(meeting_id, set()).add(start_time_str)
+            try:
+                await _postpone_segments(redis_c, failed_segments, time.time() + BACKGROUND_TASK_INTERVAL)
+            except redis.exceptions.RedisError as redis_err:
+                logger.error(f"Could not postpone {len(chunk)} unstored segments: {redis_err}")
+            continue
+        stored += len(chunk)
+
+        committed_segments: Dict[int, Set[str]] = {}
+        for meeting_id, start_time_str, _ in chunk:
+            committed_segments.setdefault(meeting_id, set()).add(start_time_str)
+        try:
+            await delete_segments(redis_c, committed_segments)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Stored {len(chunk)} segments but failed to remove them from Redis: {e}", exc_info=True)
+
+    elapsed = time.monotonic() - started
+    if commit_latencies_ms:
+        logger.info(
+            f"Stored {stored}/{len(rows_to_store)} segments to PostgreSQL in {len(commit_latencies_ms)} chunk(s): "
+            f"{stored / elapsed if elapsed > 0 else float(stored):.0f} rows/s, commit latency "
+            f"avg {sum(commit_latencies_ms) / len(commit_latencies_ms):.1f} ms, max {max(commit_latencies_ms):.1f} ms"
+        )
+    return stored
+
+async def _index_unindexed_segments(redis_c: aioredis.Redis, hash_key: str, updates_key: str):
+    """Adds segments missing from the meeting's update index (written before it existed) with their
+    due time, or 0 when it cannot be read so the usual checks handle them on the next scan."""
+    segment_updates: Dict[str, float] = {}
+    for start_time_str, segment_json in (await redis_c.hgetall(hash_key)).items():
+        try:
+            segment_data = json.loads(segment_json)
+            updated_at_str = segment_data['updated_at']
+            if updated_at_str.endswith('Z'):
+                updated_at_str = updated_at_str[:-1] + '+00:00'
+            segment_updated_at = datetime.fromisoformat(updated_at_str)
+            if segment_updated_at.tzinfo is None:
+                segment_updated_at = segment_updated_at.replace(tzinfo=timezone.utc)
+            segment_updates[start_time_str] = segment_updated_at.timestamp() + (0 if segment_data.get("final") else IMMUTABILITY_THRESHOLD)
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError, AttributeError):
+            segment_updates[start_time_str] = 0
+    if segment_updates:
+        # nx: never overwrite a score written by a newer update
+        await redis_c.zadd(updates_key, segment_updates, nx=True)
+        await redis_c.expire(updates_key, REDIS_SEGMENT_TTL)
+        logger.info(f"Indexed due times of {len(segment_updates)} segment(s) in {updates_key}")
+
+async def _reschedule_meeting(redis_c: aioredis.Redis, meeting_id_str: str, updates_key: str):
+    """Sets the meeting's entry in the flush schedule to its earliest remaining due time, or removes it."""
+    earliest = await redis_c.zrange(updates_key, 0, 0, withscores=True)
+    if earliest:
+        await redis_c.zadd(FLUSH_SCHEDULE_KEY, {meeting_id_str: earliest[0][1]})
+    else:
+        await redis_c.zrem(FLUSH_SCHEDULE_KEY, meeting_id_str)
+
+async def listen_for_flush_wakeups(redis_c: aioredis.Redis):
+    """Background task setting `flush_wakeup` when a consumer publishes on FLUSH_WAKEUP_CHANNEL.
+    A missed message only delays the flush until the scheduled due time."""
+    logger.info(f"Starting flush wakeup listener on channel '{FLUSH_WAKEUP_CHANNEL}'")
+    while True:
+        pubsub = redis_c.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(FLUSH_WAKEUP_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    flush_wakeup.set()
+        except asyncio.CancelledError:
+            logger.info("Flush wakeup listener cancelled.")
+            break
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Redis error in flush wakeup listener: {e}. Resubscribing after delay...")
+            await asyncio.sleep(5)
+        finally:
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+
+async def _flush_meeting(redis_c: aioredis.Redis, local_transcription_filter: TranscriptionFilter, meeting_id_str: str) -> int:
+    """Flushes one meeting's immutable segments from Redis to PostgreSQL. Returns the number of segments stored."""
+    meeting_id = int(meeting_id_str)
+    hash_key = f"meeting:{meeting_id}:segments"
+    updates_key = f"meeting:{meeting_id}:segment_updates"
+    async with redis_c.pipeline(transaction=False) as pipe:
+        pipe.hlen(hash_key)
+        pipe.zcard(updates_key)
+        segment_total, indexed_total = await pipe.execute()
+
+    flush_stats["backlog"][meeting_id_str] = segment_total
+    if not segment_total:
+        # Content hashes stay until the meeting's TTL, so unchanged re-sends are not stored again
+        await redis_c.delete(updates_key)
+        await redis_c.zrem(FLUSH_SCHEDULE_KEY, meeting_id_str)
+        await redis_c.srem("active_meetings", meeting_id_str)
+        local_transcription_filter.clear_processed_segments_cache(meeting_id)
+        await _release_flush_lease(redis_c, meeting_id_str)
+        logger.debug(f"Removed empty meeting {meeting_id} from active meetings set and cleared its filter cache.")
+        return 0
+    if indexed_total < segment_total:
+        await _index_unindexed_segments(redis_c, hash_key, updates_key)
+
+    try:
+        return await _flush_due_segments(redis_c, local_transcription_filter, meeting_id, hash_key, updates_key, segment_total)
+    finally:
+        await _reschedule_meeting(redis_c, meeting_id_str, updates_key)
+
+async def _flush_due_segments(redis_c: aioredis.Redis, local_transcription_filter: TranscriptionFilter, meeting_id: int,
+                              hash_key: str, updates_key: str, segment_total: int) -> int:
+    """Stores the meeting's segments whose due time has passed; the rest of _flush_meeting."""
+    immutability_time = datetime.now(timezone.utc) - timedelta(seconds=IMMUTABILITY_THRESHOLD)
+    # Only segments that are final or whose last update is older than the threshold
+    due_keys = await redis_c.zrangebyscore(updates_key, "-inf", f"({time.time()}")
+    if not due_keys:
+        return 0
+    # Segments leaving Redis without being stored (filtered out, unreadable, stale index entries)
+    segments_to_delete_from_redis: Dict[int, Set[str]] = {}
+    # Segments that cannot be judged until rewritten (no updated_at); parked until their hash expires
+    segments_to_park: Dict[int, Set[str]] = {}
+    batch_to_store: List[Tuple[int, str, Dict[str, Any]]] = [] # (meeting_id, segment key, row)
+    redis_segments_dict = {}
+    for start_time_str, segment_json in zip(due_keys, await redis_c.hmget(hash_key, due_keys)):
+        if segment_json is None:
+            segments_to_delete_from_redis.setdefault(meeting_id, set()).add(start_time_str) # Stale index entry
+        else:
+            redis_segments_dict[start_time_str] = segment_json
+
+    sorted_segment_items = sorted(redis_segments_dict.items(), key=lambda item: float(item[0]))
+
+    logger.debug(f"Processing {len(sorted_segment_items)} of {segment_total} segments from Redis Hash for meeting {meeting_id} (sorted)")
+
+    # Pass 1: parse, keep immutable segments, group the ones needing a final speaker mapping by session
+    immutable_segments = [] # (start_time_str, segment_data), in start time order
+    remap_by_session: Dict[str, list] = {}
+    for start_time_str, segment_json in sorted_segment_items:
+        try:
+            segment_data = json.loads(segment_json)
+            segment_session_uid = segment_data.get("session_uid")
+            if 'updated_at' not in segment_data:
+                 logger.warning(f"Segment {start_time_str} in meeting {meeting_id} hash is missing 'updated_at'. Skipping immutability check.")
+                 segments_to_park.setdefault(meeting_id, set()).add(start_time_str)
+                 continue 
+
+            # Handle 'Z' suffix in timestamps
+            updated_at_str = segment_data['updated_at']
+            if updated_at_str.endswith('Z'):
+                updated_at_str = updated_at_str[:-1] + '+00:00'
+            segment_updated_at = datetime.fromisoformat(updated_at_str)
+            if segment_updated_at.tzinfo is None: 
+                segment_updated_at = segment_updated_at.replace(tzinfo=timezone.utc)
+
+            if segment_data.get("final") or segment_updated_at < immutability_time:
+                # Segment is immutable. Attempt ONE FINAL speaker mapping pass if speaker name is missing or uncertain.
+                mapping_status: str = segment_data.get("speaker_mapping_status", STATUS_UNKNOWN)
+                needs_remap = (
+                    (not segment_data.get("speaker"))
+                    or mapping_status in (STATUS_UNKNOWN, STATUS_NO_SPEAKER_EVENTS, STATUS_ERROR)
+                )
+                if needs_remap and segment_session_uid:
+                    # Validate times now so a bad segment does not fail its whole session's mapping
+                    float(segment_data["end_time"])
+                    remap_by_session.setdefault(segment_session_uid, []).append((start_time_str, segment_data))
+                immutable_segments.append((start_time_str, segment_data))
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+            logger.error(f"Error processing segment {start_time_str} from hash for meeting {meeting_id}: {e}")
+            segments_to_delete_from_redis.setdefault(meeting_id, set()).add(start_time_str)
+
+    # Pass 2: one speaker-event fetch per session for all its segments, skipping
+    # segments already mapped from the session's current speaker timeline
+    remapped_segments: Dict[str, str] = {}
+    try:
+        timeline_versions = await fetch_speaker_timeline_versions(
+            redis_c, REDIS_SPEAKER_EVENT_KEY_PREFIX, list(remap_by_session)
+        )
+    except redis.exceptions.RedisError as version_err:
+        logger.warning(f"[FinalMap] Could not read speaker timeline versions for meeting {meeting_id}, remapping all: {version_err}")
+        timeline_versions = {}
+    skipped_remaps = 0
+    for segment_session_uid, session_items in remap_by_session.items():
+        current_version = timeline_versions.get(segment_session_uid)
+        remap_items = [
+            (start_time_str, segment_data) for start_time_str, segment_data in session_items
+            if current_version is None or segment_data.get("speaker_events_version") != current_version
+        ]
+        skipped_remaps += len(session_items) - len(remap_items)
+        if not remap_items:
+            continue
+        try:
+            mapping_results = await get_speaker_mappings_for_segments(
+                redis_c=redis_c,
+                session_uid=segment_session_uid,
+                segments_ms=[
+                    (float(start_time_str) * 1000.0, float(segment_data["end_time"]) * 1000.0)
+                    for start_time_str, segment_data in remap_items
+                ],
+                config_speaker_event_key_prefix=REDIS_SPEAKER_EVENT_KEY_PREFIX,
+                context_log_msg=f"[FinalMap Meet:{meeting_id}]"
+            )
+            for (start_time_str, segment_data), mapping_result in zip(remap_items, mapping_results):
+                segment_data["speaker"] = mapping_result.get("speaker_name")
+                segment_data["speaker_mapping_status"] = mapping_result.get("status", STATUS_ERROR)
+                segment_data["speaker_events_version"] = mapping_result.get("speaker_events_version")
+                remapped_segments[start_time_str] = json.dumps(segment_data)
+        except Exception as map_err:
+            logger.error(
+                f"[FinalMap] Error remapping speakers for meeting {meeting_id} session {segment_session_uid}: {map_err}",
+                exc_info=True,
+            )
+    if remapped_segments:
+        # Persist new mappings back into Redis so API reflects them while still in Redis
+        await redis_c.hset(hash_key, mapping=remapped_segments)
+        logger.info(f"[FinalMap] Meeting {meeting_id}: remapped {len(remapped_segments)} segment(s)")
+    if skipped_remaps:
+        logger.debug(f"[FinalMap] Meeting {meeting_id}: skipped {skipped_remaps} segment(s) with no new speaker events since their last mapping")
+
+    # Pass 3: filter (order-dependent deduplication) and build rows to insert
+    for start_time_str, segment_data in immutable_segments:
+        try:
+            mapped_speaker_name: Optional[str] = segment_data.get("speaker")
+            segment_session_uid = segment_data.get("session_uid")
+            logger.debug(
+                f"Segment {start_time_str} (UID: {segment_session_uid}) uses speaker: '{mapped_speaker_name}' (status {segment_data.get('speaker_mapping_status')})"
+            )
+
+            # Filter the segment (deduplication, etc.)
+            segment_start_time_float = float(start_time_str)
+            segment_end_time_float = segment_data['end_time']
+
+            if local_transcription_filter.filter_segment(
+                segment_data['text'], 
+                start_time=segment_start_time_float, 
+                end_time=segment_end_time_float, 
+                meeting_id=meeting_id,
+                language=segment_data.get('language')
+            ):
+                transcription_row = create_transcription_row(
+                    meeting_id=meeting_id,
+                    start=segment_start_time_float,
+                    end=segment_end_time_float,
+                    text=segment_data['text'],
+                    language=segment_data.get('language'),
+                    session_uid=segment_session_uid,
+                    mapped_speaker_name=mapped_speaker_name
+                )
+                batch_to_store.append((meeting_id, start_time_str, transcription_row))
+            else:
+                segments_to_delete_from_redis.setdefault(meeting_id, set()).add(start_time_str)
+        except (KeyError, ValueError, TypeError) as e:
+            logger.error(f"Error processing segment {start_time_str} from hash for meeting {meeting_id}: {e}")
+            segments_to_delete_from_redis.setdefault(meeting_id, set()).add(start_time_str)
+
+    if segments_to_delete_from_redis:
+        await delete_segments(redis_c, segments_to_delete_from_redis)
+    if segments_to_park:
+        await _postpone_segments(redis_c, segments_to_park, time.time() + REDIS_SEGMENT_TTL)
+    if not batch_to_store:
+        return 0
+    async with async_session_local() as db:
+        return await store_transcription_rows(db, redis_c, batch_to_store)
+
 async def process_redis_to_postgres(redis_c: aioredis.Redis, local_transcription_filter: TranscriptionFilter):
     """
     Background task that runs periodically to:
-    1. Check for segments in Redis Hashes that are older than IMMUTABILITY_THRESHOLD
-    2. Filter these segments
-    3. Store passing segments in PostgreSQL 
-    4. Remove processed segments from Redis Hashes
+    1. Lease the active meetings this replica flushes, at most its fair share of them (see _acquire_flush_leases)
+    2. Find segments in Redis Hashes that are final or older than IMMUTABILITY_THRESHOLD, through each
+       meeting's segment_updates sorted set (segment key -> due time), and HMGET only those
+    3. Filter these segments
+    4. Store passing segments in PostgreSQL (chunked multi-row upserts)
+    5. Remove processed segments from Redis Hashes
+    Meetings are flushed concurrently, at most FLUSH_CONCURRENCY at a time.
+
+    Cycles run when the earliest due time of a meeting this replica leases is reached, when a consumer
+    publishes a wakeup for final segments, or after the idle interval, which starts at
+    BACKGROUND_TASK_INTERVAL and doubles up to FLUSH_MAX_IDLE_INTERVAL while nothing is stored; meetings
+    no replica leases yet are picked up by the next cycle. A meeting whose flush fails is retried
+    BACKGROUND_TASK_INTERVAL later rather than at its (past) due time.
+    Cycles start at least FLUSH_MIN_INTERVAL apart. Between cycles, the replica's heartbeat and held
+    leases are renewed every FLUSH_LEASE_TTL / 2 so they outlive idle intervals longer than the lease TTL.
     """
-    logger.info("Background Redis-to-PostgreSQL processor started")
-    
+    logger.info(f"Background Redis-to-PostgreSQL processor started (flush lease owner: {CONSUMER_NAME})")
+    semaphore = asyncio.Semaphore(FLUSH_CONCURRENCY)
+
+    async def flush_with_limit(meeting_id_str: str) -> int:
+        async with semaphore:
+            try:
+                return await _flush_meeting(redis_c, local_transcription_filter, meeting_id_str)
+            except Exception as e:
+                logger.error(f"Error processing meeting {meeting_id_str} in Redis-to-PG task: {e}", exc_info=True)
+                try:
+                    await redis_c.zadd(FLUSH_SCHEDULE_KEY, {meeting_id_str: time.time() + BACKGROUND_TASK_INTERVAL}, xx=True, gt=True)
+                except redis.exceptions.RedisError:
+                    pass
+                return 0
+
+    idle_interval = BACKGROUND_TASK_INTERVAL
+    last_cycle_started = 0.0
+    leases_renewed = 0.0
+    idle_until = None # Kept across lease renewals, which do not restart the idle interval
     while True:
         try:
-            await asyncio.sleep(BACKGROUND_TASK_INTERVAL)
+            if idle_until is None:
+                idle_until = time.monotonic() + idle_interval
+            wait = idle_until - time.monotonic()
+            # Only meetings this replica leases: others' due times are theirs to serve
+            if _owned_leases:
+                due_times = [due for due in await redis_c.zmscore(FLUSH_SCHEDULE_KEY, list(_owned_leases)) if due is not None]
+                if due_times:
+                    wait = min(wait, min(due_times) - time.time())
+            # Renew held leases in between if the next cycle could come after they expire
+            renew_wait = leases_renewed + FLUSH_LEASE_TTL / 2 - time.monotonic()
+            renew_only = renew_wait < wait
+            if renew_only:
+                wait = renew_wait
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(flush_wakeup.wait(), wait)
+                    renew_only = False
+                except asyncio.TimeoutError:
+                    pass
+            if renew_only:
+                await _heartbeat(redis_c)
+                await _acquire_flush_leases(redis_c, list(_owned_leases), len(_owned_leases))
+                leases_renewed = time.monotonic()
+                continue
+            idle_until = None
+            # Wakeups arriving during this pause are served by the coming cycle
+            min_interval_left = FLUSH_MIN_INTERVAL - (time.monotonic() - last_cycle_started)
+            if min_interval_left > 0:
+                await asyncio.sleep(min_interval_left)
+            flush_wakeup.clear()
+            last_cycle_started = time.monotonic()
+            idle_interval = min(idle_interval * 2, FLUSH_MAX_IDLE_INTERVAL)
             logger.debug("Background processor checking for immutable segments in Redis Hashes...")
+            cycle_started = time.monotonic()
             
             meeting_ids_raw = await redis_c.smembers("active_meetings")
             if not meeting_ids_raw:
                 logger.debug("No active meetings found in Redis Set")
                 continue
-                
-            meeting_ids = [mid for mid in meeting_ids_raw]
-            logger.debug(f"Found {len(meeting_ids)} active meetings in Redis Set")
-            
-            batch_to_store = []
-            segments_to_delete_from_redis: Dict[int, Set[str]] = {}  
-            
-            async with async_session_local() as db:
-                for meeting_id_str in meeting_ids:
-                    try:
-                        meeting_id = int(meeting_id_str)
-                        hash_key = f"meeting:{meeting_id}:segments"
-                        redis_segments_dict = await redis_c.hgetall(hash_key)
-                        
-                        if not redis_segments_dict:
-                            await redis_c.srem("active_meetings", meeting_id_str)
-                            local_transcription_filter.clear_processed_segments_cache(meeting_id)
-                            logger.debug(f"Removed empty meeting {meeting_id} from active meetings set and cleared its filter cache.")
-                            continue
-
-                        sorted_segment_items = sorted(redis_segments_dict.items(), key=lambda item: float(item[0]))
-                            
-                        logger.debug(f"Processing {len(sorted_segment_items)} segments from Redis Hash for meeting {meeting_id} (sorted)")
-                        immutability_time = datetime.now(timezone.utc) - timedelta(seconds=IMMUTABILITY_THRESHOLD)
-                        
-                        for start_time_str, segment_json in sorted_segment_items:
-                            try:
-                                segment_data = json.loads(segment_json)
-                                segment_session_uid = segment_data.get("session_uid")
-                                if 'updated_at' not in segment_data:
-                                     logger.warning(f"Segment {start_time_str} in meeting {meeting_id} hash is missing 'updated_at'. Skipping immutability check.")
-                                     continue 
-                                
-                                # Handle 'Z' suffix in timestamps
-                                updated_at_str = segment_data['updated_at']
-                                if updated_at_str.endswith('Z'):
-                                    updated_at_str = updated_at_str[:-1] + '+00:00'
-                                segment_updated_at = datetime.fromisoformat(updated_at_str)
-                                if segment_updated_at.tzinfo is None: 
-                                    segment_updated_at = segment_updated_at.replace(tzinfo=timezone.utc)
-                                
-                                if segment_updated_at < immutability_time:
-                                    # Segment is immutable. Attempt ONE FINAL speaker mapping pass if speaker name is missing or uncertain.
-                                    mapped_speaker_name: Optional[str] = segment_data.get("speaker")
-                                    mapping_status: str = segment_data.get("speaker_mapping_status", STATUS_UNKNOWN)
-
-                                    needs_remap = (
-                                        (not mapped_speaker_name)
-                                        or mapping_status in (STATUS_UNKNOWN, STATUS_NO_SPEAKER_EVENTS, STATUS_ERROR)
-                                    )
-
-                                    if needs_remap and segment_session_uid:
-                                        try:
-                                            segment_start_ms = float(start_time_str) * 1000.0
-                                            segment_end_ms = float(segment_data["end_time"]) * 1000.0
-                                            
-                                            context_log = f"[FinalMap Meet:{meeting_id}/Seg:{start_time_str}]"
-                                            mapping_result = await get_speaker_mapping_for_segment(
-                                                redis_c=redis_c,
-                                                session_uid=segment_session_uid,
-                                                segment_start_ms=segment_start_ms,
-                                                segment_end_ms=segment_end_ms,
-                                                config_speaker_event_key_prefix=REDIS_SPEAKER_EVENT_KEY_PREFIX,
-                                                context_log_msg=context_log
-                                            )
-
-                                            mapped_speaker_name = mapping_result.get("speaker_name")
-                                            mapping_status = mapping_result.get("status", STATUS_ERROR)
-                                            
-                                            # Persist new mapping back into Redis so API reflects it while still in Redis
-                                            segment_data["speaker"] = mapped_speaker_name
-                                            segment_data["speaker_mapping_status"] = mapping_status
-                                            await redis_c.hset(hash_key, start_time_str, json.dumps(segment_data))
-
-                                            logger.info(
-                                                f"[FinalMap] Meeting {meeting_id} segment {start_time_str} remapped to '{mapped_speaker_name}' with status {mapping_status}"
-                                            )
-                                        except Exception as map_err:
-                                            logger.error(
-                                                f"[FinalMap] Error remapping speaker for meeting {meeting_id} segment {start_time_str}: {map_err}",
-                                                exc_info=True,
-                                            )
-
-                                    else:
-                                        logger.debug(
-                                            f"Segment {start_time_str} (UID: {segment_session_uid}) uses speaker: '{mapped_speaker_name}' (status {mapping_status})"
-                                        )
-
-                                    # Filter the segment (deduplication, etc.)
-                                    segment_start_time_float = float(start_time_str)
-                                    segment_end_time_float = segment_data['end_time']
-                                    
-                                    if local_transcription_filter.filter_segment(
-                                        segment_data['text'], 
-                                        start_time=segment_start_time_float, 
-                                        end_time=segment_end_time_float, 
-                                        meeting_id=meeting_id,
-                                        language=segment_data.get('language')
-                                    ):
-                                        new_transcription = create_transcription_object(
-                                            meeting_id=meeting_id,
-                                            start=segment_start_time_float,
-                                            end=segment_end_time_float,
-                                            text=segment_data['text'],
-                                            language=segment_data.get('language'),
-                                            session_uid=segment_session_uid,
-                                            mapped_speaker_name=mapped_speaker_name
-                                        )
-                                        batch_to_store.append(new_transcription)
-                                    segments_to_delete_from_redis.setdefault(meeting_id, set()).add(start_time_str)
-                            except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
-                                logger.error(f"Error processing segment {start_time_str} from hash for meeting {meeting_id}: {e}")
-                                segments_to_delete_from_redis.setdefault(meeting_id, set()).add(start_time_str)
-                    except Exception as e:
-                        logger.error(f"Error processing meeting {meeting_id_str} in Redis-to-PG task: {e}", exc_info=True)
-                
-                if batch_to_store:
-                    try:
-                        db.add_all(batch_to_store)
-                        await db.commit()
-                        logger.info(f"Stored {len(batch_to_store)} segments to PostgreSQL from {len(segments_to_delete_from_redis)} meetings")
-                        
-                        for meeting_id, start_times in segments_to_delete_from_redis.items():
-                            if start_times:
-                                hash_key = f"meeting:{meeting_id}:segments"
-                                await redis_c.hdel(hash_key, *start_times)
-                                logger.debug(f"Deleted {len(start_times)} processed segments for meeting {meeting_id} from Redis Hash")
-                    except Exception as e:
-                        logger.error(f"Error committing batch to PostgreSQL: {e}", exc_info=True)
-                        await db.rollback()
-                else:
-                    logger.debug("No segments ready for PostgreSQL storage this interval.")
+
+            live_replicas = await _heartbeat(redis_c)
+            lease_cap = -(-len(meeting_ids_raw) // live_replicas)
+            owned_meeting_ids = await _acquire_flush_leases(redis_c, list(meeting_ids_raw), lease_cap)
+            leases_renewed = time.monotonic()
+            logger.debug(f"Found {len(meeting_ids_raw)} active meetings in Redis Set, {len(owned_meeting_ids)} leased by this replica (fair share {lease_cap} of {live_replicas} replicas)")
+            flush_stats["backlog"] = {}
+            stored = sum(await asyncio.gather(*(flush_with_limit(mid) for mid in owned_meeting_ids)))
+
+            cycle_duration = time.monotonic() - cycle_started
+            flush_stats.update(
+                last_cycle_at=datetime.now(timezone.utc).isoformat(),
+                last_cycle_duration_s=round(cycle_duration, 3),
+                active_meetings=len(meeting_ids_raw),
+                owned_meetings=len(owned_meeting_ids),
+                live_replicas=live_replicas,
+                lease_cap=lease_cap,
+                last_cycle_segments_stored=stored,
+            )
+            if stored:
+                idle_interval = BACKGROUND_TASK_INTERVAL
+            if cycle_duration > BACKGROUND_TASK_INTERVAL:
+                logger.warning(f"Flush cycle took {cycle_duration:.1f}s for {len(owned_meeting_ids)} meetings, longer than BACKGROUND_TASK_INTERVAL ({BACKGROUND_TASK_INTERVAL}s)")
+            elif not stored:
+                logger.debug("No segments ready for PostgreSQL storage this interval.")
         
         except asyncio.CancelledError:
             logger.info("Redis-to-PostgreSQL processor task cancelled")
+            await _release_all_flush_leases(redis_c)
             break
         except redis.exceptions.ConnectionError as e:
              logger.error(f"Redis connection error in Redis-to-PG task: {e}. Retrying after delay...", exc_info=True)
              await asyncio.sleep(5) 
         except Exception as e:
             logger.error(f"Unhandled error in Redis-to-PostgreSQL processor: {e}", exc_info=True)
-            await asyncio.sleep(BACKGROUND_TASK_INTERVAL) 
\ No newline at end of file
+            await asyncio.sleep(BACKGROUND_TASK_INTERVAL) 
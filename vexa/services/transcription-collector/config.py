@@ -1,24 +1,55 @@
 import os
+import socket
+import uuid
 
 # Configuration for Redis Stream consumer
 REDIS_STREAM_NAME = os.environ.get("REDIS_STREAM_NAME", "transcription_segments")
 REDIS_CONSUMER_GROUP = os.environ.get("REDIS_CONSUMER_GROUP", "collector_group")
 REDIS_STREAM_READ_COUNT = int(os.environ.get("REDIS_STREAM_READ_COUNT", "10"))
 REDIS_STREAM_BLOCK_MS = int(os.environ.get("REDIS_STREAM_BLOCK_MS", "2000"))  # 2 seconds
-# Use a fixed consumer name, potentially add hostname later if scaling replicas
-CONSUMER_NAME = os.environ.get("POD_NAME", "collector-main")  # Get POD_NAME from env if avail (k8s), else fixed
-PENDING_MSG_TIMEOUT_MS = 60000  # Milliseconds: Timeout after which pending messages are considered stale (e.g., 1 minute)
+# Consumer names must be unique per replica: POD_NAME (k8s) if set, else hostname plus a random suffix
+CONSUMER_NAME = os.environ.get("POD_NAME") or f"collector-{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+# Max meetings processed in parallel from one XREADGROUP batch (messages of one meeting stay in order)
+STREAM_PROCESSING_CONCURRENCY = int(os.environ.get("STREAM_PROCESSING_CONCURRENCY", "8"))
+PENDING_MSG_TIMEOUT_MS = int(os.environ.get("PENDING_MSG_TIMEOUT_MS", "60000"))  # Milliseconds: Timeout after which pending messages are considered stale (e.g., 1 minute)
+STALE_CLAIM_INTERVAL = int(os.environ.get("STALE_CLAIM_INTERVAL", "30"))  # seconds between XAUTOCLAIM sweeps of both streams
+STALE_CLAIM_COUNT = int(os.environ.get("STALE_CLAIM_COUNT", "100"))  # entries claimed per XAUTOCLAIM call
+# Consumers idle this long with nothing pending are removed from their group (left behind by dead replicas)
+DEAD_CONSUMER_IDLE_MS = int(os.environ.get("DEAD_CONSUMER_IDLE_MS", "600000"))  # 10 minutes
 
 # Configuration for Speaker Events Stream (NEW)
 REDIS_SPEAKER_EVENTS_STREAM_NAME = os.environ.get("REDIS_SPEAKER_EVENTS_STREAM_NAME", "speaker_events_relative")
 REDIS_SPEAKER_EVENTS_CONSUMER_GROUP = os.environ.get("REDIS_SPEAKER_EVENTS_CONSUMER_GROUP", "collector_speaker_group")
-REDIS_SPEAKER_EVENT_KEY_PREFIX = os.environ.get("REDIS_SPEAKER_EVENT_KEY_PREFIX", "speaker_events") # For sorted sets
-REDIS_SPEAKER_EVENT_TTL = int(os.environ.get("REDIS_SPEAKER_EVENT_TTL", "86400")) # 24 hours default TTL for speaker events sorted sets
+REDIS_SPEAKER_EVENT_KEY_PREFIX = os.environ.get("REDIS_SPEAKER_EVENT_KEY_PREFIX", "speaker_events") # Speaker timeline keys {prefix}:{uid} (events) and {prefix}:{uid}:version
+REDIS_SPEAKER_EVENT_TTL = int(os.environ.get("REDIS_SPEAKER_EVENT_TTL", "86400")) # 24 hours default TTL for speaker timeline keys
 
 # Configuration for background processing
-BACKGROUND_TASK_INTERVAL = int(os.environ.get("BACKGROUND_TASK_INTERVAL", "10"))  # seconds
-IMMUTABILITY_THRESHOLD = int(os.environ.get("IMMUTABILITY_THRESHOLD", "30"))  # seconds
+BACKGROUND_TASK_INTERVAL = int(os.environ.get("BACKGROUND_TASK_INTERVAL", "10"))  # seconds: flush wait when idle, doubled per idle cycle up to FLUSH_MAX_IDLE_INTERVAL
+FLUSH_MAX_IDLE_INTERVAL = int(os.environ.get("FLUSH_MAX_IDLE_INTERVAL", "60"))  # seconds
+FLUSH_MIN_INTERVAL = float(os.environ.get("FLUSH_MIN_INTERVAL", "1"))  # seconds between flush cycles, however often they are woken
+# Published by the stream consumer when segments marked final are written, to wake the flush loop of every replica
+FLUSH_WAKEUP_CHANNEL = os.environ.get("FLUSH_WAKEUP_CHANNEL", "collector:flush_wakeup")
+# Sorted set of active meeting id -> earliest time one of its segments is due for persistence
+FLUSH_SCHEDULE_KEY = os.environ.get("FLUSH_SCHEDULE_KEY", "flush_schedule")
+IMMUTABILITY_THRESHOLD = int(os.environ.get("IMMUTABILITY_THRESHOLD", "30"))  # seconds (segments marked final by the producer are persisted without waiting)
 REDIS_SEGMENT_TTL = int(os.environ.get("REDIS_SEGMENT_TTL", "3600"))  # 1 hour default TTL for Redis segments
+# Rows per multi-row INSERT (and per transaction) when persisting segments; 8 columns per row keeps it under asyncpg's 32767 parameters
+DB_INSERT_CHUNK_SIZE = int(os.environ.get("DB_INSERT_CHUNK_SIZE", "1000"))
+# Meetings flushed concurrently per replica (each uses its own DB connection)
+FLUSH_CONCURRENCY = int(os.environ.get("FLUSH_CONCURRENCY", "8"))
+# Per-meeting flush lease held by one replica, renewed every cycle and every FLUSH_LEASE_TTL / 2 while
+# idle cycles are further apart (FLUSH_MAX_IDLE_INTERVAL); must exceed the duration of a flush cycle
+FLUSH_LEASE_TTL = int(os.environ.get("FLUSH_LEASE_TTL", "30"))  # seconds
+# Sorted set of flush lease owner -> last heartbeat; replicas seen within FLUSH_LEASE_TTL split the
+# active meetings, each leasing at most its fair share (active meetings / live replicas, rounded up)
+FLUSH_REPLICAS_KEY = os.environ.get("FLUSH_REPLICAS_KEY", "flush_replicas")
+
+# In-process cache of token -> user and (user, platform, native meeting id) -> meeting lookups
+LOOKUP_CACHE_TTL = int(os.environ.get("LOOKUP_CACHE_TTL", "300"))  # seconds
+LOOKUP_CACHE_NEGATIVE_TTL = int(os.environ.get("LOOKUP_CACHE_NEGATIVE_TTL", "30"))  # seconds an unknown token stays cached
+LOOKUP_CACHE_MAX_SIZE = int(os.environ.get("LOOKUP_CACHE_MAX_SIZE", "10000"))  # entries per cache
+# Redis pub/sub channel on which admin-api / bot-manager publish token revocations and meeting re-creations
+LOOKUP_CACHE_INVALIDATION_CHANNEL = os.environ.get("LOOKUP_CACHE_INVALIDATION_CHANNEL", "collector:lookup_cache_invalidation")
 
 # Logging configuration
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
@@ -19,6 +19,7 @@ from config import (
     CONSUMER_NAME,
     PENDING_MSG_TIMEOUT_MS,
     BACKGROUND_TASK_INTERVAL,
+    FLUSH_MAX_IDLE_INTERVAL,
     IMMUTABILITY_THRESHOLD,
     LOG_LEVEL,
     REDIS_HOST,
@@ -27,8 +28,9 @@ from config import (
     REDIS_SPEAKER_EVENTS_CONSUMER_GROUP
 )
 from api.endpoints import router as api_router
-from streaming.consumer import claim_stale_messages, consume_redis_stream, consume_speaker_events_stream
-from background.db_writer import process_redis_to_postgres
+from streaming.consumer import run_stale_message_reclaimer, consume_redis_stream, consume_speaker_events_stream
+from streaming.lookup_cache import listen_for_invalidations
+from background.db_writer import process_redis_to_postgres, listen_for_flush_wakeups
 
 app = FastAPI(
     title="Transcription Collector",
@@ -53,10 +55,13 @@ transcription_filter = TranscriptionFilter()
 redis_to_pg_task = None
 stream_consumer_task = None
 speaker_stream_consumer_task = None
+stale_reclaimer_task = None
+cache_invalidation_task = None
+flush_wakeup_task = None
 
 @app.on_event("startup")
 async def startup():
-    global redis_client, redis_to_pg_task, stream_consumer_task, speaker_stream_consumer_task, transcription_filter
+    global redis_client, redis_to_pg_task, stream_consumer_task, speaker_stream_consumer_task, stale_reclaimer_task, cache_invalidation_task, flush_wakeup_task, transcription_filter
     
     logger.info(f"Connecting to Redis at {REDIS_HOST}:{REDIS_PORT}")
     temp_redis_client = aioredis.Redis(
@@ -105,10 +110,14 @@ async def startup():
     
     logger.info("Database initialized.")
     
-    await claim_stale_messages(redis_client)
+    cache_invalidation_task = asyncio.create_task(listen_for_invalidations(redis_client))
+
+    # First sweep runs immediately, then every STALE_CLAIM_INTERVAL seconds
+    stale_reclaimer_task = asyncio.create_task(run_stale_message_reclaimer(redis_client))
     
+    flush_wakeup_task = asyncio.create_task(listen_for_flush_wakeups(redis_client))
     redis_to_pg_task = asyncio.create_task(process_redis_to_postgres(redis_client, transcription_filter))
-    logger.info(f"Redis-to-PostgreSQL task started (Interval: {BACKGROUND_TASK_INTERVAL}s, Threshold: {IMMUTABILITY_THRESHOLD}s)")
+    logger.info(f"Redis-to-PostgreSQL task started (Interval: {BACKGROUND_TASK_INTERVAL}-{FLUSH_MAX_IDLE_INTERVAL}s, Threshold: {IMMUTABILITY_THRESHOLD}s)")
     
     stream_consumer_task = asyncio.create_task(consume_redis_stream(redis_client))
     logger.info(f"Redis Stream consumer task started (Stream: {REDIS_STREAM_NAME}, Group: {REDIS_CONSUMER_GROUP}, Consumer: {CONSUMER_NAME})")
@@ -121,7 +130,7 @@ async def startup():
 async def shutdown():
     logger.info("Application shutting down...")
     # Cancel background tasks
-    tasks_to_cancel = [redis_to_pg_task, stream_consumer_task, speaker_stream_consumer_task]
+    tasks_to_cancel = [redis_to_pg_task, stream_consumer_task, speaker_stream_consumer_task, stale_reclaimer_task, cache_invalidation_task, flush_wakeup_task]
     for i, task in enumerate(tasks_to_cancel):
         if task and not task.done():
             task.cancel()
@@ -1,9 +1,11 @@
+import bisect
 import logging
 from typing import List, Dict, Any, Optional, Tuple
-import json
 import redis.asyncio as aioredis
 import redis
 
+from mapping.speaker_timeline import decode_speaker_event, fetch_speaker_events
+
 logger = logging.getLogger(__name__)
 
 # Speaker mapping statuses
@@ -38,10 +40,6 @@ def map_speaker_to_segment(
             'participant_id_meet': Google Meet participant ID, or None.
             'status': Mapping status (e.g., MAPPED, UNKNOWN, MULTIPLE).
     """
-    active_speaker_name: Optional[str] = None
-    active_participant_id: Optional[str] = None
-    mapping_status = STATUS_UNKNOWN
-
     if not speaker_events_for_session:
         return {
             "speaker_name": None, 
@@ -49,184 +47,288 @@ def map_speaker_to_segment(
             "status": STATUS_NO_SPEAKER_EVENTS
         }
 
-    # Parse speaker events from JSON string to dict
-    parsed_events: List[Dict[str, Any]] = []
-    for event_json, timestamp in speaker_events_for_session:
-        try:
-            event = json.loads(event_json)
-            event['relative_client_timestamp_ms'] = timestamp # Ensure timestamp is part of the event dict
-            parsed_events.append(event)
-        except json.JSONDecodeError:
-            logger.warning(f"Failed to parse speaker event JSON: {event_json}")
-            continue
-    
+    parsed_events = [event for event in _parse_speaker_events(speaker_events_for_session) if event is not None]
     if not parsed_events:
         return {"speaker_name": None, "participant_id_meet": None, "status": STATUS_ERROR} # Error parsing all events
 
-    # Find speaker(s) active during the segment interval
-    # This is a simplified approach: considers the speaker whose START event is closest before or at segment_start_ms
-    # and whose corresponding END event is after segment_start_ms or not present before segment_end_ms.
-
-    # Relevant events are those whose activity period could overlap with the segment
-    # A speaker is active in segment [S_start, S_end] if:
-    #   - They have a START event at T_start <= S_end
-    #   - And no corresponding END event T_end such that T_start <= T_end < S_start
-    
-    candidate_speakers = {} # participant_id_meet -> last_start_event
-
-    for event in parsed_events:
-        event_ts = event['relative_client_timestamp_ms']
-        participant_id = event.get("participant_id_meet") or event.get("participant_name") # Fallback to name if id_meet missing
-
-        if not participant_id:
-            continue
-
-        if event["event_type"] == "SPEAKER_START":
-            # If this start is before the segment ends, it *could* be the speaker
-            if event_ts <= segment_end_ms:
-                candidate_speakers[participant_id] = event
-            # If this start is after segment ends, it and subsequent events for this speaker are irrelevant
-            # (assuming chronological sort of input `parsed_events`)
-            # else: break # Optimization: if events are globally sorted by time
-
-        elif event["event_type"] == "SPEAKER_END":
-            # If this end event is for a candidate and occurs *before* the segment starts,
-            # then that candidate is no longer speaking.
-            if participant_id in candidate_speakers and event_ts < segment_start_ms:
-                del candidate_speakers[participant_id]
-    
-    # From the remaining candidates, determine who was speaking during the segment
-    # This logic can be complex for overlaps. Simplified: take the one whose START was latest but before/at segment start.
-    # More robust: find speaker whose active interval [speaker_start, speaker_end_or_session_end] maximally overlaps segment.
-    
-    best_candidate_name: Optional[str] = None
-    best_candidate_id: Optional[str] = None
-    latest_start_time_before_segment_end = -1
-
-    active_speakers_in_segment = []
-
-    for p_id, start_event in candidate_speakers.items():
-        start_ts = start_event['relative_client_timestamp_ms']
-        # Find corresponding END event for this p_id that is after start_ts
-        end_ts = session_end_time_ms or segment_end_ms # Default to session_end or segment_end if no specific end event
-        # look for an explicit end event
-        for end_search_event in parsed_events: # Search all parsed events again for the corresponding end
-            if (end_search_event.get("participant_id_meet") == p_id or end_search_event.get("participant_name") == p_id) and \
-               end_search_event["event_type"] == "SPEAKER_END" and \
-               end_search_event['relative_client_timestamp_ms'] >= start_ts:
-                end_ts = end_search_event['relative_client_timestamp_ms']
-                break # Found the earliest relevant END event
-        
-        # Speaker is active during the segment if: [start_ts, end_ts] overlaps with [segment_start_ms, segment_end_ms]
-        # Overlap condition: max(start1, start2) < min(end1, end2)
-        overlap_start = max(start_ts, segment_start_ms)
-        overlap_end = min(end_ts, segment_end_ms)
-
-        if overlap_start < overlap_end: # If there is an overlap
-            active_speakers_in_segment.append({
-                "name": start_event["participant_name"],
-                "id": start_event.get("participant_id_meet"),
-                "overlap_duration": overlap_end - overlap_start,
-                "start_event_ts": start_ts
-            })
-
-    if not active_speakers_in_segment:
-        mapping_status = STATUS_UNKNOWN
-    elif len(active_speakers_in_segment) == 1:
-        active_speaker_name = active_speakers_in_segment[0]["name"]
-        active_participant_id = active_speakers_in_segment[0]["id"]
-        mapping_status = STATUS_MAPPED
-    else:
-        # Multiple speakers overlap. Prioritize by longest overlap.
-        # If overlaps are equal, could use other heuristics (e.g. latest start). For now, longest.
-        active_speakers_in_segment.sort(key=lambda x: x["overlap_duration"], reverse=True)
-        active_speaker_name = active_speakers_in_segment[0]["name"]
-        active_participant_id = active_speakers_in_segment[0]["id"]
-        mapping_status = STATUS_MULTIPLE
-        logger.info(f"Multiple speakers found for segment {segment_start_ms}-{segment_end_ms}. Selected {active_speaker_name} due to longest overlap.")
-
-    return {
-        "speaker_name": active_speaker_name,
-        "participant_id_meet": active_participant_id,
-        "status": mapping_status
-    } 
-
-# NEW Utility function to centralize fetching and mapping logic
-async def get_speaker_mapping_for_segment(
-    redis_c: 'aioredis.Redis', # Forward reference for type hint
+    return SpeakerIntervalIndex(parsed_events).map_segment(segment_start_ms, segment_end_ms, session_end_time_ms)
+
+def _parse_speaker_events(speaker_events: List[Tuple[str, float]]) -> List[Optional[Dict[str, Any]]]:
+    """Parses (event_json_str, timestamp_ms) tuples; unparseable events come back as None, keeping positions."""
+    return [decode_speaker_event(event_json, timestamp) for event_json, timestamp in speaker_events]
+
+def _participant_key(event: Dict[str, Any]) -> Optional[str]:
+    return event.get("participant_id_meet") or event.get("participant_name") # Fallback to name if id_meet missing
+
+class _ParticipantTimeline:
+    """One participant's SPEAKER_START and SPEAKER_END events, in event-list order."""
+
+    def __init__(self):
+        self.start_ts: List[float] = []
+        self.start_pos: List[int] = []
+        self.start_events: List[Dict[str, Any]] = []
+        self.end_ts: List[float] = []
+        self.end_pos: List[int] = []
+
+class _IntervalTree:
+    """Static centered interval tree over closed intervals (lo, hi, item); stab(x) in O(log n + k)."""
+
+    def __init__(self, intervals: List[Tuple[float, float, Any]]):
+        self.center = None
+        self.left = self.right = None
+        if not intervals:
+            return
+        los = sorted(lo for lo, _, _ in intervals)
+        self.center = los[len(los) // 2]
+        left = [iv for iv in intervals if iv[1] < self.center]
+        right = [iv for iv in intervals if iv[0] > self.center]
+        middle = [iv for iv in intervals if iv[0] <= self.center <= iv[1]]
+        self.by_lo = sorted(middle, key=lambda iv: iv[0])
+        self.by_hi = sorted(middle, key=lambda iv: iv[1], reverse=True)
+        self.left = _IntervalTree(left) if left else None
+        self.right = _IntervalTree(right) if right else None
+
+    def stab(self, x: float, out: list):
+        node = self
+        while node is not None and node.center is not None:
+            if x < node.center:
+                for lo, _, item in node.by_lo:
+                    if lo > x:
+                        break
+                    out.append(item)
+                node = node.left
+            else:
+                for _, hi, item in node.by_hi:
+                    if hi < x:
+                        break
+                    out.append(item)
+                node = node.right if x > node.center else None
+
+class SpeakerIntervalIndex:
+    """Interval index over one session's parsed speaker events, built once and queried per segment.
+
+    Same results as the original per-segment scan (kept as the reference in
+    tests/test_speaker_mapper.py): a participant's candidate START is their last START at or
+    before the segment end, dropped if one of their ENDs falls after it but before the
+    segment start; its speaking interval runs to the first END at or after it. Ties in
+    overlap go to the participant whose candidacy began first, as with the original dict order.
+
+    Queries cost O(log n) per participant touching the segment instead of rescanning all events.
+    """
+
+    def __init__(self, parsed_events: List[Dict[str, Any]]):
+        """`parsed_events` must be chronologically sorted (as returned by ZRANGEBYSCORE)."""
+        self.has_events = bool(parsed_events)
+        self._participants: Dict[str, _ParticipantTimeline] = {}
+        # All STARTs in list order, for the STARTs falling inside a segment
+        self._start_ts: List[float] = []
+        self._start_keys: List[str] = []
+        # END timestamps by participant_id_meet and by participant_name: an END closes a
+        # speaking interval if either field equals the participant key
+        self._close_ts: Dict[str, List[float]] = {}
+
+        for pos, event in enumerate(parsed_events):
+            key = _participant_key(event)
+            if not key:
+                continue
+            event_ts = event['relative_client_timestamp_ms']
+            event_type = event["event_type"]
+            timeline = self._participants.setdefault(key, _ParticipantTimeline())
+            if event_type == "SPEAKER_START":
+                timeline.start_ts.append(event_ts)
+                timeline.start_pos.append(pos)
+                timeline.start_events.append(event)
+                self._start_ts.append(event_ts)
+                self._start_keys.append(key)
+            elif event_type == "SPEAKER_END":
+                timeline.end_ts.append(event_ts)
+                timeline.end_pos.append(pos)
+                for value in {event.get("participant_id_meet"), event.get("participant_name")}:
+                    if value:
+                        self._close_ts.setdefault(value, []).append(event_ts)
+
+        # A START is a candidate for segments starting after it until the participant's next
+        # START, their next END, or the end of its speaking interval (a superset, checked exactly per query)
+        intervals = []
+        for key, timeline in self._participants.items():
+            for i, start_ts in enumerate(timeline.start_ts):
+                hi = float("inf")
+                if i + 1 < len(timeline.start_ts):
+                    hi = timeline.start_ts[i + 1]
+                next_end = bisect.bisect_right(timeline.end_pos, timeline.start_pos[i])
+                if next_end < len(timeline.end_ts):
+                    hi = min(hi, timeline.end_ts[next_end])
+                close_ts = self._close_end(key, start_ts)
+                if close_ts is not None:
+                    hi = min(hi, close_ts)
+                intervals.append((start_ts, hi, key))
+        self._tree = _IntervalTree(intervals)
+
+    def _close_end(self, key: str, start_ts: float) -> Optional[float]:
+        close_ts = self._close_ts.get(key)
+        if not close_ts:
+            return None
+        i = bisect.bisect_left(close_ts, start_ts)
+        return close_ts[i] if i < len(close_ts) else None
+
+    def _candidate(self, key: str, segment_start_ms: float, segment_end_ms: float, window_start_ms: float):
+        """Returns (order, start_event) for the participant's candidate START, or None."""
+        timeline = self._participants[key]
+        last = bisect.bisect_right(timeline.start_ts, segment_end_ms) - 1
+        if last < 0 or timeline.start_ts[last] < window_start_ms:
+            return None
+        # Last END before the segment start: drops the candidate if it came after the START
+        ended = bisect.bisect_left(timeline.end_ts, segment_start_ms) - 1
+        if ended >= 0 and timeline.end_pos[ended] > timeline.start_pos[last]:
+            return None
+        # Candidacy began at the first START after that END (or the first START in the window)
+        first = bisect.bisect_right(timeline.start_pos, timeline.end_pos[ended]) if ended >= 0 else 0
+        first = max(first, bisect.bisect_left(timeline.start_ts, window_start_ms))
+        return timeline.start_pos[first], timeline.start_events[last]
+
+    def map_segment(
+        self,
+        segment_start_ms: float,
+        segment_end_ms: float,
+        session_end_time_ms: Optional[float] = None,
+        window_start_ms: float = float("-inf")
+    ) -> Dict[str, Any]:
+        """Maps a speaker to a segment. With `window_start_ms`, events before it are ignored, as if
+        only events from then on had been fetched (used with session_end_time_ms=None)."""
+        if not self.has_events:
+            return {"speaker_name": None, "participant_id_meet": None, "status": STATUS_NO_SPEAKER_EVENTS}
+
+        # Participants with a START inside the segment, or one before it still open at its start
+        keys = set(self._start_keys[
+            bisect.bisect_left(self._start_ts, segment_start_ms):bisect.bisect_right(self._start_ts, segment_end_ms)
+        ])
+        stabbed: List[str] = []
+        self._tree.stab(segment_start_ms, stabbed)
+        keys.update(stabbed)
+
+        candidates = []
+        for key in keys:
+            candidate = self._candidate(key, segment_start_ms, segment_end_ms, window_start_ms)
+            if candidate is not None:
+                candidates.append(candidate)
+        candidates.sort(key=lambda candidate: candidate[0])
+
+        active_speakers_in_segment = []
+        for _, start_event in candidates:
+            start_ts = start_event['relative_client_timestamp_ms']
+            end_ts = self._close_end(_participant_key(start_event), start_ts)
+            if end_ts is None:
+                end_ts = session_end_time_ms or segment_end_ms # Default to session_end or segment_end if no specific end event
+            # Overlap condition: max(start1, start2) < min(end1, end2)
+            overlap_start = max(start_ts, segment_start_ms)
+            overlap_end = min(end_ts, segment_end_ms)
+            if overlap_start < overlap_end:
+                active_speakers_in_segment.append({
+                    "name": start_event["participant_name"],
+                    "id": start_event.get("participant_id_meet"),
+                    "overlap_duration": overlap_end - overlap_start,
+                })
+
+        if not active_speakers_in_segment:
+            return {"speaker_name": None, "participant_id_meet": None, "status": STATUS_UNKNOWN}
+        if len(active_speakers_in_segment) == 1:
+            status = STATUS_MAPPED
+        else:
+            # Multiple speakers overlap. Prioritize by longest overlap (stable sort keeps candidacy order on ties).
+            active_speakers_in_segment.sort(key=lambda x: x["overlap_duration"], reverse=True)
+            status = STATUS_MULTIPLE
+            logger.info(f"Multiple speakers found for segment {segment_start_ms}-{segment_end_ms}. Selected {active_speakers_in_segment[0]['name']} due to longest overlap.")
+        return {
+            "speaker_name": active_speakers_in_segment[0]["name"],
+            "participant_id_meet": active_speakers_in_segment[0]["id"],
+            "status": status
+        }
+
+async def get_speaker_mappings_for_segments(
+    redis_c: 'aioredis.Redis',
     session_uid: str,
-    segment_start_ms: float,
-    segment_end_ms: float,
+    segments_ms: List[Tuple[float, float]], # (segment_start_ms, segment_end_ms) per segment
     config_speaker_event_key_prefix: str, # Pass REDIS_SPEAKER_EVENT_KEY_PREFIX
-    context_log_msg: str = "" # For more specific logging, e.g., "[LiveMap]" or "[FinalMap]"
-) -> Dict[str, Any]:
+    context_log_msg: str = ""
+) -> List[Dict[str, Any]]:
     """
-    Fetches speaker events from Redis for a given segment and session, 
-    then maps them to determine the speaker.
+    Maps several segments of one session at once: fetches the speaker events covering the
+    union of their windows with a single ZRANGEBYSCORE, parses them once, and maps each
+    segment against the events of its own window [start - PRE, end + POST], so results are
+    the same as calling get_speaker_mapping_for_segment per segment. The events are indexed once
+    (SpeakerIntervalIndex) and each segment is a query against that index.
+    Returns one result dict per segment, in input order. Results computed from the events carry
+    the timeline version they reflect (mapping.speaker_timeline) as 'speaker_events_version'.
     """
     if not session_uid:
         logger.warning(f"{context_log_msg} No session_uid provided. Cannot map speakers.")
-        return {"speaker_name": None, "participant_id_meet": None, "status": STATUS_UNKNOWN}
-
-    mapped_speaker_name: Optional[str] = None
-    mapping_status: str = STATUS_UNKNOWN
-    active_participant_id: Optional[str] = None
+        return [{"speaker_name": None, "participant_id_meet": None, "status": STATUS_UNKNOWN} for _ in segments_ms]
+    if not segments_ms:
+        return []
 
     try:
-        speaker_event_key = f"{config_speaker_event_key_prefix}:{session_uid}"
-        
-        # Fetch speaker events from Redis
-        speaker_events_raw = await redis_c.zrangebyscore(
-            speaker_event_key, 
-            min=segment_start_ms - PRE_SEGMENT_SPEAKER_EVENT_FETCH_MS, # MODIFIED
-            max=segment_end_ms + POST_SEGMENT_SPEAKER_EVENT_FETCH_MS, # MODIFIED
-            withscores=True
+        speaker_events, timeline_version = await fetch_speaker_events(
+            redis_c, config_speaker_event_key_prefix, session_uid,
+            min_ms=min(start for start, _ in segments_ms) - PRE_SEGMENT_SPEAKER_EVENT_FETCH_MS,
+            max_ms=max(end for _, end in segments_ms) + POST_SEGMENT_SPEAKER_EVENT_FETCH_MS
         )
-        
-        speaker_events_for_mapper: List[Tuple[str, float]] = []
-        for event_data, score_ms in speaker_events_raw:
-            event_json_str: Optional[str] = None
-            if isinstance(event_data, bytes):
-                event_json_str = event_data.decode('utf-8')
-            elif isinstance(event_data, str):
-                event_json_str = event_data
-            else:
-                logger.warning(f"{context_log_msg} UID:{session_uid} Seg:{segment_start_ms}-{segment_end_ms} Unexpected speaker event data type from Redis: {type(event_data)}. Skipping this event.")
-                continue
-            speaker_events_for_mapper.append((event_json_str, float(score_ms)))
 
-        log_prefix_detail = f"{context_log_msg} UID:{session_uid} Seg:{segment_start_ms:.0f}-{segment_end_ms:.0f}ms"
+        # Sorted by score, as returned by ZRANGEBYSCORE
+        timestamps = [timestamp for _, timestamp in speaker_events]
+        parsed_events = _parse_speaker_events(speaker_events)
+        index = SpeakerIntervalIndex([event for event in parsed_events if event is not None])
+        # Parsed events before each position, to tell an empty window from an unparseable one
+        parsed_before = [0]
+        for event in parsed_events:
+            parsed_before.append(parsed_before[-1] + (event is not None))
+    except redis.exceptions.RedisError as re:
+        logger.error(f"{context_log_msg} UID:{session_uid} Redis error fetching speaker events for {len(segments_ms)} segment(s): {re}", exc_info=True)
+        return [{"speaker_name": None, "participant_id_meet": None, "status": STATUS_ERROR} for _ in segments_ms]
 
-        if not speaker_events_for_mapper:
-            logger.debug(f"{log_prefix_detail} No speaker events in Redis for mapping.")
-            mapping_status = STATUS_NO_SPEAKER_EVENTS
+    results: List[Dict[str, Any]] = []
+    for segment_start_ms, segment_end_ms in segments_ms:
+        log_prefix_detail = f"{context_log_msg} UID:{session_uid} Seg:{segment_start_ms:.0f}-{segment_end_ms:.0f}ms"
+        low = bisect.bisect_left(timestamps, segment_start_ms - PRE_SEGMENT_SPEAKER_EVENT_FETCH_MS)
+        high = bisect.bisect_right(timestamps, segment_end_ms + POST_SEGMENT_SPEAKER_EVENT_FETCH_MS)
+        try:
+            if low == high:
+                logger.debug(f"{log_prefix_detail} No speaker events in Redis for mapping.")
+                mapping_result = {"speaker_name": None, "participant_id_meet": None, "status": STATUS_NO_SPEAKER_EVENTS}
+            elif parsed_before[high] == parsed_before[low]:
+                mapping_result = {"speaker_name": None, "participant_id_meet": None, "status": STATUS_ERROR} # Error parsing all events
+            else:
+                # Events before the segment's fetch window are ignored, as with a per-segment fetch
+                mapping_result = index.map_segment(
+                    segment_start_ms, segment_end_ms, window_start_ms=segment_start_ms - PRE_SEGMENT_SPEAKER_EVENT_FETCH_MS
+                )
+                logger.debug(f"{log_prefix_detail} {high - low} speaker events. Result: Name='{mapping_result['speaker_name']}', Status='{mapping_result['status']}'")
+        except Exception as map_err:
+            logger.error(f"{log_prefix_detail} Speaker mapping error: {map_err}", exc_info=True)
+            mapping_result = {"speaker_name": None, "participant_id_meet": None, "status": STATUS_ERROR}
         else:
-            logger.debug(f"{log_prefix_detail} {len(speaker_events_for_mapper)} speaker events for mapping.")
-
-        # Call the core mapping logic
-        mapping_result = map_speaker_to_segment(
-            segment_start_ms=segment_start_ms,
-            segment_end_ms=segment_end_ms,
-            speaker_events_for_session=speaker_events_for_mapper, # Now contains all events for the session
-            session_end_time_ms=None # session_end_time not critical for per-segment mapping here
-        )
-        
-        mapped_speaker_name = mapping_result.get("speaker_name")
-        active_participant_id = mapping_result.get("participant_id_meet")
-        mapping_status = mapping_result.get("status", STATUS_ERROR)
-        
-        if mapping_status != STATUS_NO_SPEAKER_EVENTS: # Avoid double logging if no events
-             logger.info(f"{log_prefix_detail} Result: Name='{mapped_speaker_name}', Status='{mapping_status}'")
+            mapping_result["speaker_events_version"] = timeline_version
+        results.append(mapping_result)
 
-    except redis.exceptions.RedisError as re:
-        logger.error(f"{context_log_msg} UID:{session_uid} Seg:{segment_start_ms}-{segment_end_ms} Redis error fetching/processing speaker events: {re}", exc_info=True)
-        mapping_status = STATUS_ERROR 
-    except Exception as map_err:
-        logger.error(f"{context_log_msg} UID:{session_uid} Seg:{segment_start_ms}-{segment_end_ms} Speaker mapping error: {map_err}", exc_info=True)
-        mapping_status = STATUS_ERROR
-    
-    return {
-        "speaker_name": mapped_speaker_name,
-        "participant_id_meet": active_participant_id,
-        "status": mapping_status
-    } 
\ No newline at end of file
+    if len(segments_ms) > 1 or results[0]["status"] != STATUS_NO_SPEAKER_EVENTS:
+        statuses: Dict[str, int] = {}
+        for result in results:
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        logger.info(f"{context_log_msg} UID:{session_uid} Mapped {len(results)} segment(s) from {len(speaker_events)} speaker event(s): {statuses}")
+    return results
+
+async def get_speaker_mapping_for_segment(
+    redis_c: 'aioredis.Redis', # Forward reference for type hint
+    session_uid: str,
+    segment_start_ms: float,
+    segment_end_ms: float,
+    config_speaker_event_key_prefix: str, # Pass REDIS_SPEAKER_EVENT_KEY_PREFIX
+    context_log_msg: str = "" # For more specific logging, e.g., "[LiveMap]" or "[FinalMap]"
+) -> Dict[str, Any]:
+    """
+    Fetches speaker events from Redis for a given segment and session, 
+    then maps them to determine the speaker.
+    """
+    results = await get_speaker_mappings_for_segments(
+        redis_c, session_uid, [(segment_start_ms, segment_end_ms)], config_speaker_event_key_prefix, context_log_msg
+    )
+    return results[0]
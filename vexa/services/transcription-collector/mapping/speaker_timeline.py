@@ -0,0 +1,86 @@
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+# Each session's speaker events are kept under two keys:
+#   {prefix}:{uid}          sorted set of events scored by relative_client_timestamp_ms,
+#                           member JSON [event_type, timestamp_ms, participant_id_meet, participant_name]
+#                           (members written before this format hold the full event payload)
+#   {prefix}:{uid}:version  counter bumped whenever an event is added; mappings record the
+#                           version they were computed from so unchanged sessions are not remapped
+# Speaking intervals are paired from START/END timestamps when mapping (SpeakerIntervalIndex),
+# not as events arrive, so the stored timeline does not depend on delivery order: replicas
+# consuming a session's events concurrently or out of order converge on the same set.
+# Intervals are deliberately not materialized in Redis. A segment's mapping is defined by the
+# events inside its fetch window only (a turn opened before the window does not count; see the
+# windowed reference in tests/test_speaker_mapper.py), which no stored interval set can answer.
+# Reads stay bounded all the same: one ZRANGEBYSCORE over the union of the segments' windows.
+
+# KEYS: events sorted set, version counter
+# ARGV: timestamp_ms, member, ttl seconds
+# The member identifies the event, timestamp included, so a participant's successive STARTs
+# are distinct members while a redelivered event (reclaimed stream message) is the same one:
+# ZADD adds nothing and the version stays put, so the version counts the session's distinct events.
+ADD_SPEAKER_EVENT_LUA = """
+if redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2]) == 1 then
+    redis.call('INCR', KEYS[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+def speaker_timeline_keys(key_prefix: str, session_uid: str) -> Tuple[str, str]:
+    """Returns (events_key, version_key) for a session."""
+    return f"{key_prefix}:{session_uid}", f"{key_prefix}:{session_uid}:version"
+
+def speaker_event_member(event_type: str, timestamp_ms: float, participant_id_meet: Optional[str],
+                         participant_name: Optional[str]) -> str:
+    """Sorted set member for an event: only the fields mapping reads, so replays encode identically."""
+    return json.dumps([event_type, timestamp_ms, participant_id_meet, participant_name], separators=(',', ':'))
+
+def decode_speaker_event(member: str, timestamp_ms: float) -> Optional[dict]:
+    """Event dict for a stored member (either format), with its timestamp; None if unparseable."""
+    try:
+        event = json.loads(member)
+        if isinstance(event, list):
+            event_type, _, participant_id_meet, participant_name = event
+            event = {"event_type": event_type, "participant_id_meet": participant_id_meet, "participant_name": participant_name}
+        event['relative_client_timestamp_ms'] = timestamp_ms # Ensure timestamp is part of the event dict
+        return event
+    except (ValueError, TypeError):
+        logger.warning(f"Failed to parse speaker event JSON: {member}")
+        return None
+
+def _decode_version(value) -> int:
+    return int(value) if value is not None else 0
+
+async def fetch_speaker_events(redis_c: aioredis.Redis, key_prefix: str, session_uid: str,
+                               min_ms: float, max_ms: float) -> Tuple[List[Tuple[str, float]], int]:
+    """Reads, in one round-trip, the session's events with timestamps in [min_ms, max_ms] as
+    chronologically sorted (member, timestamp_ms) tuples, and the timeline version (0 if the
+    session has no events). Raises redis.exceptions.RedisError."""
+    events_key, version_key = speaker_timeline_keys(key_prefix, session_uid)
+    async with redis_c.pipeline(transaction=False) as pipe:
+        # Version first: an event landing in between makes the recorded version stale, never ahead
+        pipe.get(version_key)
+        pipe.zrangebyscore(events_key, min=min_ms, max=max_ms, withscores=True)
+        version, members = await pipe.execute()
+    events = []
+    for member, score_ms in members:
+        if isinstance(member, bytes):
+            member = member.decode('utf-8')
+        events.append((member, float(score_ms)))
+    return events, _decode_version(version)
+
+async def fetch_speaker_timeline_versions(redis_c: aioredis.Redis, key_prefix: str,
+                                          session_uids: List[str]) -> Dict[str, int]:
+    """Current timeline version of each session, with one MGET. Raises redis.exceptions.RedisError."""
+    if not session_uids:
+        return {}
+    versions = await redis_c.mget([speaker_timeline_keys(key_prefix, uid)[1] for uid in session_uids])
+    return {uid: _decode_version(version) for uid, version in zip(session_uids, versions)}
@@ -1,8 +1,9 @@
 import logging
 import asyncio
+import json
 import redis.asyncio as aioredis
 import redis # For redis.exceptions
-from typing import Dict, Any # For message_data type hint if being very specific
+from typing import Dict, Any, List, Tuple # For message_data type hint if being very specific
 
 from config import (
     REDIS_STREAM_NAME,
@@ -11,100 +12,205 @@ from config import (
     PENDING_MSG_TIMEOUT_MS,
     REDIS_STREAM_READ_COUNT,
     REDIS_STREAM_BLOCK_MS,
+    STREAM_PROCESSING_CONCURRENCY,
+    STALE_CLAIM_INTERVAL,
+    STALE_CLAIM_COUNT,
+    DEAD_CONSUMER_IDLE_MS,
     REDIS_SPEAKER_EVENTS_STREAM_NAME,
     REDIS_SPEAKER_EVENTS_CONSUMER_GROUP
 )
 from streaming.processors import process_stream_message, process_speaker_event_message
+from streaming.write_batch import RedisWriteBatch
 
 logger = logging.getLogger(__name__)
 
+SPEAKER_CONSUMER_NAME = f"{CONSUMER_NAME}-speaker"
+
+# The consumer loop and the stale message reclaimer both process transcription batches. They
+# take turns so that, within this replica, a meeting's reclaimed messages are never processed
+# concurrently with its newer ones. Across replicas this cannot be guaranteed: a message is
+# only reclaimed once its consumer has held it for PENDING_MSG_TIMEOUT_MS, by which time
+# another replica may already have stored a later version of the same segment. The stale
+# version then stands until the producer's next re-send of that segment.
+_transcription_batch_lock = asyncio.Lock()
+
+# Deletes a consumer only if it has no pending entries, checked atomically with the delete:
+# between XINFO CONSUMERS and a plain XGROUP DELCONSUMER the consumer could read new entries,
+# which the delete would silently drop from the PEL.
+# KEYS: stream; ARGV: group, consumer. Returns -1 if the consumer had pending entries.
+DELETE_IDLE_CONSUMER_LUA = """
+if #redis.call('XPENDING', KEYS[1], ARGV[1], '-', '+', 1, ARGV[2]) > 0 then
+    return -1
+end
+return redis.call('XGROUP', 'DELCONSUMER', KEYS[1], ARGV[1], ARGV[2])
+"""
+
+def _decode_message_data(message_data: Dict[Any, Any]) -> Dict[str, Any]:
+    """Decodes stream entry fields (bytes or str, depending on the client's decode_responses)."""
+    return {k.decode('utf-8') if isinstance(k, bytes) else k:
+            v.decode('utf-8') if isinstance(v, bytes) else v
+            for k, v in message_data.items()}
+
+async def _execute_batch(batch: RedisWriteBatch, redis_c: aioredis.Redis, message_ids: List[str]) -> List[str]:
+    """Sends the batch's Redis writes; its messages can only be ACKed once they are stored."""
+    try:
+        await batch.execute(redis_c)
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Redis pipeline error writing batch of {len(message_ids)} message(s), not acknowledging: {e}", exc_info=True)
+        return []
+    return message_ids
+
+async def _process_speaker_events(messages: List[Tuple[str, Dict[str, Any]]], redis_c: aioredis.Redis) -> List[str]:
+    """Processes speaker event messages in order, writing them in one pipeline. Returns the IDs that can be ACKed."""
+    batch = RedisWriteBatch()
+    acked = []
+    for message_id, message_data in messages:
+        try:
+            should_ack = await process_speaker_event_message(message_id, message_data, redis_c, batch)
+        except Exception as e:
+            logger.error(f"[SpeakerConsumer] Critical error during process_speaker_event_message call for {message_id}: {e}", exc_info=True)
+            should_ack = False
+        if should_ack:
+            acked.append(message_id)
+    return await _execute_batch(batch, redis_c, acked)
+
+async def _autoclaim_stream(redis_c: aioredis.Redis, stream: str, group: str, consumer: str, process_batch) -> Tuple[int, int]:
+    """Claims every entry of the group idle for more than PENDING_MSG_TIMEOUT_MS with XAUTOCLAIM,
+    whichever consumer it was delivered to, and processes it. Returns (claimed, acked)."""
+    claimed_total = 0
+    acked_total = 0
+    cursor = '0-0'
+    while True:
+        response = await redis_c.xautoclaim(
+            name=stream,
+            groupname=group,
+            consumername=consumer,
+            min_idle_time=PENDING_MSG_TIMEOUT_MS,
+            start_id=cursor,
+            count=STALE_CLAIM_COUNT,
+        )
+        cursor = response[0].decode('utf-8') if isinstance(response[0], bytes) else response[0]
+        # Entries deleted from the stream come back without an ID (Redis 6.2) or are dropped (Redis 7)
+        claimed = [
+            (message_id.decode('utf-8') if isinstance(message_id, bytes) else message_id, _decode_message_data(message_data))
+            for message_id, message_data in response[1]
+            if message_id is not None and message_data is not None
+        ]
+        if claimed:
+            claimed_total += len(claimed)
+            logger.info(f"Claimed {len(claimed)} stale message(s) from '{stream}': {[message_id for message_id, _ in claimed]}")
+            message_ids_to_ack = await process_batch(claimed, redis_c)
+            if message_ids_to_ack:
+                await redis_c.xack(stream, group, *message_ids_to_ack)
+                acked_total += len(message_ids_to_ack)
+        if cursor == '0-0':
+            break
+    return claimed_total, acked_total
+
+async def _remove_dead_consumers(redis_c: aioredis.Redis, stream: str, group: str, own_consumer: str):
+    """Deletes consumers that have nothing pending and have been idle for DEAD_CONSUMER_IDLE_MS.
+    Their pending entries were already reclaimed by XAUTOCLAIM; the pending check is repeated
+    atomically with the delete (DELETE_IDLE_CONSUMER_LUA). A live consumer removed during a
+    quiet period is simply recreated by its next XREADGROUP."""
+    for consumer in await redis_c.xinfo_consumers(stream, group):
+        name = consumer['name']
+        if name == own_consumer or consumer.get('pending', 0) > 0 or consumer.get('idle', 0) < DEAD_CONSUMER_IDLE_MS:
+            continue
+        if await redis_c.eval(DELETE_IDLE_CONSUMER_LUA, 1, stream, group, name) == -1:
+            logger.info(f"Kept consumer '{name}' of group '{group}': it read new entries since the check")
+            continue
+        logger.info(f"Removed dead consumer '{name}' from group '{group}' (idle {consumer.get('idle')}ms)")
+
 async def claim_stale_messages(redis_c: aioredis.Redis):
-    """Claims and processes stale messages from the Redis Stream for the current consumer."""
-    messages_claimed_total = 0
-    processed_claim_count = 0
-    acked_claim_count = 0
-    error_claim_count = 0
+    """Reclaims and processes stale pending messages of both streams, then removes dead consumers."""
+    for stream, group, consumer, process_batch in (
+        (REDIS_STREAM_NAME, REDIS_CONSUMER_GROUP, CONSUMER_NAME, process_batch_by_meeting),
+        (REDIS_SPEAKER_EVENTS_STREAM_NAME, REDIS_SPEAKER_EVENTS_CONSUMER_GROUP, SPEAKER_CONSUMER_NAME, _process_speaker_events),
+    ):
+        try:
+            claimed, acked = await _autoclaim_stream(redis_c, stream, group, consumer, process_batch)
+            if claimed:
+                logger.info(f"Stale message sweep of '{stream}' (consumer: {consumer}): claimed {claimed}, acked {acked}")
+            await _remove_dead_consumers(redis_c, stream, group, consumer)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Redis error during stale message claiming on '{stream}': {e}", exc_info=True)
+        except Exception as e:
+            logger.error(f"Unexpected error during stale message claiming on '{stream}': {e}", exc_info=True)
+
+async def run_stale_message_reclaimer(redis_c: aioredis.Redis):
+    """Background task: sweeps both streams for stale pending messages every STALE_CLAIM_INTERVAL seconds,
+    so entries left by a crashed or scaled-down replica are picked up by the remaining ones.
+    Runs alongside consume_redis_stream; see _transcription_batch_lock for the ordering this keeps."""
+    logger.info(f"Starting stale message reclaimer (consumer: {CONSUMER_NAME}, idle > {PENDING_MSG_TIMEOUT_MS}ms, every {STALE_CLAIM_INTERVAL}s)")
+    while True:
+        try:
+            await claim_stale_messages(redis_c)
+            await asyncio.sleep(STALE_CLAIM_INTERVAL)
+        except asyncio.CancelledError:
+            logger.info("Stale message reclaimer task cancelled.")
+            break
 
-    logger.info(f"Starting stale message check (consumer: {CONSUMER_NAME}, idle > {PENDING_MSG_TIMEOUT_MS}ms).")
+async def get_consumer_stats(redis_c: aioredis.Redis) -> Dict[str, Any]:
+    """Per-stream group lag and pending count, and per-consumer pending count and idle time."""
+    stats = {}
+    for stream, group in (
+        (REDIS_STREAM_NAME, REDIS_CONSUMER_GROUP),
+        (REDIS_SPEAKER_EVENTS_STREAM_NAME, REDIS_SPEAKER_EVENTS_CONSUMER_GROUP),
+    ):
+        group_info = next((g for g in await redis_c.xinfo_groups(stream) if g['name'] == group), {})
+        consumers = await redis_c.xinfo_consumers(stream, group)
+        stats[stream] = {
+            "group": group,
+            # Entries not yet delivered to the group (Redis >= 7, None otherwise)
+            "lag": group_info.get('lag'),
+            "pending": group_info.get('pending', 0),
+            "consumers": [
+                {"name": c['name'], "pending": c.get('pending', 0), "idle_ms": c.get('idle', 0)}
+                for c in consumers
+            ],
+        }
+    return stats
 
+def _meeting_partition_key(message_id: str, message_data: Dict[str, Any]) -> str:
+    """Groups messages of the same meeting without any DB lookup: (platform, native meeting id, token)
+    resolves to a single meeting. Unparseable messages get their own partition."""
     try:
-        while True:
-            pending_details = await redis_c.xpending_range(
-                name=REDIS_STREAM_NAME,
-                groupname=REDIS_CONSUMER_GROUP,
-                min='-',
-                max='+',
-                count=100 
-            )
+        stream_data = json.loads(message_data['payload'])
+        return f"{stream_data.get('platform')}:{stream_data.get('meeting_id')}:{stream_data.get('token')}"
+    except (KeyError, TypeError, AttributeError, ValueError):
+        return message_id
 
-            if not pending_details:
-                logger.debug("No more pending messages found for the group during stale check.")
-                break
-
-            stale_candidates = [
-                msg for msg in pending_details
-                if msg.get('idle', 0) > PENDING_MSG_TIMEOUT_MS
-            ]
-
-            if not stale_candidates:
-                logger.debug("No messages found exceeding idle time in the current pending batch.")
-                if len(pending_details) < 100:
-                    break 
-                else:
-                    logger.debug("Checked 100 pending messages, none were stale enough. More might exist but stopping check for this run to avoid long loops on very busy streams.")
-                    break
-            
-            stale_message_ids = [msg['message_id'] for msg in stale_candidates]
-            logger.info(f"Found {len(stale_message_ids)} potentially stale message(s) to claim: {stale_message_ids}")
-
-            if stale_message_ids:
-                claimed_messages = await redis_c.xclaim(
-                    name=REDIS_STREAM_NAME,
-                    groupname=REDIS_CONSUMER_GROUP,
-                    consumername=CONSUMER_NAME,
-                    min_idle_time=PENDING_MSG_TIMEOUT_MS, 
-                    message_ids=stale_message_ids,
-                )
-                
-                messages_claimed_now = len(claimed_messages)
-                messages_claimed_total += messages_claimed_now
-                if messages_claimed_now > 0:
-                    logger.info(f"Successfully claimed {messages_claimed_now} stale message(s): {[msg[0].decode('utf-8') for msg in claimed_messages]}")
+async def process_batch_by_meeting(messages: List[Tuple[str, Dict[str, Any]]], redis_c: aioredis.Redis) -> List[str]:
+    """Processes a batch of decoded stream messages, meetings in parallel (bounded by
+    STREAM_PROCESSING_CONCURRENCY) and each meeting's messages strictly in stream order.
+    All Redis writes of the batch go out in one pipeline; returns the IDs of the messages
+    that can be ACKed. Batches run one at a time (see _transcription_batch_lock)."""
+    async with _transcription_batch_lock:
+        return await _process_batch_by_meeting(messages, redis_c)
 
-                for message_id_bytes, message_data_bytes in claimed_messages:
-                    message_id_str = message_id_bytes.decode('utf-8') if isinstance(message_id_bytes, bytes) else message_id_bytes
-                    message_data_decoded: Dict[str, Any] = {}
-                    if isinstance(message_data_bytes, dict):
-                        # Already decoded
-                        message_data_decoded = {k: v for k, v in message_data_bytes.items()}
-                    else:
-                        # Need to decode
-                        message_data_decoded = {k.decode('utf-8'): v.decode('utf-8') for k, v in message_data_bytes.items()}
-                    
-                    logger.info(f"Processing claimed stale message {message_id_str}...")
-                    processed_claim_count += 1
-                    try:
-                        success = await process_stream_message(message_id_str, message_data_decoded, redis_c)
-                        if success:
-                            logger.info(f"Successfully processed claimed stale message {message_id_str}. Acknowledging.")
-                            await redis_c.xack(REDIS_STREAM_NAME, REDIS_CONSUMER_GROUP, message_id_str)
-                            acked_claim_count += 1
-                        else:
-                            logger.warning(f"Processing failed for claimed stale message {message_id_str}. Not acknowledging.")
-                            error_claim_count += 1
-                    except Exception as e:
-                        logger.error(f"Error processing claimed stale message {message_id_str}: {e}", exc_info=True)
-                        error_claim_count += 1
-            
-            if not stale_candidates or len(pending_details) < 100: # Break if no stale candidates or if we didn't get a full batch of pending messages
-                break
+async def _process_batch_by_meeting(messages: List[Tuple[str, Dict[str, Any]]], redis_c: aioredis.Redis) -> List[str]:
+    partitions: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+    for message_id, message_data in messages:
+        partitions.setdefault(_meeting_partition_key(message_id, message_data), []).append((message_id, message_data))
 
-    except redis.exceptions.RedisError as e:
-        logger.error(f"Redis error during stale message claiming: {e}", exc_info=True)
-    except Exception as e:
-        logger.error(f"Unexpected error during stale message claiming: {e}", exc_info=True)
+    semaphore = asyncio.Semaphore(max(1, STREAM_PROCESSING_CONCURRENCY))
+    batch = RedisWriteBatch()
 
-    logger.info(f"Stale message check finished. Total claimed: {messages_claimed_total}, Processed: {processed_claim_count}, Acked: {acked_claim_count}, Errors: {error_claim_count}")
+    async def process_partition(partition_messages: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        acked = []
+        async with semaphore:
+            for message_id, message_data in partition_messages:
+                try:
+                    should_ack = await process_stream_message(message_id, message_data, redis_c, batch)
+                except Exception as e:
+                    logger.error(f"Critical error during process_stream_message call for {message_id}: {e}", exc_info=True)
+                    should_ack = False
+                if should_ack:
+                    acked.append(message_id)
+        return acked
+
+    results = await asyncio.gather(*[process_partition(p) for p in partitions.values()])
+    return await _execute_batch(batch, redis_c, [message_id for acked in results for message_id in acked])
 
 async def consume_redis_stream(redis_c: aioredis.Redis):
     """Background task to consume transcription segments from Redis Stream."""
@@ -126,8 +232,7 @@ async def consume_redis_stream(redis_c: aioredis.Redis):
 
             for stream_name_bytes, messages in response:
                 # stream_name = stream_name_bytes.decode('utf-8') # Not strictly needed if only one stream
-                message_ids_to_ack = []
-                processed_count = 0
+                decoded_messages = []
                 
                 for message_id_bytes, message_data_bytes in messages:
                     message_id_str = message_id_bytes.decode('utf-8') if isinstance(message_id_bytes, bytes) else message_id_bytes
@@ -138,16 +243,10 @@ async def consume_redis_stream(redis_c: aioredis.Redis):
                     else:
                         # Need to decode
                         message_data_decoded = {k.decode('utf-8'): v.decode('utf-8') for k, v in message_data_bytes.items()}
-                    
-                    should_ack = False
-                    processed_count += 1
-                    try:
-                        should_ack = await process_stream_message(message_id_str, message_data_decoded, redis_c)
-                    except Exception as e:
-                        logger.error(f"Critical error during process_stream_message call for {message_id_str}: {e}", exc_info=True)
-                        should_ack = False
-                    if should_ack:
-                        message_ids_to_ack.append(message_id_str)
+                    decoded_messages.append((message_id_str, message_data_decoded))
+
+                processed_count = len(decoded_messages)
+                message_ids_to_ack = await process_batch_by_meeting(decoded_messages, redis_c)
                         
                 if message_ids_to_ack:
                     try:
@@ -168,9 +267,7 @@ async def consume_redis_stream(redis_c: aioredis.Redis):
 
 async def consume_speaker_events_stream(redis_c: aioredis.Redis):
     """Background task to consume speaker events from Redis Stream."""
-    # Note: Using CONSUMER_NAME + '-speaker' to differentiate if needed, or could be shared if logic allows.
-    # Stale message claiming for this stream is not implemented here, but could be added similarly to claim_stale_messages.
-    consumer_name_speaker = f"{CONSUMER_NAME}-speaker"
+    consumer_name_speaker = SPEAKER_CONSUMER_NAME
     last_processed_id = '>' 
     logger.info(f"Starting speaker event consumer loop for '{consumer_name_speaker}', reading new messages ('>')...")
 
@@ -188,34 +285,18 @@ async def consume_speaker_events_stream(redis_c: aioredis.Redis):
                 continue
 
             for stream_name_bytes, messages in response:
-                message_ids_to_ack = []
-                processed_count = 0
+                decoded_messages = []
                 
                 for message_id_bytes, message_data_bytes in messages:
                     message_id_str = message_id_bytes.decode('utf-8') if isinstance(message_id_bytes, bytes) else message_id_bytes
-                    # Speaker event messages are expected to be flat JSON strings in the 'payload' field from WhisperLive
-                    # However, WhisperLive sends them as top-level fields. We need to adapt.
-                    # The `message_data_bytes` from xreadgroup for speaker_events stream will directly contain the speaker event fields.
-                    message_data_decoded: Dict[str, Any] = {}
-                    if isinstance(message_data_bytes, dict):
-                        message_data_decoded = {k.decode('utf-8') if isinstance(k, bytes) else k: 
-                                                v.decode('utf-8') if isinstance(v, bytes) else v 
-                                                for k, v in message_data_bytes.items()}
-                    else:
+                    # Speaker events are sent by the bot as top-level stream fields, not a JSON 'payload'
+                    if not isinstance(message_data_bytes, dict):
                         logger.error(f"[SpeakerConsumer] Unexpected message_data_bytes format for {message_id_str}: {type(message_data_bytes)}")
                         continue # Skip this message
+                    decoded_messages.append((message_id_str, _decode_message_data(message_data_bytes)))
 
-                    should_ack = False
-                    processed_count += 1
-                    try:
-                        # Pass the already decoded dictionary directly
-                        should_ack = await process_speaker_event_message(message_id_str, message_data_decoded, redis_c)
-                    except Exception as e:
-                        logger.error(f"[SpeakerConsumer] Critical error during process_speaker_event_message call for {message_id_str}: {e}", exc_info=True)
-                        should_ack = False # Ensure it's false on error
-                    
-                    if should_ack:
-                        message_ids_to_ack.append(message_id_str)
+                processed_count = len(decoded_messages)
+                message_ids_to_ack = await _process_speaker_events(decoded_messages, redis_c)
                         
                 if message_ids_to_ack:
                     try:
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+import redis # For redis.exceptions
+import redis.asyncio as aioredis
+
+from config import (
+    LOOKUP_CACHE_TTL,
+    LOOKUP_CACHE_NEGATIVE_TTL,
+    LOOKUP_CACHE_MAX_SIZE,
+    LOOKUP_CACHE_INVALIDATION_CHANNEL
+)
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+class TTLCache:
+    """Small in-process LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Returns the cached value (which may be None for negative entries) or MISSING."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def remove_where(self, predicate: Callable[[Hashable, Any], bool]):
+        for key in [k for k, (_, v) in self._entries.items() if predicate(k, v)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+# token -> user_id, or None for unknown tokens (cached for LOOKUP_CACHE_NEGATIVE_TTL)
+token_cache = TTLCache(LOOKUP_CACHE_MAX_SIZE, LOOKUP_CACHE_TTL)
+# (user_id, platform, native_meeting_id) -> latest meeting id
+meeting_cache = TTLCache(LOOKUP_CACHE_MAX_SIZE, LOOKUP_CACHE_TTL)
+
+def cache_unknown_token(token: str):
+    token_cache.set(token, None, ttl=LOOKUP_CACHE_NEGATIVE_TTL)
+
+def apply_invalidation(message: dict):
+    """Applies one invalidation message published on LOOKUP_CACHE_INVALIDATION_CHANNEL:
+    {"type": "token", "token": ...}, {"type": "user", "user_id": ...},
+    {"type": "meeting", "user_id": ..., "platform": ..., "native_meeting_id": ...}.
+    Anything else clears both caches."""
+    kind = message.get("type")
+    if kind == "token":
+        token_cache.pop(message.get("token"))
+    elif kind == "user":
+        user_id = message.get("user_id")
+        token_cache.remove_where(lambda token, cached_user_id: cached_user_id == user_id)
+        meeting_cache.remove_where(lambda key, meeting_id: key[0] == user_id)
+    elif kind == "meeting":
+        meeting_cache.pop((message.get("user_id"), message.get("platform"), message.get("native_meeting_id")))
+    else:
+        token_cache.clear()
+        meeting_cache.clear()
+
+async def listen_for_invalidations(redis_c: aioredis.Redis):
+    """Background task applying cache invalidations from Redis pub/sub.
+    Both caches are cleared whenever the subscription is (re)established, since messages
+    published while disconnected are lost."""
+    logger.info(f"Starting lookup cache invalidation listener on channel '{LOOKUP_CACHE_INVALIDATION_CHANNEL}'")
+    while True:
+        pubsub = redis_c.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(LOOKUP_CACHE_INVALIDATION_CHANNEL)
+            token_cache.clear()
+            meeting_cache.clear()
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    apply_invalidation(json.loads(message["data"]))
+                except (ValueError, TypeError, AttributeError) as e:
+                    logger.warning(f"Ignoring malformed cache invalidation message {message.get('data')!r}: {e}")
+        except asyncio.CancelledError:
+            logger.info("Lookup cache invalidation listener cancelled.")
+            break
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Redis error in cache invalidation listener: {e}. Resubscribing after delay...")
+            await asyncio.sleep(5)
+        finally:
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
@@ -13,9 +13,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from shared_models.database import async_session_local # For DB sessions
 from shared_models.models import User, Meeting, MeetingSession, APIToken
 from shared_models.schemas import Platform # WhisperLiveData not directly used by these functions from snippet
-from config import REDIS_SEGMENT_TTL, REDIS_SPEAKER_EVENT_KEY_PREFIX, REDIS_SPEAKER_EVENT_TTL # Added new configs (NEW)
+from config import REDIS_SEGMENT_TTL, REDIS_SPEAKER_EVENT_KEY_PREFIX, REDIS_SPEAKER_EVENT_TTL, IMMUTABILITY_THRESHOLD, FLUSH_WAKEUP_CHANNEL, FLUSH_SCHEDULE_KEY # Added new configs (NEW)
 # MODIFIED: Import the new utility function and only necessary statuses/base mapper if still needed elsewhere
-from mapping.speaker_mapper import get_speaker_mapping_for_segment, STATUS_UNKNOWN, STATUS_ERROR # Removed direct map_speaker_to_segment and other statuses if not directly used by this file
+from streaming.write_batch import RedisWriteBatch
+from streaming.segment_store import STORE_CHANGED_SEGMENTS_LUA, segment_content_hash, segment_keys
+from streaming.lookup_cache import MISSING, token_cache, meeting_cache, cache_unknown_token
+from mapping.speaker_mapper import get_speaker_mappings_for_segments, STATUS_UNKNOWN, STATUS_ERROR # Removed direct map_speaker_to_segment and other statuses if not directly used by this file
+from mapping.speaker_timeline import ADD_SPEAKER_EVENT_LUA, speaker_event_member, speaker_timeline_keys
 
 logger = logging.getLogger(__name__)
 
@@ -34,11 +38,45 @@ async def get_user_by_token(token: str, db: AsyncSession) -> User:
         raise ValueError(f"Invalid API token") 
     return user
 
-async def process_session_start_event(message_id: str, stream_data: Dict[str, Any], db: AsyncSession, user: User, meeting: Meeting) -> bool:
+async def resolve_user_id(token: str, db: AsyncSession) -> int:
+    """Cached get_user_by_token: returns the user ID or raises ValueError. Unknown tokens are cached too."""
+    user_id = token_cache.get(token)
+    if user_id is MISSING:
+        try:
+            user_id = (await get_user_by_token(token, db)).id
+        except ValueError:
+            if token:
+                cache_unknown_token(token)
+            raise
+        token_cache.set(token, user_id)
+    if user_id is None:
+        raise ValueError("Invalid API token")
+    return user_id
+
+async def resolve_meeting_id(user_id: int, platform: str, native_meeting_id: str, db: AsyncSession) -> Optional[int]:
+    """Cached lookup of the user's latest meeting for a platform and native meeting ID."""
+    key = (user_id, platform, native_meeting_id)
+    meeting_id = meeting_cache.get(key)
+    if meeting_id is MISSING:
+        result = await db.execute(
+            select(Meeting.id).where(
+                Meeting.user_id == user_id,
+                Meeting.platform == platform,
+                Meeting.platform_specific_id == native_meeting_id
+            ).order_by(Meeting.created_at.desc()).limit(1)
+        )
+        meeting_id = result.scalars().first()
+        if meeting_id is None:
+            # Not cached: the meeting may be created any moment now
+            return None
+        meeting_cache.set(key, meeting_id)
+    return meeting_id
+
+async def process_session_start_event(message_id: str, stream_data: Dict[str, Any], db: AsyncSession, meeting_id: int) -> bool:
     """Processes a session_start event.
     
     Updates the MeetingSession database record with the accurate start time.
-    Uses pre-fetched user and meeting objects.
+    Uses the already resolved internal meeting ID.
     
     Returns True if processing is considered complete (can be ACKed), 
     False if a potentially recoverable error occurred (should not be ACKed).
@@ -63,7 +101,7 @@ async def process_session_start_event(message_id: str, stream_data: Dict[str, An
         # 3. Update the meeting's session start time
         session_uid = stream_data['uid']
         stmt_session = select(MeetingSession).where(
-            MeetingSession.meeting_id == meeting.id,
+            MeetingSession.meeting_id == meeting_id,
             MeetingSession.session_uid == session_uid
         )
         result_session = await db.execute(stmt_session)
@@ -71,30 +109,33 @@ async def process_session_start_event(message_id: str, stream_data: Dict[str, An
         
         if meeting_session:
             meeting_session.session_start_time = start_timestamp
-            logger.info(f"Updated start time for existing session {session_uid}, meeting_id {meeting.id} to {start_timestamp}")
+            logger.info(f"Updated start time for existing session {session_uid}, meeting_id {meeting_id} to {start_timestamp}")
         else:
             meeting_session = MeetingSession(
-                meeting_id=meeting.id,
+                meeting_id=meeting_id,
                 session_uid=session_uid,
                 session_start_time=start_timestamp
             )
             db.add(meeting_session)
-            logger.info(f"Created new session {session_uid} for meeting_id {meeting.id} with start time {start_timestamp}")
+            logger.info(f"Created new session {session_uid} for meeting_id {meeting_id} with start time {start_timestamp}")
         
         await db.commit()
-        logger.info(f"Successfully processed session_start event for meeting {meeting.id}, session {session_uid}")
+        logger.info(f"Successfully processed session_start event for meeting {meeting_id}, session {session_uid}")
         return True
 
     except Exception as e:
-        logger.error(f"Error processing session_start_event for message {message_id}, meeting {meeting.id if meeting else 'Unknown'}: {e}", exc_info=True)
+        logger.error(f"Error processing session_start_event for message {message_id}, meeting {meeting_id}: {e}", exc_info=True)
         try:
             await db.rollback() # Rollback on error
         except Exception as rb_err:
             logger.error(f"Failed to rollback after error in process_session_start_event: {rb_err}", exc_info=True)
         return False # Unexpected error, DO NOT ACK
 
-async def process_stream_message(message_id: str, message_data: Dict[str, Any], redis_c: aioredis.Redis) -> bool:
+async def process_stream_message(message_id: str, message_data: Dict[str, Any], redis_c: aioredis.Redis,
+                                 batch: Optional[RedisWriteBatch] = None) -> bool:
     """Processes a single message payload from the Redis stream.
+    Redis writes are added to `batch` when given (the caller executes it before ACKing),
+    otherwise they are sent right away.
     Returns True if processing is considered complete (can be ACKed), 
     False if a potentially recoverable error occurred (should not be ACKed).
     """
@@ -108,10 +149,9 @@ async def process_stream_message(message_id: str, message_data: Dict[str, Any],
         stream_data = json.loads(payload_json)
         message_type = stream_data.get("type", "transcription")
         
-        user: Optional[User] = None
-        meeting: Optional[Meeting] = None
         internal_meeting_id: Optional[int] = None
 
+        # The session only checks out a DB connection on a cache miss or a session_start event
         async with async_session_local() as db:
             try:
                 # Common fields for both event types
@@ -123,24 +163,16 @@ async def process_stream_message(message_id: str, message_data: Dict[str, Any],
                     logger.warning(f"Message {message_id} (type: {message_type}) missing common required fields (token, platform, meeting_id). Skipping. Payload: {payload_json[:200]}...")
                     return True
 
-                user = await get_user_by_token(token, db)
-                
-                stmt_meeting = select(Meeting).where(
-                    Meeting.user_id == user.id,
-                    Meeting.platform == platform_val,
-                    Meeting.platform_specific_id == native_meeting_id
-                ).order_by(Meeting.created_at.desc())
-                result_meeting = await db.execute(stmt_meeting)
-                meeting = result_meeting.scalars().first()
+                user_id = await resolve_user_id(token, db)
+                internal_meeting_id = await resolve_meeting_id(user_id, platform_val, native_meeting_id, db)
 
-                if not meeting:
-                    logger.warning(f"Meeting lookup failed for message {message_id}: No meeting found for user {user.id}, platform '{platform_val}', native ID '{native_meeting_id}'")
+                if internal_meeting_id is None:
+                    logger.warning(f"Meeting lookup failed for message {message_id}: No meeting found for user {user_id}, platform '{platform_val}', native ID '{native_meeting_id}'")
                     return True
-                internal_meeting_id = meeting.id
 
                 # Process different message types
                 if message_type == "session_start":
-                    return await process_session_start_event(message_id, stream_data, db, user, meeting) 
+                    return await process_session_start_event(message_id, stream_data, db, internal_meeting_id)
                 elif message_type == "transcription":
                     pass # Continue with transcription processing
                 elif message_type == "session_end": # NEW: Handle session_end for cleanup
@@ -149,10 +181,16 @@ async def process_stream_message(message_id: str, message_data: Dict[str, Any],
                         logger.warning(f"Message {message_id} (type: session_end) missing 'uid'. Skipping cleanup.")
                         return True # Cannot process without UID, but ack
                     
-                    speaker_event_key = f"{REDIS_SPEAKER_EVENT_KEY_PREFIX}:{session_uid}"
+                    timeline_keys = speaker_timeline_keys(REDIS_SPEAKER_EVENT_KEY_PREFIX, session_uid)
+                    if batch is not None:
+                        for key in timeline_keys:
+                            batch.delete(key)
+                        batch.messages += 1
+                        logger.info(f"Processed session_end for UID '{session_uid}'. Speaker timeline keys {timeline_keys} queued for deletion.")
+                        return True
                     try:
-                        deleted_count = await redis_c.delete(speaker_event_key)
-                        logger.info(f"Processed session_end for UID '{session_uid}'. Deleted speaker events key '{speaker_event_key}' from Redis (count: {deleted_count}).")
+                        deleted_count = await redis_c.delete(*timeline_keys)
+                        logger.info(f"Processed session_end for UID '{session_uid}'. Deleted speaker timeline keys {timeline_keys} from Redis (count: {deleted_count}).")
                         # Note: MeetingSession.session_end_utc is not updated here due to no DB model changes allowed.
                     except redis.exceptions.RedisError as e_redis:
                         logger.error(f"Redis error deleting speaker events for UID '{session_uid}' on session_end: {e_redis}")
@@ -177,13 +215,16 @@ async def process_stream_message(message_id: str, message_data: Dict[str, Any],
                  return True
 
             segment_count = 0
-            hash_key = f"meeting:{internal_meeting_id}:segments"
-            segments_to_store = {}
+            # Segments, their content hashes for change detection, and the index of due times (epoch
+            # seconds) the DB writer uses to find immutable segments without a full HGETALL
+            hash_key, content_hashes_key, updates_key = segment_keys(internal_meeting_id)
+            store_args = [str(internal_meeting_id), REDIS_SEGMENT_TTL, FLUSH_WAKEUP_CHANNEL]
             session_uid_from_payload = stream_data.get('uid')
 
             if not session_uid_from_payload:
                 logger.warning(f"[Msg {message_id}/Meet {internal_meeting_id}] Message missing 'uid' for transcription segments. Cannot map speakers. Segments in this message will not have speaker info.")
             
+            valid_segments = [] # (start_time_key, start, end, text, language, final)
             for i, segment in enumerate(stream_data.get('segments', [])):
                  if not isinstance(segment, dict) or segment.get('start') is None or segment.get('end') is None:
                      logger.warning(f"[Msg {message_id}/Meet {internal_meeting_id}] Skipping segment {i} missing structure or 'start'/'end': {segment}")
@@ -196,60 +237,54 @@ async def process_stream_message(message_id: str, message_data: Dict[str, Any],
                  except (ValueError, TypeError) as time_err:
                      logger.warning(f"[Msg {message_id}/Meet {internal_meeting_id}] Skipping segment {i} invalid time format: {time_err} - Segment: {segment}")
                      continue
-                            
-                 start_time_key = f"{start_time_float:.3f}"
-                 
-                 mapping_status: str = STATUS_UNKNOWN
+                 # Producers mark segments their backend will not revise any more (WhisperLive 'completed', Gladia 'is_final')
+                 final = segment.get('completed') is True or segment.get('is_final') is True
+                 valid_segments.append((f"{start_time_float:.3f}", start_time_float, end_time_float, text_content, language_content, final))
 
-                 if session_uid_from_payload:
-                    # MODIFIED: Call the new utility function
-                    context_log = f"[LiveMap Msg:{message_id}/Meet:{internal_meeting_id}/Seg:{start_time_key}]"
-                    mapping_result = await get_speaker_mapping_for_segment(
-                        redis_c=redis_c,
-                        session_uid=session_uid_from_payload,
-                        segment_start_ms=start_time_float * 1000,
-                        segment_end_ms=end_time_float * 1000,
-                        config_speaker_event_key_prefix=REDIS_SPEAKER_EVENT_KEY_PREFIX,
-                        context_log_msg=context_log
-                    )
-                    mapped_speaker_name = mapping_result.get("speaker_name")
-                    mapping_status = mapping_result.get("status", STATUS_ERROR) # Default to STATUS_ERROR if not present
-                 else:
-                    # This case is now handled inside get_speaker_mapping_for_segment if session_uid is None,
-                    # but keeping explicit handling here is also fine for clarity if session_uid_from_payload is None from the start.
-                    logger.warning(f"[Msg {message_id}/Meet {internal_meeting_id}/Seg {start_time_key}] No session_uid_from_payload. Cannot map speakers.")
-                    mapping_status = STATUS_UNKNOWN
+            # One speaker-event fetch for all segments of the message
+            if session_uid_from_payload:
+                mapping_results = await get_speaker_mappings_for_segments(
+                    redis_c=redis_c,
+                    session_uid=session_uid_from_payload,
+                    segments_ms=[(start * 1000, end * 1000) for _, start, end, _, _, _ in valid_segments],
+                    config_speaker_event_key_prefix=REDIS_SPEAKER_EVENT_KEY_PREFIX,
+                    context_log_msg=f"[LiveMap Msg:{message_id}/Meet:{internal_meeting_id}]"
+                )
+            else:
+                mapping_results = [{"speaker_name": None, "status": STATUS_UNKNOWN} for _ in valid_segments]
 
+            updated_at_dt = datetime.now(timezone.utc)
+            updated_at = updated_at_dt.isoformat()
+            for (start_time_key, _, end_time_float, text_content, language_content, final), mapping_result in zip(valid_segments, mapping_results):
                  segment_redis_data = {
                      "text": text_content,
                      "end_time": end_time_float,
                      "language": language_content,
-                     "updated_at": datetime.now(timezone.utc).isoformat(), 
+                     "updated_at": updated_at, 
                      "session_uid": session_uid_from_payload,
-                     "speaker": mapped_speaker_name,
-                     "speaker_mapping_status": mapping_status
+                     "speaker": mapping_result.get("speaker_name"),
+                     "speaker_mapping_status": mapping_result.get("status", STATUS_ERROR), # Default to STATUS_ERROR if not present
+                     "speaker_events_version": mapping_result.get("speaker_events_version"),
+                     "final": final
                  }
-                 segments_to_store[start_time_key] = json.dumps(segment_redis_data)
+                 # Due for persistence now if final, else once it has not changed for IMMUTABILITY_THRESHOLD
+                 due_at = updated_at_dt.timestamp() + (0 if final else IMMUTABILITY_THRESHOLD)
+                 store_args += [start_time_key, segment_content_hash(segment_redis_data), json.dumps(segment_redis_data), due_at, int(final)]
                  segment_count += 1
             
             if segment_count > 0:
-                try:
-                    async with redis_c.pipeline(transaction=True) as pipe:
-                        pipe.sadd(f"active_meetings", str(internal_meeting_id))
-                        pipe.expire(hash_key, REDIS_SEGMENT_TTL)
-                        if segments_to_store:
-                            pipe.hset(hash_key, mapping=segments_to_store)
-                        results = await pipe.execute()
-                        if any(res is None for res in results): # Simplified critical failure check
-                            logger.error(f"Redis pipeline command failed critically for message {message_id}. Results: {results}")
-                            return False
-                        logger.info(f"Stored/Updated {segment_count} segments in Redis from message {message_id} for meeting {internal_meeting_id}. Results: {results}")
-                except redis.exceptions.RedisError as redis_err:
-                    logger.error(f"Redis pipeline error storing segments for message {message_id}: {redis_err}", exc_info=True)
-                    return False 
-                except Exception as pipe_err:
-                     logger.error(f"Unexpected pipeline error storing segments for message {message_id}: {pipe_err}", exc_info=True)
-                     return False
+                own_batch = batch is None
+                write_batch = RedisWriteBatch() if own_batch else batch
+                # Marks the meeting active only if a segment changed: re-sends of persisted segments leave it be
+                write_batch.eval(STORE_CHANGED_SEGMENTS_LUA, [hash_key, content_hashes_key, updates_key, FLUSH_SCHEDULE_KEY, "active_meetings"], store_args)
+                write_batch.messages += 1
+                if own_batch:
+                    try:
+                        await write_batch.execute(redis_c)
+                    except redis.exceptions.RedisError as redis_err:
+                        logger.error(f"Redis pipeline error storing segments for message {message_id}: {redis_err}", exc_info=True)
+                        return False
+                logger.info(f"{'Stored/Updated' if own_batch else 'Queued'} {segment_count} segments in Redis from message {message_id} for meeting {internal_meeting_id}.")
             else:
                 logger.info(f"No valid segments found in message {message_id} for meeting {internal_meeting_id} to store in Redis.")
             return True
@@ -261,9 +296,12 @@ async def process_stream_message(message_id: str, message_data: Dict[str, Any],
         logger.error(f"Unexpected error in process_stream_message for {message_id}: {e}", exc_info=True)
         return False 
 
-async def process_speaker_event_message(message_id: str, event_data: Dict[str, Any], redis_c: aioredis.Redis) -> bool:
+async def process_speaker_event_message(message_id: str, event_data: Dict[str, Any], redis_c: aioredis.Redis,
+                                        batch: Optional[RedisWriteBatch] = None) -> bool:
     """Processes a single speaker event message from the Redis stream.
-    Stores the event in a Redis Sorted Set keyed by session_uid.
+    Adds the event to the session's speaker timeline (mapping.speaker_timeline) through `batch`
+    when given; only the fields mapping needs are kept. Adding is idempotent, so redelivered
+    messages leave the timeline unchanged.
     Returns True if processing is considered complete (can be ACKed),
     False if a potentially recoverable error occurred (should not be ACKed).
     """
@@ -276,34 +314,30 @@ async def process_speaker_event_message(message_id: str, event_data: Dict[str, A
 
         session_uid = event_data["uid"]
         try:
-            # Ensure timestamp is a float for Redis score
             relative_timestamp_ms = float(event_data["relative_client_timestamp_ms"])
         except ValueError:
             logger.warning(f"[SpeakerProcessor] Invalid relative_client_timestamp_ms '{event_data['relative_client_timestamp_ms']}' for message {message_id}. Skipping.")
             return True # Bad data, OK to ACK
 
-        # The entire event_data (which is the payload) will be stored as the value
-        # Ensure it's JSON-serializable (it should be if it came from JSON stream)
-        event_payload_json = json.dumps(event_data)
-        
-        sorted_set_key = f"{REDIS_SPEAKER_EVENT_KEY_PREFIX}:{session_uid}"
-
-        async with redis_c.pipeline(transaction=True) as pipe:
-            pipe.zadd(sorted_set_key, {event_payload_json: relative_timestamp_ms})
-            pipe.expire(sorted_set_key, REDIS_SPEAKER_EVENT_TTL)
-            results = await pipe.execute()
+        member = speaker_event_member(
+            event_data["event_type"], relative_timestamp_ms, event_data.get("participant_id_meet"), event_data["participant_name"]
+        )
+        write_batch = RedisWriteBatch() if batch is None else batch
+        write_batch.eval(
+            ADD_SPEAKER_EVENT_LUA,
+            list(speaker_timeline_keys(REDIS_SPEAKER_EVENT_KEY_PREFIX, session_uid)),
+            [relative_timestamp_ms, member, REDIS_SPEAKER_EVENT_TTL]
+        )
+        write_batch.messages += 1
+        if batch is None:
+            await write_batch.execute(redis_c)
 
-        # Check pipeline results (optional, zadd returns num added, expire returns 1 or 0)
-        # For simplicity, we assume success if no exception
-        logger.debug(f"[SpeakerProcessor] Stored speaker event for UID '{session_uid}' at {relative_timestamp_ms}ms. Key: {sorted_set_key}. Message ID: {message_id}")
+        logger.debug(f"[SpeakerProcessor] Added {event_data['event_type']} for UID '{session_uid}' at {relative_timestamp_ms}ms to the speaker timeline. Message ID: {message_id}")
         return True
 
-    except json.JSONDecodeError as json_err: # Should not happen if data is already dict
-        logger.error(f"[SpeakerProcessor] Error serializing speaker event payload to JSON for message {message_id}: {json_err}. Data: {event_data}")
-        return True # Cannot process, but ack to avoid loop with bad data format.
     except redis.exceptions.RedisError as e_redis:
         logger.error(f"[SpeakerProcessor] Redis error processing speaker event message {message_id}: {e_redis}", exc_info=True)
         return False  # Potentially recoverable Redis error, DO NOT ACK
     except Exception as e:
         logger.error(f"[SpeakerProcessor] Unexpected error in process_speaker_event_message for {message_id}: {e}", exc_info=True)
-        return False # Unexpected error, DO NOT ACK 
\ No newline at end of file
+        return False # Unexpected error, DO NOT ACK
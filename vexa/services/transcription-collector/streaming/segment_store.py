@@ -0,0 +1,73 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Set, Tuple
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+# A meeting's live segments are kept under three keys until the DB writer persists them:
+#   meeting:{id}:segments        hash of segment key (start time) -> segment JSON
+#   meeting:{id}:segment_hashes  hash of segment key -> content hash of the last value written
+#   meeting:{id}:segment_updates sorted set of segment key -> time it is due for persistence
+# Producers re-send a segment many times while refining it, and keep re-sending it after it has
+# been persisted. Segments are only written when their content hash differs from the stored one,
+# so identical re-sends neither rewrite the segment nor push back its due time. Content hashes
+# therefore outlive the segments they describe: persisting a segment leaves its hash in place, and
+# the meeting's TTL (or deleting the meeting) removes them.
+
+# KEYS: segments hash, content hashes hash, update index, flush schedule, active meetings set
+# ARGV: meeting id, ttl seconds, wakeup channel, then per segment: key, content hash, JSON, due time, final (1/0)
+# Returns the number of segments written.
+STORE_CHANGED_SEGMENTS_LUA = """
+local written, earliest_due, final_written = 0, nil, false
+for i = 4, #ARGV, 5 do
+    if redis.call('HGET', KEYS[2], ARGV[i]) ~= ARGV[i + 1] then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+        redis.call('ZADD', KEYS[3], ARGV[i + 3], ARGV[i])
+        local due = tonumber(ARGV[i + 3])
+        if (not earliest_due) or due < earliest_due then
+            earliest_due = due
+        end
+        final_written = final_written or ARGV[i + 4] == '1'
+        written = written + 1
+    end
+end
+if written > 0 then
+    redis.call('SADD', KEYS[5], ARGV[1])
+    -- Earliest due time per meeting, which the flush loop sleeps until
+    redis.call('ZADD', KEYS[4], 'LT', earliest_due, ARGV[1])
+    if final_written then
+        redis.call('PUBLISH', ARGV[3], ARGV[1])
+    end
+end
+for i = 1, 3 do
+    redis.call('EXPIRE', KEYS[i], ARGV[2])
+end
+return written
+"""
+
+# Segment fields compared by STORE_CHANGED_SEGMENTS_LUA; bookkeeping such as updated_at is left out
+CONTENT_HASH_FIELDS = ("text", "end_time", "language", "session_uid", "speaker", "final")
+
+def segment_content_hash(segment_redis_data: Dict[str, Any]) -> str:
+    content = json.dumps([segment_redis_data.get(field) for field in CONTENT_HASH_FIELDS])
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+
+def segment_keys(meeting_id) -> Tuple[str, str, str]:
+    """Returns (segments_key, content_hashes_key, updates_key) for a meeting."""
+    return f"meeting:{meeting_id}:segments", f"meeting:{meeting_id}:segment_hashes", f"meeting:{meeting_id}:segment_updates"
+
+async def delete_segments(redis_c: aioredis.Redis, segments_by_meeting: Dict[int, Set[str]]):
+    """Removes segments from their meeting's hash and update index. Their content hashes stay,
+    so a producer re-sending a persisted segment unchanged does not store it again."""
+    for meeting_id, start_times in segments_by_meeting.items():
+        if start_times:
+            segments_key, _, updates_key = segment_keys(meeting_id)
+            async with redis_c.pipeline(transaction=True) as pipe:
+                pipe.hdel(segments_key, *start_times)
+                pipe.zrem(updates_key, *start_times)
+                await pipe.execute()
+            logger.debug(f"Deleted {len(start_times)} processed segments for meeting {meeting_id} from Redis Hash")
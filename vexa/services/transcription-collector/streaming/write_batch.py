@@ -0,0 +1,72 @@
+import logging
+from typing import Dict, List, Set, Tuple
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+class RedisWriteBatch:
+    """Collects the Redis writes of every message in one XREADGROUP batch so they go out
+    in a single pipeline round-trip before the batch is ACKed.
+
+    Writes are merged per key: SADD members and HSET/ZADD mappings are unioned (a later
+    message overwrites an earlier one's field), EXPIRE is sent once per key. Scripts run
+    in the order they were queued, after the plain writes.
+    """
+
+    def __init__(self):
+        self._deletes: Set[str] = set()
+        self._sadds: Dict[str, Set[str]] = {}
+        self._hsets: Dict[str, Dict[str, str]] = {}
+        self._zadds: Dict[str, Dict[str, float]] = {}
+        self._expires: Dict[str, int] = {}
+        self._scripts: List[Tuple[str, list, list]] = []
+        self.messages = 0
+
+    def sadd(self, key: str, *members: str):
+        self._sadds.setdefault(key, set()).update(members)
+
+    def hset(self, key: str, mapping: Dict[str, str]):
+        self._hsets.setdefault(key, {}).update(mapping)
+
+    def zadd(self, key: str, mapping: Dict[str, float]):
+        self._zadds.setdefault(key, {}).update(mapping)
+
+    def expire(self, key: str, ttl: int):
+        self._expires[key] = ttl
+
+    def eval(self, script: str, keys: list, args: list):
+        self._scripts.append((script, keys, args))
+
+    def delete(self, key: str):
+        """Deletes run last in the batch (only used for keys the same batch does not write)."""
+        self._deletes.add(key)
+
+    def __len__(self) -> int:
+        return (len(self._deletes) + len(self._sadds) + len(self._hsets) + len(self._zadds)
+                + len(self._expires) + len(self._scripts))
+
+    async def execute(self, redis_c: aioredis.Redis):
+        """Sends all writes in one MULTI/EXEC pipeline. Raises redis.exceptions.RedisError on failure."""
+        if not len(self):
+            return
+        async with redis_c.pipeline(transaction=True) as pipe:
+            for key, members in self._sadds.items():
+                pipe.sadd(key, *members)
+            for key, mapping in self._hsets.items():
+                pipe.hset(key, mapping=mapping)
+            for key, mapping in self._zadds.items():
+                pipe.zadd(key, mapping)
+            registered = {}
+            for script, keys, args in self._scripts:
+                if script not in registered:
+                    registered[script] = redis_c.register_script(script)
+                # Queued as EVALSHA; the pipeline loads the script first if Redis does not have it
+                await registered[script](keys=keys, args=args, client=pipe)
+            # After the writes, so keys created by this batch get their TTL
+            for key, ttl in self._expires.items():
+                pipe.expire(key, ttl)
+            for key in self._deletes:
+                pipe.delete(key)
+            await pipe.execute()
+        logger.debug(f"Flushed write batch of {self.messages} message(s) as {len(self)} Redis command(s)")
@@ -0,0 +1,107 @@
+"""Live segment storage (streaming.segment_store) against Redis semantics.
+
+Segments are written with the real STORE_CHANGED_SEGMENTS_LUA through RedisWriteBatch, as
+process_stream_message does, and removed with delete_segments, as the DB writer does once
+they are persisted.
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from streaming.segment_store import STORE_CHANGED_SEGMENTS_LUA, delete_segments, segment_content_hash, segment_keys
+from streaming.write_batch import RedisWriteBatch
+
+MEETING_ID = 7
+SCHEDULE = "flush_schedule"
+ACTIVE = "active_meetings"
+CHANNEL = "flush_wakeup"
+
+
+async def _send(redis_c, text: str, final: bool = True, start: str = "1.000"):
+    """Stores one segment the way the stream consumer does, with a fresh updated_at."""
+    now = time.time()
+    segment = {"text": text, "end_time": 2.5, "language": "en", "updated_at": now, "session_uid": "s",
+               "speaker": "alice", "speaker_mapping_status": "MAPPED", "final": final}
+    batch = RedisWriteBatch()
+    batch.eval(STORE_CHANGED_SEGMENTS_LUA, [*segment_keys(MEETING_ID), SCHEDULE, ACTIVE], [
+        str(MEETING_ID), 3600, CHANNEL,
+        start, segment_content_hash(segment), json.dumps(segment), now + (0 if final else 30), int(final),
+    ])
+    await batch.execute(redis_c)
+
+
+async def _flush(redis_c, start: str = "1.000"):
+    """What the DB writer does to Redis once the segment is committed and the meeting is empty."""
+    await delete_segments(redis_c, {MEETING_ID: {start}})
+    await redis_c.zrem(SCHEDULE, str(MEETING_ID))
+    await redis_c.srem(ACTIVE, str(MEETING_ID))
+
+
+async def _state(redis_c):
+    segments_key, _, updates_key = segment_keys(MEETING_ID)
+    return {
+        "segments": await redis_c.hlen(segments_key),
+        "updates": await redis_c.zcard(updates_key),
+        "scheduled": await redis_c.zscore(SCHEDULE, str(MEETING_ID)),
+        "active": await redis_c.sismember(ACTIVE, str(MEETING_ID)),
+    }
+
+
+async def _wakeups(pubsub) -> int:
+    """Wakeups published since the last call."""
+    count = 0
+    while (message := await pubsub.get_message(timeout=0.05)) is not None:
+        count += message["type"] == "message"
+    return count
+
+
+def test_unchanged_resend_after_flush_is_not_stored_again():
+    async def run():
+        redis_c = fakeredis.FakeAsyncRedis(decode_responses=True)
+        pubsub = redis_c.pubsub()
+        await pubsub.subscribe(CHANNEL)
+        await _send(redis_c, "hello")
+        stored = await _state(redis_c), await _wakeups(pubsub)
+        await _flush(redis_c)
+        await _send(redis_c, "hello")
+        return stored, await _state(redis_c), await _wakeups(pubsub)
+
+    stored, after_resend, wakeups = asyncio.run(run())
+    assert stored[0]["segments"] == 1 and stored[0]["scheduled"] is not None and stored[1] == 1
+    assert after_resend == {"segments": 0, "updates": 0, "scheduled": None, "active": False}
+    assert wakeups == 0
+
+
+def test_changed_resend_after_flush_is_stored():
+    async def run():
+        redis_c = fakeredis.FakeAsyncRedis(decode_responses=True)
+        pubsub = redis_c.pubsub()
+        await pubsub.subscribe(CHANNEL)
+        await _send(redis_c, "hello")
+        await _flush(redis_c)
+        await _wakeups(pubsub)
+        await _send(redis_c, "hello there")
+        return await _state(redis_c), await _wakeups(pubsub)
+
+    state, wakeups = asyncio.run(run())
+    assert state["segments"] == 1 and state["updates"] == 1 and state["active"]
+    assert state["scheduled"] is not None
+    assert wakeups == 1
+
+
+def test_unchanged_resend_keeps_due_time():
+    async def run():
+        redis_c = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await _send(redis_c, "hello", final=False)
+        due = await redis_c.zscore(segment_keys(MEETING_ID)[2], "1.000")
+        await asyncio.sleep(0.01)
+        await _send(redis_c, "hello", final=False)
+        return due, await redis_c.zscore(segment_keys(MEETING_ID)[2], "1.000")
+
+    first, second = asyncio.run(run())
+    assert first == second
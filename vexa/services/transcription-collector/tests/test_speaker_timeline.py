@@ -0,0 +1,167 @@
+"""Speaker timeline storage (mapping.speaker_timeline) against Redis semantics.
+
+Events are written with the real ADD_SPEAKER_EVENT_LUA through RedisWriteBatch, as
+process_speaker_event_message does, into fakeredis (which runs Lua through lupa).
+"""
+import asyncio
+import json
+import random
+from typing import List, Optional, Tuple
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from mapping.speaker_mapper import (
+    STATUS_MAPPED,
+    STATUS_MULTIPLE,
+    STATUS_NO_SPEAKER_EVENTS,
+    get_speaker_mappings_for_segments,
+)
+from mapping.speaker_timeline import (
+    ADD_SPEAKER_EVENT_LUA,
+    decode_speaker_event,
+    fetch_speaker_timeline_versions,
+    speaker_event_member,
+    speaker_timeline_keys,
+)
+from streaming.write_batch import RedisWriteBatch
+
+PREFIX = "speaker_events"
+TTL = 3600
+
+Event = Tuple[str, float, str, Optional[str]] # (event_type, timestamp_ms, participant_name, participant_id_meet)
+
+
+async def _add(redis_c, events: List[Event], uid: str = "session", batch_size: int = 3):
+    """Writes events in arrival order, a few per batch like the stream consumer."""
+    for i in range(0, len(events), batch_size):
+        batch = RedisWriteBatch()
+        for event_type, ts, name, meet_id in events[i:i + batch_size]:
+            batch.eval(ADD_SPEAKER_EVENT_LUA, list(speaker_timeline_keys(PREFIX, uid)),
+                       [ts, speaker_event_member(event_type, ts, meet_id, name), TTL])
+        await batch.execute(redis_c)
+
+
+async def _stored(redis_c, uid: str = "session"):
+    events_key, version_key = speaker_timeline_keys(PREFIX, uid)
+    return await redis_c.zrange(events_key, 0, -1, withscores=True), await redis_c.get(version_key)
+
+
+def _run(events: List[Event], segments: List[Tuple[float, float]]):
+    """Stores events in the given arrival order, then maps the segments."""
+    async def run():
+        redis_c = fakeredis.FakeAsyncRedis()
+        await _add(redis_c, events)
+        return await get_speaker_mappings_for_segments(redis_c, "session", segments, PREFIX)
+    return asyncio.run(run())
+
+
+def _turns(rng: random.Random, n_turns: int) -> List[Event]:
+    """Chronological START/END turns of a few participants, overlapping and with shared timestamps."""
+    people = [("alice", "m1"), ("bob", "m2"), ("carol", None)]
+    events = []
+    ts = 0
+    for _ in range(n_turns):
+        ts += rng.choice([0, 100, 400, 1500])
+        name, meet_id = rng.choice(people)
+        events.append(("SPEAKER_START", ts, name, meet_id))
+        end_meet_id = meet_id or rng.choice([None, "m3"]) # an END may carry the id its START lacked
+        events.append(("SPEAKER_END", ts + rng.choice([0, 200, 900, 3000]), name, end_meet_id))
+    events.sort(key=lambda event: event[1])
+    return events
+
+
+def test_replayed_events_leave_timeline_unchanged():
+    events = [("SPEAKER_START", 100, "alice", "m1"), ("SPEAKER_END", 900, "alice", "m1"), ("OTHER", 950, "bob", "m2")]
+
+    async def run():
+        redis_c = fakeredis.FakeAsyncRedis()
+        await _add(redis_c, events)
+        before = await _stored(redis_c)
+        await _add(redis_c, events[::-1])
+        await _add(redis_c, events[1:2])
+        return before, await _stored(redis_c)
+
+    before, after = asyncio.run(run())
+    assert before == after
+    assert int(after[1]) == 3
+
+
+def test_successive_turns_are_distinct_events():
+    events = [("SPEAKER_START", 100, "alice", "m1"), ("SPEAKER_END", 300, "alice", "m1"),
+              ("SPEAKER_START", 700, "alice", "m1"), ("SPEAKER_END", 900, "alice", "m1")]
+
+    async def run():
+        redis_c = fakeredis.FakeAsyncRedis()
+        await _add(redis_c, events)
+        return await _stored(redis_c)
+
+    members, version = asyncio.run(run())
+    assert [score for _, score in members] == [100, 300, 700, 900]
+    assert int(version) == 4
+
+
+# In (500, 1500) bob overlaps 900ms; alice overlaps 400ms if her END is applied, 1000ms if she is left open
+ALICE_START = ("SPEAKER_START", 100, "alice", "m1")
+ALICE_END = ("SPEAKER_END", 900, "alice", "m1")
+BOB_START = ("SPEAKER_START", 600, "bob", "m2")
+BOB_SPEAKING = {"speaker_name": "bob", "participant_id_meet": "m2", "status": STATUS_MULTIPLE, "speaker_events_version": 3}
+
+
+def test_end_arriving_before_start():
+    assert _run([ALICE_END, BOB_START, ALICE_START], [(500, 1500)]) == [BOB_SPEAKING]
+
+
+def test_redelivered_start_after_end_does_not_reopen_speaker():
+    assert _run([ALICE_START, ALICE_END, BOB_START, ALICE_START], [(500, 1500)]) == [BOB_SPEAKING]
+
+
+def test_end_matches_start_by_name():
+    # Carol's START carried no participant_id_meet, her END carries one: it still ends her turn
+    events = [("SPEAKER_START", 100, "carol", None), ("SPEAKER_END", 900, "carol", "m3"), BOB_START]
+    for arrival in (events, events[::-1]):
+        assert _run(arrival, [(200, 500), (500, 1500)]) == [
+            {"speaker_name": "carol", "participant_id_meet": None, "status": STATUS_MAPPED, "speaker_events_version": 3},
+            BOB_SPEAKING,
+        ]
+
+
+def test_no_events_near_segment():
+    results = _run([("SPEAKER_START", 100, "alice", "m1")], [(5000, 6000)])
+    assert results == [{"speaker_name": None, "participant_id_meet": None, "status": STATUS_NO_SPEAKER_EVENTS,
+                        "speaker_events_version": 1}]
+
+
+def test_legacy_payload_members_decode():
+    payload = json.dumps({"event_type": "SPEAKER_START", "participant_name": "alice", "participant_id_meet": "m1",
+                          "uid": "session", "relative_client_timestamp_ms": 100})
+    legacy, compact = decode_speaker_event(payload, 100.0), decode_speaker_event(speaker_event_member("SPEAKER_START", 100.0, "m1", "alice"), 100.0)
+    for key in ("event_type", "participant_name", "participant_id_meet", "relative_client_timestamp_ms"):
+        assert legacy[key] == compact[key]
+    assert decode_speaker_event('["SPEAKER_START", 100.0]', 100.0) is None
+
+
+def test_timeline_versions():
+    async def run():
+        redis_c = fakeredis.FakeAsyncRedis()
+        await _add(redis_c, [("SPEAKER_START", 100, "alice", "m1"), ("SPEAKER_END", 900, "alice", "m1")], uid="a")
+        await _add(redis_c, [("SPEAKER_START", 100, "bob", "m2")], uid="b")
+        return await fetch_speaker_timeline_versions(redis_c, PREFIX, ["a", "b", "missing"])
+    assert asyncio.run(run()) == {"a": 2, "b": 1, "missing": 0}
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_mapping_does_not_depend_on_arrival_order(seed):
+    rng = random.Random(seed)
+    events = _turns(rng, rng.choice([2, 10, 40]))
+    horizon = events[-1][1] + 2000
+    segments = []
+    for _ in range(15):
+        start = rng.choice([rng.uniform(-500, horizon), rng.choice(events)[1]])
+        segments.append((start, start + rng.choice([50, 500, 2000, 6000])))
+
+    arrival = events + rng.sample(events, len(events) // 3) # reclaimed messages are redelivered
+    rng.shuffle(arrival)
+    assert _run(arrival, segments) == _run(events, segments)